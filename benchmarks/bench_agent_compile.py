@@ -0,0 +1,41 @@
+"""Micro-benchmark: per-request cost of building the LangGraph agent.
+
+Compares ``chatbot.create_agent()`` (what every request used to do) with
+``chatbot.get_agent()`` (the shared, compiled-once instance).
+
+    python benchmarks/bench_agent_compile.py [iterations]
+"""
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "django_chatbot.settings")
+
+import django
+
+django.setup()
+
+from chatbot.langgraph import chatbot
+
+
+def bench(label, fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    p50 = samples[len(samples) // 2] * 1000
+    p99 = samples[int(len(samples) * 0.99) - 1] * 1000
+    print(f"{label:<28} p50={p50:8.3f} ms  p99={p99:8.3f} ms")
+    return p50
+
+
+if __name__ == "__main__":
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    rebuild = bench("create_agent() per request", chatbot.create_agent, iterations)
+    chatbot.get_agent()
+    shared = bench("get_agent() shared", chatbot.get_agent, iterations)
+    print(f"Per-request overhead removed: {rebuild - shared:.3f} ms")
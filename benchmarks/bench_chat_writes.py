@@ -0,0 +1,99 @@
+"""Benchmark: Chat persistence under concurrent chat load.
+
+Each simulated user thread runs turns that read the recent history (as the
+memory layer does) and then save the turn. Three setups are compared, each
+in a fresh SQLite database in its own process:
+
+    rollback journal, one save() per turn
+    WAL,              one save() per turn
+    WAL,              write-behind queue with bulk_create
+
+    python benchmarks/bench_chat_writes.py [threads] [turns_per_thread]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+MODES = [
+    ("journal, save()", {"CHATBOT_SQLITE_WAL": "false", "CHATBOT_CHAT_WRITE_BEHIND": "false"}),
+    ("WAL, save()", {"CHATBOT_SQLITE_WAL": "true", "CHATBOT_CHAT_WRITE_BEHIND": "false"}),
+    ("WAL, write-behind", {"CHATBOT_SQLITE_WAL": "true", "CHATBOT_CHAT_WRITE_BEHIND": "true"}),
+]
+
+
+def run_child(label, threads, turns):
+    sys.path.insert(0, str(ROOT))
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "django_chatbot.settings")
+    os.environ["CHATBOT_MEMORY"] = "false"  # no summarizer LLM calls
+
+    import django
+    django.setup()
+
+    from django.conf import settings
+    from django.core.management import call_command
+    from django.db import OperationalError, connections
+
+    directory = tempfile.mkdtemp()
+    settings.DATABASES["default"]["NAME"] = os.path.join(directory, "bench.sqlite3")
+    connections.close_all()
+    call_command("migrate", verbosity=0)
+
+    from django.contrib.auth.models import User
+    from chatbot.chat_writer import chat_writer, save_chat
+    from chatbot.models import Chat
+
+    users = [User.objects.create(username=f"bench{i}") for i in range(threads)]
+    connections.close_all()
+
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def simulate(user):
+        for turn in range(turns):
+            start = time.perf_counter()
+            try:
+                list(Chat.objects.filter(user=user).order_by("-id")[:6])
+                save_chat(Chat(user=user, message=f"question {turn}", response="answer " * 100))
+            except OperationalError as e:
+                with lock:
+                    errors.append(str(e))
+            with lock:
+                latencies.append(time.perf_counter() - start)
+        connections.close_all()
+
+    workers = [threading.Thread(target=simulate, args=(user,)) for user in users]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    chat_writer.flush()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+    saved = Chat.objects.count()
+    print(f"{label:<20} {saved / elapsed:8.0f} turns/s  p50={p50:7.2f} ms  p99={p99:8.2f} ms  "
+          f"saved={saved}/{threads * turns}  lock errors={len(errors)}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        run_child(sys.argv[2], int(sys.argv[3]), int(sys.argv[4]))
+        sys.exit(0)
+
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    turns = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+    print(f"{threads} concurrent users x {turns} turns")
+    for label, env in MODES:
+        subprocess.run(
+            [sys.executable, __file__, "--child", label, str(threads), str(turns)],
+            env={**os.environ, **env},
+            check=True,
+        )
@@ -0,0 +1,82 @@
+"""Benchmark: a burst of chat completions against a rate-limited fake Groq server.
+
+Starts benchmarks/fake_groq_server.py in-process and fires ``burst`` concurrent
+calls, half of them with a prompt another caller is also sending. It compares
+ChatGroq called directly (as before the gateway) with calls through
+LLMGateway, and reports answers, errors, 429s and latency.
+
+    python benchmarks/bench_llm_burst.py [burst] [server_rpm] [gateway_rpm]
+"""
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fake_groq_server import serve
+
+PORT = 8765
+
+
+def run(label, call, burst):
+    results, lock = [], threading.Lock()
+
+    def worker(i):
+        # Callers come in pairs sending the same prompt, as a burst of the same question would
+        prompt = f"question {i // 2}"
+        start = time.perf_counter()
+        try:
+            call([{"role": "user", "content": prompt}])
+            outcome = "ok"
+        except Exception as e:
+            outcome = type(e).__name__
+        with lock:
+            results.append((outcome, time.perf_counter() - start))
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(burst)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    ok = sorted(seconds for outcome, seconds in results if outcome == "ok")
+    errors = {}
+    for outcome, _ in results:
+        if outcome != "ok":
+            errors[outcome] = errors.get(outcome, 0) + 1
+    p50 = ok[len(ok) // 2] if ok else 0.0
+    p99 = ok[int(len(ok) * 0.99) - 1] if ok else 0.0
+    print(f"{label:<10} answered={len(ok)}/{burst}  errors={errors or 0}  "
+          f"p50={p50:6.2f} s  p99={p99:6.2f} s  wall={elapsed:6.2f} s")
+
+
+if __name__ == "__main__":
+    burst = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    server_rpm = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    gateway_rpm = float(sys.argv[3]) if len(sys.argv) > 3 else server_rpm
+    from langchain_groq import ChatGroq
+    from chatbot.llm_gateway import LLMGateway
+
+    def client(port):
+        # A fresh client per server, so no kept-alive connection reaches the previous one
+        return ChatGroq(groq_api_key="fake", model_name="openai/gpt-oss-120b", max_retries=0,
+                        base_url=f"http://127.0.0.1:{port}")
+
+    print(f"{burst} concurrent calls, fake Groq allows {server_rpm} requests/min")
+
+    server, fake = serve(PORT, server_rpm)
+    llm = client(PORT)
+    run("direct", lambda messages: llm.invoke(messages), burst)
+    print(f"           server: {fake.counts}")
+    server.shutdown()
+
+    server, fake = serve(PORT + 1, server_rpm)
+    gateway_llm = client(PORT + 1)
+    gateway = LLMGateway(lambda: gateway_llm, requests_per_minute=gateway_rpm, tokens_per_minute=0, max_wait=120)
+    run("gateway", gateway.invoke, burst)
+    print(f"           server: {fake.counts}")
+    print(f"           gateway: {gateway.stats()}")
+    server.shutdown()
@@ -0,0 +1,129 @@
+"""Recall@k of the compact NumPy vector formats against exact float32 search.
+
+Loads every chunk vector found under ``chroma_db/`` and ``numpy_db/`` (or the
+store directories given) and drops duplicates. A sample of the chunks then
+serves as queries, with each chunk's own row left out of its results. Chroma
+stores are copied to a temporary directory first, so the originals are never
+modified.
+
+    python benchmarks/bench_quantized_recall.py [store_dir ...]
+"""
+import glob
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from langchain_core.documents import Document
+
+from chatbot.numpy_store import NumpyVectorStore
+
+KS = (3, 10)
+MAX_QUERIES = 500
+CONFIGS = [
+    ("float16", 1),
+    ("float16", 4),
+    ("int8", 1),
+    ("int8", 2),
+    ("int8", 4),
+]
+
+
+def load_numpy_vectors(directory):
+    with sqlite3.connect(os.path.join(directory, "chunks.sqlite3")) as conn:
+        count = conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+        dim = conn.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+    if not count or dim is None:
+        return np.empty((0, 0), dtype=np.float32)
+    matrix = np.memmap(os.path.join(directory, "vectors.float32"), dtype=np.float32, mode="r")
+    return np.array(matrix[:count * dim[0]]).reshape(count, dim[0])
+
+
+def load_chroma_vectors(directory):
+    import chromadb
+    with tempfile.TemporaryDirectory() as copy:
+        shutil.copytree(directory, copy, dirs_exist_ok=True)
+        client = chromadb.PersistentClient(path=copy)
+        matrices = []
+        for collection in client.list_collections():
+            name = collection if isinstance(collection, str) else collection.name
+            embeddings = client.get_collection(name).get(include=["embeddings"])["embeddings"]
+            if len(embeddings):
+                matrices.append(np.asarray(embeddings, dtype=np.float32))
+    return np.concatenate(matrices) if matrices else np.empty((0, 0), dtype=np.float32)
+
+
+def load_corpus(directories):
+    matrices = []
+    for directory in directories:
+        if os.path.exists(os.path.join(directory, "chunks.sqlite3")):
+            matrix = load_numpy_vectors(directory)
+        elif os.path.exists(os.path.join(directory, "chroma.sqlite3")):
+            matrix = load_chroma_vectors(directory)
+        else:
+            continue
+        print(f"ℹ️ {directory}: {len(matrix)} vectors")
+        if len(matrix):
+            matrices.append(matrix)
+    if not matrices:
+        sys.exit("✗ No vectors found")
+    return np.concatenate(matrices)
+
+
+def bytes_per_vector(dtype, dim):
+    if dtype == "int8":
+        return dim + 4  # codes plus a float32 scale
+    return dim * np.dtype(dtype).itemsize
+
+
+if __name__ == "__main__":
+    directories = sys.argv[1:] or sorted(glob.glob("chroma_db/*") + glob.glob("numpy_db/*"))
+    vectors = load_corpus(directories)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    # Re-uploaded files yield identical vectors, and ties make recall meaningless
+    unique = np.unique(vectors, axis=0)
+    if len(unique) < len(vectors):
+        print(f"ℹ️ Dropped {len(vectors) - len(unique)} duplicate vectors")
+        vectors = unique
+    n, dim = vectors.shape
+    rng = np.random.default_rng(0)
+    query_rows = rng.choice(n, size=min(n, MAX_QUERIES), replace=False)
+    max_k = max(KS)
+
+    # Exact float32 neighbours, leaving the query's own row out
+    truth = {}
+    for row in query_rows:
+        scores = vectors @ vectors[row]
+        scores[row] = -np.inf
+        truth[row] = np.argsort(-scores)[:max_k]
+
+    ids = [str(i) for i in range(n)]
+    documents = [Document(page_content=i) for i in ids]
+    print(f"{n} vectors, {dim} dims, {len(query_rows)} queries")
+    print(f"{'format':<18} {'bytes/vec':>9}  " + "  ".join(f"recall@{k:<3}" for k in KS) + "   p50")
+    print(f"{'float32':<18} {bytes_per_vector('float32', dim):>9}  " + "  ".join(f"{1.0:<10.4f}" for _ in KS))
+    with tempfile.TemporaryDirectory() as directory:
+        for dtype, rerank_factor in CONFIGS:
+            store = NumpyVectorStore(f"{directory}/{dtype}-{rerank_factor}", None, dtype=dtype, rerank_factor=rerank_factor)
+            store.add_embeddings(ids, vectors, documents)
+            hits = {k: 0 for k in KS}
+            samples = []
+            for row in query_rows:
+                start = time.perf_counter()
+                results = store.similarity_search_by_vector_with_relevance_scores(vectors[row], max_k + 1)
+                samples.append(time.perf_counter() - start)
+                found = [int(doc.page_content) for doc, _ in results if int(doc.page_content) != row]
+                for k in KS:
+                    hits[k] += len(set(found[:k]) & set(truth[row][:k].tolist()))
+            store.close()
+            samples.sort()
+            label = f"{dtype} rerank x{rerank_factor}" if rerank_factor > 1 else f"{dtype} no rerank"
+            recalls = "  ".join(f"{hits[k] / (k * len(query_rows)):<10.4f}" for k in KS)
+            print(f"{label:<18} {bytes_per_vector(dtype, dim):>9}  {recalls}   {samples[len(samples) // 2] * 1000:.3f} ms")
@@ -0,0 +1,81 @@
+"""Benchmark: FastTextSplitter vs LangChain's RecursiveCharacterTextSplitter.
+
+Loads the pages of every supported file in a folder (./data by default) once,
+then checks both splitters return identical chunks and metadata page by page,
+in characters (the ingestion default, 1000/200) and in tokens (256/50).
+Before that it runs the same check on random texts built from separator-heavy
+fragments. Throughput is the UTF-8 size of the page text divided by the best
+of ``repeats`` split runs. Loading and parsing the files is not timed.
+
+    python benchmarks/bench_splitter.py [data_folder] [repeats]
+"""
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from chatbot.ingestion import CHUNK_OVERLAP, CHUNK_SIZE, SUPPORTED_EXTENSIONS, get_loader, make_splitter
+
+FRAGMENTS = ["word", "another", "x" * 37, " ", "  ", "\n", "\n\n", "\n\n\n", " \n", "\t", "é", "长文本"]
+CONFIGS = [
+    ("chars", CHUNK_SIZE, CHUNK_OVERLAP, None),
+    ("tokens", 256, 50, "o200k_base"),
+]
+
+
+def load_pages(folder):
+    pages = []
+    for filename in sorted(os.listdir(folder)):
+        if filename.lower().endswith(SUPPORTED_EXTENSIONS):
+            pages.extend(get_loader(os.path.join(folder, filename)).lazy_load())
+    return pages
+
+
+def check_random_texts(cases=2000, seed=0):
+    """Compare split_text on random texts and sizes; returns the number of cases checked"""
+    rng = random.Random(seed)
+    for case in range(cases):
+        text = "".join(rng.choice(FRAGMENTS) for _ in range(rng.randint(0, 400)))
+        chunk_size = rng.randint(1, 120)
+        chunk_overlap = rng.randint(0, chunk_size)
+        expected = make_splitter(chunk_size, chunk_overlap, "recursive").split_text(text)
+        actual = make_splitter(chunk_size, chunk_overlap, "fast").split_text(text)
+        if actual != expected:
+            raise SystemExit(f"✗ Random case {case} differs (chunk_size={chunk_size}, "
+                             f"chunk_overlap={chunk_overlap}): {text!r}")
+    return cases
+
+
+def best_times(splitters, pages, repeats):
+    """Best time and last output of each splitter; runs alternate so both see the same machine load"""
+    best, chunks = [float("inf")] * len(splitters), [None] * len(splitters)
+    for _ in range(repeats):
+        for i, splitter in enumerate(splitters):
+            start = time.perf_counter()
+            chunks[i] = splitter.split_documents(pages)
+            best[i] = min(best[i], time.perf_counter() - start)
+    return best, chunks
+
+
+if __name__ == "__main__":
+    folder = sys.argv[1] if len(sys.argv) > 1 else "data"
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    print(f"✓ {check_random_texts()} random texts split identically")
+
+    pages = load_pages(folder)
+    megabytes = sum(len(page.page_content.encode("utf-8")) for page in pages) / 1e6
+    print(f"{len(pages)} pages, {megabytes:.3f} MB of text from {folder}")
+
+    for unit, chunk_size, chunk_overlap, encoding in CONFIGS:
+        print(f"--- {unit}: chunk_size={chunk_size} chunk_overlap={chunk_overlap} ---")
+        splitters = [make_splitter(chunk_size, chunk_overlap, name, encoding) for name in ("recursive", "fast")]
+        (recursive_time, fast_time), (expected, actual) = best_times(splitters, pages, repeats)
+        same = [(d.page_content, d.metadata) for d in actual] == [(d.page_content, d.metadata) for d in expected]
+        print(f"{'recursive':<10} {megabytes / recursive_time:8.2f} MB/s  {len(expected)} chunks")
+        print(f"{'fast':<10} {megabytes / fast_time:8.2f} MB/s  {len(actual)} chunks")
+        print(f"{'✓' if same else '✗'} Chunks and metadata {'identical' if same else 'DIFFER'}; "
+              f"speedup {recursive_time / fast_time:.2f}x")
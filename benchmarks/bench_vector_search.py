@@ -0,0 +1,88 @@
+"""Micro-benchmark: top-k search latency, NumPy backend vs Chroma.
+
+Fills each store with random normalized 384-d vectors (MiniLM's size) and
+times ``similarity_search_by_vector_with_relevance_scores`` for random
+queries. No embedding model is loaded.
+
+    python benchmarks/bench_vector_search.py [sizes] [queries]
+    python benchmarks/bench_vector_search.py 1000,10000,100000 200
+"""
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from langchain_core.documents import Document
+
+from chatbot.numpy_store import NumpyVectorStore
+
+DIM = 384
+K = 3
+CHROMA_ADD_BATCH = 5000
+
+
+def random_vectors(n, rng):
+    vectors = rng.standard_normal((n, DIM)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def bench(label, search, queries):
+    samples = []
+    for query in queries:
+        start = time.perf_counter()
+        search(query)
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    p50 = samples[len(samples) // 2] * 1000
+    p99 = samples[max(int(len(samples) * 0.99) - 1, 0)] * 1000
+    print(f"{label:<28} p50={p50:8.3f} ms  p99={p99:8.3f} ms")
+    return p50
+
+
+def build_numpy_store(directory, vectors, dtype="float32"):
+    # Vectors are passed in directly, so neither store needs an embedding function
+    store = NumpyVectorStore(directory, None, dtype=dtype)
+    ids = [str(i) for i in range(len(vectors))]
+    store.add_embeddings(ids, vectors, [Document(page_content=f"chunk {i}") for i in range(len(vectors))])
+    return store
+
+
+def build_chroma_store(directory, vectors):
+    from langchain_chroma import Chroma
+    store = Chroma(collection_name="bench", embedding_function=None, persist_directory=directory,
+                   collection_metadata={"hnsw:space": "cosine"})
+    for start in range(0, len(vectors), CHROMA_ADD_BATCH):
+        batch = vectors[start:start + CHROMA_ADD_BATCH]
+        store._collection.add(
+            ids=[str(i) for i in range(start, start + len(batch))],
+            embeddings=batch.tolist(),
+            documents=[f"chunk {i}" for i in range(start, start + len(batch))],
+        )
+    return store
+
+
+if __name__ == "__main__":
+    sizes = [int(n) for n in sys.argv[1].split(",")] if len(sys.argv) > 1 else [1000, 10000, 100000]
+    n_queries = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    rng = np.random.default_rng(0)
+
+    for n in sizes:
+        print(f"--- {n} chunks ---")
+        vectors = random_vectors(n, rng)
+        queries = [query.tolist() for query in random_vectors(n_queries, rng)]
+        with tempfile.TemporaryDirectory() as directory:
+            numpy_store = build_numpy_store(f"{directory}/numpy", vectors)
+            numpy_p50 = bench("numpy float32", lambda q: numpy_store.similarity_search_by_vector_with_relevance_scores(q, K), queries)
+            numpy_store.close()
+
+            half_store = build_numpy_store(f"{directory}/numpy16", vectors, dtype="float16")
+            bench("numpy float16", lambda q: half_store.similarity_search_by_vector_with_relevance_scores(q, K), queries)
+            half_store.close()
+
+            chroma_store = build_chroma_store(f"{directory}/chroma", vectors)
+            chroma_p50 = bench("chroma", lambda q: chroma_store.similarity_search_by_vector_with_relevance_scores(q, K), queries)
+        print(f"Chroma / NumPy float32 p50 ratio: {chroma_p50 / numpy_p50:.2f}")
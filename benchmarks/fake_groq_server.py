@@ -0,0 +1,138 @@
+"""Local stand-in for the Groq chat completions API, for exercising the LLM gateway.
+
+Serves ``POST /openai/v1/chat/completions`` (streaming and not) with a canned
+answer and enforces its own requests-per-minute limit. Over the limit it
+answers 429 with Retry-After, as Groq does. A fraction of requests can also
+fail with 503. Point the app at it with GROQ_API_BASE:
+
+    python benchmarks/fake_groq_server.py [port] [requests_per_minute] [error_rate]
+    GROQ_API_BASE=http://127.0.0.1:8765 GROQ_API_KEY=fake python manage.py runserver
+"""
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ANSWER = "This answer comes from the fake Groq server, one word at a time."
+
+
+class FakeGroq:
+    """Sliding one-minute request window plus counters of what was served"""
+
+    def __init__(self, requests_per_minute: int = 30, error_rate: float = 0.0, token_delay: float = 0.01):
+        self.requests_per_minute = requests_per_minute
+        self.error_rate = error_rate
+        self.token_delay = token_delay
+        self.lock = threading.Lock()
+        self.window = []
+        self.counts = {"served": 0, "rate_limited": 0, "errors": 0}
+
+    def admit(self):
+        """None if the request may proceed, else seconds until the window frees a slot"""
+        with self.lock:
+            now = time.monotonic()
+            self.window = [t for t in self.window if now - t < 60]
+            if len(self.window) >= self.requests_per_minute:
+                self.counts["rate_limited"] += 1
+                return 60 - (now - self.window[0])
+            self.window.append(now)
+            return None
+
+    def count(self, name):
+        with self.lock:
+            self.counts[name] += 1
+
+
+def make_handler(fake: FakeGroq):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def send_json(self, status, payload, headers=None):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if not self.path.endswith("/chat/completions"):
+                self.send_json(404, {"error": {"message": "Not found"}})
+                return
+            wait = fake.admit()
+            if wait is not None:
+                self.send_json(429, {"error": {"message": "Rate limit reached", "type": "tokens", "code": "rate_limit_exceeded"}},
+                               {"retry-after": f"{wait:.2f}"})
+                return
+            if random.random() < fake.error_rate:
+                fake.count("errors")
+                self.send_json(503, {"error": {"message": "Service unavailable"}})
+                return
+            fake.count("served")
+
+            completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+            model = request.get("model", "fake")
+            usage = {"prompt_tokens": 10, "completion_tokens": len(ANSWER.split()), "total_tokens": 10 + len(ANSWER.split())}
+            if not request.get("stream"):
+                time.sleep(fake.token_delay * len(ANSWER.split()))
+                self.send_json(200, {
+                    "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": ANSWER}, "finish_reason": "stop"}],
+                    "usage": usage,
+                })
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            words = ANSWER.split(" ")
+            for i, word in enumerate(words):
+                time.sleep(fake.token_delay)
+                last = i == len(words) - 1
+                chunk = {
+                    "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                    "choices": [{"index": 0, "delta": {"role": "assistant", "content": word if last else word + " "},
+                                 "finish_reason": "stop" if last else None}],
+                }
+                if last:
+                    chunk["x_groq"] = {"id": completion_id, "usage": usage}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+            self.close_connection = True
+
+    return Handler
+
+
+def serve(port: int = 8765, requests_per_minute: int = 30, error_rate: float = 0.0, token_delay: float = 0.01):
+    """Start the server on a daemon thread; returns (server, FakeGroq)"""
+    fake = FakeGroq(requests_per_minute, error_rate, token_delay)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(fake))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-groq", daemon=True).start()
+    return server, fake
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8765
+    rpm = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    error_rate = float(sys.argv[3]) if len(sys.argv) > 3 else 0.0
+    server, fake = serve(port, rpm, error_rate)
+    print(f"Fake Groq on http://127.0.0.1:{port} ({rpm} requests/min, {error_rate:.0%} 503s)")
+    try:
+        while True:
+            time.sleep(10)
+            print(fake.counts)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -13,5 +13,6 @@ fi
 
 # Start Command
 # python manage.py migrate && python manage.py collectstatic && gunicorn django_chatbot.wsgi:application
+# Async (CHATBOT_ASYNC_VIEWS=true): gunicorn django_chatbot.asgi:application -k uvicorn.workers.UvicornWorker
 
 #This file will be use in Render. During this project deployment on the cloud.
@@ -1,5 +1,9 @@
 from django.contrib import admin
-from .models import Chat
+from .models import Chat, UploadedDocument, CorpusCatalog, CorpusFile, ConversationMemory
 
 # Register your models here.
-admin.site.register(Chat)
\ No newline at end of file
+admin.site.register(Chat)
+admin.site.register(UploadedDocument)
+admin.site.register(CorpusCatalog)
+admin.site.register(CorpusFile)
+admin.site.register(ConversationMemory)
@@ -0,0 +1,114 @@
+"""Semantic cache of generated answers.
+
+A question is answered from the cache when an earlier question with a similar
+embedding (cosine similarity at or above the threshold) was answered against
+the same context: the same corpus version, the same retrieved chunks and the
+same model. Any document change bumps the corpus version, so answers given
+before it are never matched again and simply age out. Entries expire after a
+TTL, and the least recently used ones are evicted beyond max_entries.
+"""
+import hashlib
+import itertools
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+
+def context_key(corpus_version: str, documents: Iterable[Document], model: Optional[str] = None) -> str:
+    """Fingerprint of everything an answer depends on besides the question"""
+    digest = hashlib.sha256(f"{corpus_version}\x00{model or ''}".encode("utf-8"))
+    for content in sorted(doc.page_content for doc in documents):
+        digest.update(b"\x00")
+        digest.update(content.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def stream_pieces(text: str) -> List[str]:
+    """Split a cached answer into word-sized pieces to stream like LLM tokens"""
+    return re.findall(r"\s*\S+", text) or [text]
+
+
+class SemanticAnswerCache:
+    """Thread-safe, in-process answer cache with TTL and LRU eviction"""
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 86400, threshold: float = 0.95):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._entries = OrderedDict()  # entry id -> (context, vector, answer, created_at), least recently used first
+        self._contexts = {}  # context -> {entry id: None}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def _remove(self, entry_id: int) -> None:
+        context = self._entries.pop(entry_id)[0]
+        ids = self._contexts[context]
+        del ids[entry_id]
+        if not ids:
+            del self._contexts[context]
+
+    def lookup(self, context: str, embedding) -> Optional[Tuple[str, float]]:
+        """Return (answer, similarity) for the closest cached question in this context, or None"""
+        query = self._normalize(embedding)
+        now = time.monotonic()
+        with self._lock:
+            ids = []
+            for entry_id in list(self._contexts.get(context, ())):
+                if now - self._entries[entry_id][3] >= self.ttl_seconds:
+                    self._remove(entry_id)
+                    self.expirations += 1
+                else:
+                    ids.append(entry_id)
+            if ids:
+                similarities = np.stack([self._entries[entry_id][1] for entry_id in ids]) @ query
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    self.hits += 1
+                    self._entries.move_to_end(ids[best])
+                    return self._entries[ids[best]][2], float(similarities[best])
+            self.misses += 1
+            return None
+
+    def store(self, context: str, embedding, answer: str) -> None:
+        """Remember an answer for a question asked in this context"""
+        if not answer:
+            return
+        with self._lock:
+            entry_id = next(self._ids)
+            self._entries[entry_id] = (context, self._normalize(embedding), answer, time.monotonic())
+            self._contexts.setdefault(context, {})[entry_id] = None
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._contexts.clear()
+
+    def stats(self) -> Dict[str, float]:
+        """Hit rate and counters since the process started"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
@@ -1,6 +1,15 @@
+import threading
+
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class ChatbotConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'chatbot'
+
+    def ready(self):
+        # Models load lazily; servers other than gunicorn can opt in to warming up at startup
+        if settings.CHATBOT_WARMUP_ON_READY:
+            from .langgraph import chatbot
+            threading.Thread(target=chatbot.warm_up, name="chatbot-warm-up", daemon=True).start()
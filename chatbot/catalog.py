@@ -0,0 +1,138 @@
+"""Per-scope corpus catalog, cached in memory.
+
+Ingestion keeps the CorpusCatalog / CorpusFile tables in sync with what is in
+each vector store, so "does this user have documents?", "which files?" and
+"which corpus version?" are answered without touching Chroma. A scope is
+SHARED_SCOPE for the data folder corpus or a user ID for that user's uploads.
+Snapshots are cached per process for CHATBOT_CATALOG_CACHE_SECONDS and dropped
+immediately on local writes.
+"""
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum
+
+from .models import CorpusCatalog, CorpusFile
+
+_cache = {}  # scope -> (snapshot, cached_at)
+_cache_lock = threading.Lock()
+
+EMPTY_SNAPSHOT = {'version': 0, 'chunk_count': 0, 'files': []}
+
+
+def invalidate(scope: str) -> None:
+    with _cache_lock:
+        _cache.pop(scope, None)
+
+
+def get_snapshot(scope: str) -> Dict[str, Any]:
+    """Version, chunk count and file list for a scope"""
+    with _cache_lock:
+        cached = _cache.get(scope)
+    if cached is not None and time.monotonic() - cached[1] < settings.CHATBOT_CATALOG_CACHE_SECONDS:
+        return cached[0]
+
+    catalog = CorpusCatalog.objects.filter(scope=scope).first()
+    if catalog is None:
+        snapshot = EMPTY_SNAPSHOT
+    else:
+        snapshot = {
+            'version': catalog.version,
+            'chunk_count': catalog.chunk_count,
+            'files': list(catalog.files.order_by('file_name').values_list('file_name', flat=True)),
+        }
+    with _cache_lock:
+        _cache[scope] = (snapshot, time.monotonic())
+    return snapshot
+
+
+def _refresh(catalog: CorpusCatalog) -> None:
+    """Recompute the chunk total and bump the version after a change"""
+    total = catalog.files.aggregate(total=Sum('chunk_count'))['total'] or 0
+    CorpusCatalog.objects.filter(pk=catalog.pk).update(chunk_count=total, version=F('version') + 1)
+
+
+def record_file(scope: str, key: str, file_name: str, file_hash: str, source: str, chunk_count: int) -> None:
+    """Add or replace one indexed file"""
+    with transaction.atomic():
+        catalog, _ = CorpusCatalog.objects.get_or_create(scope=scope)
+        CorpusFile.objects.update_or_create(
+            catalog=catalog,
+            key=key,
+            defaults={
+                'file_name': file_name,
+                'file_hash': file_hash,
+                'source': source,
+                'chunk_count': chunk_count,
+            },
+        )
+        _refresh(catalog)
+    invalidate(scope)
+
+
+def remove_files(scope: str, keys: Optional[Iterable[str]] = None, source: Optional[str] = None) -> None:
+    """Remove files by key and/or source (all files if neither is given)"""
+    with transaction.atomic():
+        catalog = CorpusCatalog.objects.filter(scope=scope).first()
+        if catalog is None:
+            return
+        files = catalog.files.all()
+        if keys is not None:
+            files = files.filter(key__in=list(keys))
+        if source is not None:
+            files = files.filter(source=source)
+        if files.delete()[0]:
+            _refresh(catalog)
+    invalidate(scope)
+
+
+def sync_files(scope: str, source: str, files: Dict[str, Dict[str, Any]]) -> None:
+    """Make the catalog's files for a source match exactly key -> {file_name, file_hash, chunk_count}"""
+    with transaction.atomic():
+        catalog, _ = CorpusCatalog.objects.get_or_create(scope=scope)
+        current = {
+            file.key: file
+            for file in catalog.files.filter(source=source)
+        }
+        changed = False
+        for key in set(current) - set(files):
+            current[key].delete()
+            changed = True
+        for key, info in files.items():
+            file = current.get(key)
+            if (file is not None and file.file_hash == info['file_hash']
+                    and file.chunk_count == info['chunk_count']):
+                continue
+            CorpusFile.objects.update_or_create(
+                catalog=catalog,
+                key=key,
+                defaults={**info, 'source': source},
+            )
+            changed = True
+        if changed:
+            _refresh(catalog)
+    if changed:
+        invalidate(scope)
+
+
+def export_files(scope: str) -> List[Dict[str, Any]]:
+    """Every indexed file of a scope, as recorded"""
+    return list(
+        CorpusFile.objects.filter(catalog__scope=scope)
+        .order_by('key')
+        .values('key', 'file_name', 'file_hash', 'source', 'chunk_count')
+    )
+
+
+def import_files(scope: str, files: List[Dict[str, Any]]) -> None:
+    """Make a scope's recorded files match an export_files() list exactly"""
+    sources = set(CorpusFile.objects.filter(catalog__scope=scope).values_list('source', flat=True))
+    sources |= {file['source'] for file in files}
+    for source in sources:
+        sync_files(scope, source, {
+            file['key']: {'file_name': file['file_name'], 'file_hash': file['file_hash'], 'chunk_count': file['chunk_count']}
+            for file in files if file['source'] == source
+        })
@@ -0,0 +1,154 @@
+"""Write-behind persistence of Chat rows.
+
+With CHATBOT_CHAT_WRITE_BEHIND enabled, finished turns are queued in memory
+and a background thread inserts them with one bulk_create per batch. A batch
+is flushed when it reaches CHATBOT_CHAT_WRITE_BATCH_SIZE rows, after
+CHATBOT_CHAT_WRITE_FLUSH_MS, and at interpreter exit. Requests never wait on
+the SQLite write lock, and many turns share one transaction. A turn still in
+the queue is lost if the process is killed outright, and it shows up in
+history pages only once flushed. Conversation memory reads the queue, so the
+next turn's prompt is not affected. A batch that fails to insert is retried on
+the next flush. After CHATBOT_CHAT_WRITE_MAX_FAILURES failures in a row, its
+rows are saved one at a time, and rows that still fail are logged and dropped
+so one bad row cannot block the queue.
+"""
+import atexit
+import os
+import threading
+from typing import List, Union
+
+from django.conf import settings
+
+from .models import Chat
+
+
+class ChatWriter:
+    """Per-process queue of unsaved Chat rows, flushed in batches"""
+
+    def __init__(self, max_batch: int = 100, flush_interval: float = 0.5, max_failures: int = 3):
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_failures = max_failures
+        self._failed_flushes = 0  # consecutive failed bulk inserts
+        self._queue: List[Chat] = []  # oldest first
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        self.flushed = 0
+        self.batches = 0
+        self.failures = 0
+        self.dropped = 0
+        atexit.register(self.flush)
+
+    def _ensure_thread(self) -> None:
+        # Caller holds _lock. Threads do not survive a fork, so restart in a new worker process.
+        if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="chat-writer", daemon=True)
+            self._thread.start()
+
+    def enqueue(self, chat: Chat) -> None:
+        with self._lock:
+            self._queue.append(chat)
+            size = len(self._queue)
+            self._ensure_thread()
+        if size >= self.max_batch:
+            self._wakeup.set()
+
+    def pending_for_user(self, user_id: Union[int, str]) -> List[Chat]:
+        """Queued turns of one user, oldest first"""
+        with self._lock:
+            # Rows get their primary key as bulk_create inserts them
+            return [chat for chat in self._queue if chat.pk is None and str(chat.user_id) == str(user_id)]
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self) -> int:
+        """Insert everything queued so far; returns the number of rows written"""
+        with self._flush_lock:
+            # Rows stay queued (and visible to pending_for_user) until they are written
+            with self._lock:
+                batch = list(self._queue)
+            if not batch:
+                return 0
+            try:
+                Chat.objects.bulk_create(batch, batch_size=self.max_batch)
+                written = batch
+            except Exception as e:
+                for chat in batch:
+                    chat.pk = None
+                self.failures += 1
+                self._failed_flushes += 1
+                if self._failed_flushes < self.max_failures:
+                    print(f"✗ Error writing {len(batch)} chats, will retry: {e}")
+                    return 0
+                print(f"✗ Error writing {len(batch)} chats {self._failed_flushes} times in a row, saving them one at a time: {e}")
+                written = self._save_each(batch)
+            self._failed_flushes = 0
+            with self._lock:
+                del self._queue[:len(batch)]
+            self.flushed += len(written)
+            self.batches += 1
+
+        # Summaries read the Chat table, so refresh them once the rows exist
+        from .memory import schedule_summary_update
+        for user_id in {chat.user_id for chat in written}:
+            schedule_summary_update(user_id)
+        return len(written)
+
+    def _save_each(self, batch: List[Chat]) -> List[Chat]:
+        """Save rows individually, dropping the ones that fail; returns the rows written"""
+        written = []
+        for chat in batch:
+            try:
+                chat.save()
+                written.append(chat)
+            except Exception as e:
+                chat.pk = None
+                self.dropped += 1
+                print(f"✗ Dropping chat of user {chat.user_id} ({chat.message[:50]!r}): {e}")
+        return written
+
+    def stats(self):
+        with self._lock:
+            queued = len(self._queue)
+        return {
+            "queued": queued,
+            "flushed": self.flushed,
+            "batches": self.batches,
+            "failures": self.failures,
+            "dropped": self.dropped,
+        }
+
+
+chat_writer = ChatWriter(
+    max_batch=settings.CHATBOT_CHAT_WRITE_BATCH_SIZE,
+    flush_interval=settings.CHATBOT_CHAT_WRITE_FLUSH_MS / 1000,
+    max_failures=settings.CHATBOT_CHAT_WRITE_MAX_FAILURES,
+)
+
+
+def save_chat(chat: Chat) -> None:
+    """Persist a finished turn, through the write-behind queue when enabled"""
+    if settings.CHATBOT_CHAT_WRITE_BEHIND:
+        chat_writer.enqueue(chat)
+        return
+    chat.save()
+    from .memory import schedule_summary_update
+    schedule_summary_update(chat.user_id)
+
+
+async def asave_chat(chat: Chat) -> None:
+    """Async variant of save_chat; queuing needs no database access"""
+    if settings.CHATBOT_CHAT_WRITE_BEHIND:
+        chat_writer.enqueue(chat)
+        return
+    await chat.asave()
+    from .memory import schedule_summary_update
+    schedule_summary_update(chat.user_id)
@@ -0,0 +1,166 @@
+"""Token-budgeted assembly of retrieved chunks into prompt context.
+
+The splitter overlaps neighbouring chunks by up to CHUNK_OVERLAP characters, so
+two hits from the same part of a file repeat that text. Chunks from the same
+file whose ends overlap are stitched together with the repeat removed. The
+merged passages are then added in relevance order until the token budget is
+spent. Tokens are counted with tiktoken. If its encoding cannot be loaded
+(e.g. offline), an estimate of four characters per token is used instead.
+"""
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from langchain_core.documents import Document
+
+from .ingestion import CHUNK_OVERLAP
+
+# Shortest shared text treated as splitter overlap rather than coincidence
+MIN_OVERLAP_CHARS = 20
+PASSAGE_SEPARATOR = "\n\n"
+# Framing tokens the chat format adds per message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_encoding = None
+_encoding_name = None
+_encoding_lock = threading.Lock()
+
+
+def get_encoding(name: str):
+    """Return the tiktoken encoding, or None if it cannot be loaded"""
+    global _encoding, _encoding_name
+    if _encoding_name != name:
+        with _encoding_lock:
+            if _encoding_name != name:
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.get_encoding(name)
+                except Exception as e:
+                    print(f"✗ Could not load tiktoken encoding {name}, estimating token counts: {e}")
+                    _encoding = None
+                _encoding_name = name
+    return _encoding
+
+
+def count_tokens(text: str, encoding_name: str = "o200k_base") -> int:
+    encoding = get_encoding(encoding_name)
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, encoding_name: str = "o200k_base") -> str:
+    encoding = get_encoding(encoding_name)
+    if encoding is None:
+        return text[:max_tokens * 4]
+    return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+
+
+def count_message_tokens(messages: List[Dict[str, str]], encoding_name: str = "o200k_base") -> int:
+    """Approximate prompt size of a chat message list"""
+    return sum(count_tokens(message["content"], encoding_name) + MESSAGE_OVERHEAD_TOKENS for message in messages)
+
+
+def overlap_length(left: str, right: str, max_overlap: int = CHUNK_OVERLAP * 2) -> int:
+    """Length of the longest suffix of left that is also a prefix of right"""
+    longest = min(len(left), len(right), max_overlap)
+    for size in range(longest, MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def file_key(document: Document) -> Optional[str]:
+    metadata = document.metadata
+    name = metadata.get("file_hash") or metadata.get("file_name") or metadata.get("source")
+    return f"{name}:{metadata.get('page', '')}" if name else None
+
+
+@dataclass
+class Passage:
+    key: Optional[str]
+    text: str
+    documents: List[Document] = field(default_factory=list)
+
+    def absorb(self, document: Document) -> bool:
+        """Stitch an overlapping or contained chunk onto this passage; False if unrelated"""
+        text = document.page_content
+        if self.key is None or file_key(document) != self.key:
+            return False
+        if text in self.text:
+            self.documents.append(document)
+            return True
+        overlap = overlap_length(self.text, text)
+        if overlap:
+            self.text += text[overlap:]
+        else:
+            overlap = overlap_length(text, self.text)
+            if not overlap:
+                return False
+            self.text = text + self.text[overlap:]
+        self.documents.append(document)
+        return True
+
+
+@dataclass
+class PackedContext:
+    text: str
+    documents: List[Document]
+    tokens: int
+    chunks_merged: int
+    passages_dropped: int
+
+
+def merge_passages(documents: List[Document]) -> List[Passage]:
+    """Group chunks into passages, keeping the order of each passage's best-ranked chunk"""
+    passages: List[Passage] = []
+    for document in documents:
+        if not any(passage.absorb(document) for passage in passages):
+            passages.append(Passage(file_key(document), document.page_content, [document]))
+
+    # A later chunk can bridge two earlier passages; keep stitching until nothing changes
+    merged = True
+    while merged:
+        merged = False
+        for i, passage in enumerate(passages):
+            for other in passages[i + 1:]:
+                if passage.key is None or passage.key != other.key:
+                    continue
+                probe = Passage(passage.key, passage.text, list(passage.documents))
+                if probe.absorb(Document(page_content=other.text, metadata=other.documents[0].metadata)):
+                    passage.text = probe.text
+                    passage.documents.extend(other.documents)
+                    passages.remove(other)
+                    merged = True
+                    break
+            if merged:
+                break
+    return passages
+
+
+def pack_context(documents: List[Document], token_budget: int, encoding_name: str = "o200k_base") -> PackedContext:
+    """Merge overlapping chunks and fill token_budget with passages in relevance order"""
+    passages = merge_passages(documents)
+    selected, used, tokens, dropped = [], [], 0, 0
+    separator_tokens = count_tokens(PASSAGE_SEPARATOR, encoding_name)
+    for passage in passages:
+        cost = count_tokens(passage.text, encoding_name) + (separator_tokens if selected else 0)
+        if tokens + cost <= token_budget:
+            selected.append(passage.text)
+            used.extend(passage.documents)
+            tokens += cost
+        elif not selected:
+            # The best passage alone exceeds the budget: keep as much of it as fits
+            text = truncate_to_tokens(passage.text, token_budget, encoding_name)
+            selected.append(text)
+            used.extend(passage.documents)
+            tokens += count_tokens(text, encoding_name)
+        else:
+            dropped += 1
+    return PackedContext(
+        text=PASSAGE_SEPARATOR.join(selected),
+        documents=used,
+        tokens=tokens,
+        chunks_merged=len(documents) - len(passages),
+        passages_dropped=dropped,
+    )
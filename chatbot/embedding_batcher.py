@@ -0,0 +1,104 @@
+"""Micro-batching of query embeddings across concurrent requests.
+
+Each chat request embeds a single question. Sentence-transformers is far more
+efficient on batches, so queries are queued and a background thread embeds
+whatever arrived within ``max_wait`` seconds (up to ``max_batch_size`` texts)
+in one forward pass, handing each vector back to its caller.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List
+
+from langchain_core.embeddings import Embeddings
+
+
+class BatchingEmbeddings(Embeddings):
+    """Embeddings wrapper that coalesces concurrent embed_query calls.
+
+    Queries are embedded with ``embed_documents`` on the underlying model,
+    which is equivalent for symmetric models such as MiniLM. Document
+    embedding is already batched by the caller and passes straight through.
+    """
+
+    def __init__(self, underlying: Embeddings, max_batch_size: int = 32, max_wait: float = 0.005):
+        self.underlying = underlying
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._worker = None
+        self._worker_pid = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._queue_delay_total = 0.0
+        self._queue_delay_max = 0.0
+
+    def _ensure_worker(self) -> None:
+        """Start the batching thread, again after a fork (threads do not survive it)"""
+        if self._worker_pid == os.getpid() and self._worker.is_alive():
+            return
+        with self._start_lock:
+            if self._worker_pid == os.getpid() and self._worker.is_alive():
+                return
+            self._queue = queue.Queue()
+            self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+            self._worker.start()
+            self._worker_pid = os.getpid()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._process(batch)
+
+    def _process(self, batch) -> None:
+        started = time.monotonic()
+        delays = [started - enqueued_at for _, _, enqueued_at in batch]
+        with self._stats_lock:
+            self._batches += 1
+            self._items += len(batch)
+            self._queue_delay_total += sum(delays)
+            self._queue_delay_max = max(self._queue_delay_max, max(delays))
+
+        try:
+            vectors = self.underlying.embed_documents([text for text, _, _ in batch])
+        except Exception as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+        for (_, future, _), vector in zip(batch, vectors):
+            future.set_result(vector)
+
+    def embed_query(self, text: str) -> List[float]:
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((text, future, time.monotonic()))
+        return future.result()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.underlying.embed_documents(texts)
+
+    def stats(self) -> Dict[str, float]:
+        """Batch fill and queue delay metrics since process start"""
+        with self._stats_lock:
+            batches = self._batches
+            return {
+                "batches": batches,
+                "queries": self._items,
+                "avg_batch_size": self._items / batches if batches else 0.0,
+                "avg_batch_fill": self._items / (batches * self.max_batch_size) if batches else 0.0,
+                "avg_queue_delay_ms": self._queue_delay_total / self._items * 1000 if self._items else 0.0,
+                "max_queue_delay_ms": self._queue_delay_max * 1000,
+            }
@@ -0,0 +1,198 @@
+"""Persistent, content-addressed cache in front of an embedding model.
+
+Vectors live in a preallocated, memory-mapped float16 matrix; a small SQLite
+index maps sha256(model name, text) to a row and tracks last use for LRU
+eviction. Writes take an exclusive file lock, so several gunicorn workers can
+share one cache directory.
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+try:
+    import fcntl
+except ImportError:  # Windows: locking is per-process only
+    fcntl = None
+
+# Keep SQLite "IN (...)" queries under the default host parameter limit
+LOOKUP_BATCH_SIZE = 500
+
+
+class CachedEmbeddings(Embeddings):
+    """Drop-in Embeddings wrapper that caches vectors on disk by content hash"""
+
+    def __init__(self, underlying: Embeddings, model_name: str, cache_dir: str, max_entries: int = 200_000):
+        self.underlying = underlying
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.directory = os.path.join(cache_dir, re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name))
+        os.makedirs(self.directory, exist_ok=True)
+        self.vectors_path = os.path.join(self.directory, "vectors.f16")
+        self.lock_path = os.path.join(self.directory, "cache.lock")
+
+        self.hits = 0
+        self.misses = 0
+        self._vectors = None  # np.memmap, opened once the dimension is known
+        self._capacity = None
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            os.path.join(self.directory, "index.sqlite3"),
+            check_same_thread=False,
+            timeout=30,
+        )
+        with self._locked():
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, row INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries(last_used)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            self._conn.commit()
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    @contextmanager
+    def _locked(self):
+        """Serialize access across threads and, where supported, processes"""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self.lock_path, "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _get_meta(self, name: str) -> Optional[int]:
+        row = self._conn.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, name: str, value: int) -> None:
+        self._conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", (name, value))
+
+    def _open_vectors(self, dim: Optional[int] = None) -> bool:
+        """Map the vector file, creating it when the first dimension is seen; caller holds the lock"""
+        if self._vectors is not None:
+            return True
+        stored_dim = self._get_meta("dim")
+        if stored_dim is None:
+            if dim is None:
+                return False
+            self._set_meta("dim", dim)
+            self._set_meta("capacity", self.max_entries)
+            self._set_meta("next_row", 0)
+            self._conn.commit()
+            stored_dim = dim
+        capacity = self._get_meta("capacity")
+        size = capacity * stored_dim * np.dtype(np.float16).itemsize
+        if not os.path.exists(self.vectors_path) or os.path.getsize(self.vectors_path) < size:
+            with open(self.vectors_path, "ab") as f:
+                f.truncate(size)  # sparse on most filesystems
+        self._vectors = np.memmap(self.vectors_path, dtype=np.float16, mode="r+", shape=(capacity, stored_dim))
+        self._capacity = capacity
+        return True
+
+    def _lookup(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        """Return cached vectors for the given keys and refresh their LRU stamp"""
+        found = {}
+        with self._locked():
+            if not self._open_vectors():
+                return found
+            unique_keys = list(dict.fromkeys(keys))
+            for start in range(0, len(unique_keys), LOOKUP_BATCH_SIZE):
+                batch = unique_keys[start:start + LOOKUP_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, row FROM entries WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, row in rows:
+                    found[key] = np.asarray(self._vectors[row], dtype=np.float32)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE entries SET last_used = ? WHERE key = ?", [(now, key) for key in found]
+                )
+                self._conn.commit()
+        return found
+
+    def _store(self, keys: List[str], vectors: List[List[float]]) -> None:
+        """Write new vectors, evicting least recently used rows when full"""
+        matrix = np.asarray(vectors, dtype=np.float16)
+        with self._locked():
+            self._open_vectors(matrix.shape[1])
+            # Another worker may have stored some of these meanwhile
+            pending = [(key, i) for i, key in enumerate(keys)
+                       if self._conn.execute("SELECT 1 FROM entries WHERE key = ?", (key,)).fetchone() is None]
+            pending = pending[-self._capacity:]
+            if not pending:
+                return
+
+            next_row = self._get_meta("next_row")
+            fresh = min(len(pending), self._capacity - next_row)
+            rows = list(range(next_row, next_row + fresh))
+            self._set_meta("next_row", next_row + fresh)
+
+            evict = len(pending) - fresh
+            if evict:
+                victims = self._conn.execute(
+                    "SELECT key, row FROM entries ORDER BY last_used LIMIT ?", (evict,)
+                ).fetchall()
+                self._conn.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key, _ in victims])
+                rows.extend(row for _, row in victims)
+
+            self._vectors[rows] = matrix[[i for _, i in pending]]
+            self._vectors.flush()
+            now = time.time()
+            self._conn.executemany(
+                "INSERT INTO entries (key, row, last_used) VALUES (?, ?, ?)",
+                [(key, row, now) for (key, _), row in zip(pending, rows)],
+            )
+            self._conn.commit()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key(text) for text in texts]
+        found = self._lookup(keys)
+
+        # Deduplicate misses so repeated texts in one batch are embedded once
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+
+        if missing:
+            vectors = self.underlying.embed_documents(list(missing.values()))
+            self._store(list(missing), vectors)
+            found.update((key, np.asarray(vector, dtype=np.float32)) for key, vector in zip(missing, vectors))
+
+        return [found[key].tolist() for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key(text)
+        found = self._lookup([key])
+        if key in found:
+            self.hits += 1
+            return found[key].tolist()
+
+        self.misses += 1
+        vector = self.underlying.embed_query(text)
+        self._store([key], [vector])
+        return list(vector)
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters for this process and the number of cached vectors"""
+        with self._locked():
+            entries = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
@@ -0,0 +1,211 @@
+"""Local inference sidecar: one process owns the embedding model and ingestion.
+
+Run ``python manage.py embedding_sidecar`` next to the web workers and set
+CHATBOT_EMBEDDING_SOCKET to its Unix socket path. Workers then embed through
+SidecarEmbeddings instead of loading MiniLM themselves, so the model sits in
+RAM once however many workers there are. Concurrent queries from all workers
+reach the same BatchingEmbeddings and share forward passes. The sidecar also
+syncs the data folder, drains pending uploads and deletes a user's uploaded
+chunks, so only one process ever writes the vector stores.
+
+Each message is a 4-byte big-endian header length, a JSON header and
+``header["payload_bytes"]`` bytes of payload. Vectors travel as raw float32.
+"""
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+HEADER_LENGTH = struct.Struct(">I")
+# Texts per request when embedding documents, so one upload does not hold a connection for long
+DOCUMENT_BATCH = 256
+# Ops that are safe to send twice; the others write stores and are only resent if the first send failed
+IDEMPOTENT_OPS = frozenset({"embed_query", "embed_documents", "stats"})
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(min(size - len(data), 1 << 20))
+        if not chunk:
+            raise ConnectionError("Embedding sidecar connection closed")
+        data += chunk
+    return bytes(data)
+
+
+def send_message(sock: socket.socket, header: Dict[str, Any], payload: bytes = b"") -> None:
+    encoded = json.dumps({**header, "payload_bytes": len(payload)}).encode("utf-8")
+    sock.sendall(HEADER_LENGTH.pack(len(encoded)) + encoded + payload)
+
+
+def recv_message(sock: socket.socket) -> Tuple[Dict[str, Any], bytes]:
+    (length,) = HEADER_LENGTH.unpack(_recv_exactly(sock, HEADER_LENGTH.size))
+    header = json.loads(_recv_exactly(sock, length))
+    return header, _recv_exactly(sock, header.pop("payload_bytes", 0))
+
+
+def encode_vectors(vectors: List[List[float]]) -> Tuple[Dict[str, Any], bytes]:
+    matrix = np.asarray(vectors, dtype=np.float32)
+    return {"rows": int(matrix.shape[0]), "dim": int(matrix.shape[1]) if matrix.ndim == 2 else 0}, matrix.tobytes()
+
+
+def decode_vectors(header: Dict[str, Any], payload: bytes) -> List[List[float]]:
+    if not header["rows"]:
+        return []
+    return np.frombuffer(payload, dtype=np.float32).reshape(header["rows"], header["dim"]).tolist()
+
+
+class SidecarEmbeddings(Embeddings):
+    """Embeddings client for the sidecar; one connection per thread, reopened after a fork"""
+
+    def __init__(self, socket_path: str, timeout: float = 60.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self) -> socket.socket:
+        sock = getattr(self._local, "sock", None)
+        if sock is None or self._local.pid != os.getpid():
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            self._local.sock, self._local.pid = sock, os.getpid()
+        return sock
+
+    def _close(self) -> None:
+        sock = getattr(self._local, "sock", None)
+        self._local.sock = None
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+    def request(self, op: str, payload: bytes = b"", timeout: Optional[float] = None, **fields) -> Tuple[Dict[str, Any], bytes]:
+        """Send one request; a stale connection (sidecar restarted) is retried once on a new one.
+
+        Writing ops are only retried if the request never went out, so the sidecar cannot run them twice.
+        """
+        for attempt in range(2):
+            sent = False
+            try:
+                sock = self._connection()
+                sock.settimeout(timeout or self.timeout)
+                send_message(sock, {"op": op, **fields}, payload)
+                sent = True
+                header, body = recv_message(sock)
+                break
+            except (ConnectionError, BrokenPipeError, socket.timeout, OSError) as e:
+                self._close()
+                if attempt or isinstance(e, socket.timeout) or (sent and op not in IDEMPOTENT_OPS):
+                    raise ConnectionError(f"Embedding sidecar at {self.socket_path} unavailable: {e}") from e
+        if "error" in header:
+            raise RuntimeError(f"Embedding sidecar error: {header['error']}")
+        return header, body
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = []
+        for start in range(0, len(texts), DOCUMENT_BATCH):
+            header, body = self.request("embed_documents", texts=texts[start:start + DOCUMENT_BATCH])
+            vectors.extend(decode_vectors(header, body))
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        header, body = self.request("embed_query", text=text)
+        return decode_vectors(header, body)[0]
+
+    def stats(self) -> Dict[str, Any]:
+        return self.request("stats")[0]
+
+
+class SidecarHandler(socketserver.BaseRequestHandler):
+    """Serves requests on one worker connection until it closes"""
+
+    def handle(self) -> None:
+        while True:
+            try:
+                header, _ = recv_message(self.request)
+            except (ConnectionError, OSError):
+                return
+            try:
+                response, payload = self.server.dispatch(header)
+            except Exception as e:
+                print(f"✗ Embedding sidecar error on {header.get('op')}: {e}")
+                response, payload = {"error": str(e)}, b""
+            try:
+                send_message(self.request, response, payload)
+            except OSError:
+                return
+
+    def finish(self) -> None:
+        # Each connection has its own thread and so its own DB connection; don't leak them
+        from django.db import connections
+        connections.close_all()
+
+
+class SidecarServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Threaded Unix socket server around the process's embedding function"""
+
+    daemon_threads = True
+    # Every thread of every web worker holds a connection; the default backlog of 5 refuses bursts
+    request_queue_size = 1024
+
+    def __init__(self, socket_path: str, embeddings: Embeddings):
+        if os.path.exists(socket_path):
+            # Left behind by a sidecar that did not shut down cleanly
+            os.unlink(socket_path)
+        self.embeddings = embeddings
+        self.started = time.time()
+        self.counts = {"queries": 0, "documents": 0, "requests": 0}
+        self.counts_lock = threading.Lock()
+        super().__init__(socket_path, SidecarHandler)
+        os.chmod(socket_path, 0o660)
+
+    def _count(self, name: Optional[str] = None, amount: int = 1) -> None:
+        with self.counts_lock:
+            self.counts["requests"] += 1
+            if name:
+                self.counts[name] += amount
+
+    def dispatch(self, header: Dict[str, Any]) -> Tuple[Dict[str, Any], bytes]:
+        from .langgraph import chatbot
+
+        op = header.get("op")
+        if op == "embed_query":
+            self._count("queries")
+            return encode_vectors([self.embeddings.embed_query(header["text"])])
+        if op == "embed_documents":
+            self._count("documents", len(header["texts"]))
+            return encode_vectors(self.embeddings.embed_documents(header["texts"]))
+        if op == "sync_corpus":
+            # Serialized by the sidecar's corpus lock: one writer however many workers ask
+            self._count()
+            return {"loaded": chatbot.load_documents_from_data_folder()}, b""
+        if op == "ingest":
+            from .ingest_worker import start_background_ingestion
+            self._count()
+            start_background_ingestion()
+            return {"started": True}, b""
+        if op == "delete_uploads":
+            self._count()
+            chatbot.delete_user_uploads(str(header["user_id"]))
+            return {"deleted": True}, b""
+        if op == "stats":
+            stats = getattr(self.embeddings, "stats", None)
+            with self.counts_lock:
+                counts = dict(self.counts)
+            return {
+                "pid": os.getpid(),
+                "uptime_seconds": round(time.time() - self.started, 1),
+                **counts,
+                "batching": stats() if stats else None,
+            }, b""
+        raise ValueError(f"Unknown op {op!r}")
+
@@ -0,0 +1,151 @@
+"""Single-pass recursive text splitter working on character offsets.
+
+Produces the same chunks as LangChain's RecursiveCharacterTextSplitter with
+its defaults (separators "\\n\\n", "\\n", " ", "", separators kept at the start
+of each piece, whitespace stripped). The difference is in how it gets there.
+Each separator's occurrences in a page are found once, in one C-level scan,
+and every recursion level then works on (start, end) offsets into the page
+found by bisecting those lists. The only strings built are the final chunks.
+LangChain instead re-splits the text into new substrings at every level and
+joins them back together for every chunk.
+
+Like the original, it measures chunks with any length function;
+``ingestion.make_splitter`` passes a tiktoken counter to size chunks in tokens.
+Pages are split lazily, so a stream of pages yields chunks as they are produced.
+
+    python benchmarks/bench_splitter.py    # equivalence check and MB/s on ./data
+"""
+import re
+from bisect import bisect_left
+from itertools import accumulate
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.documents import Document
+
+DEFAULT_SEPARATORS = ("\n\n", "\n", " ", "")
+
+
+class _Page:
+    """One text plus the lazily computed occurrence offsets of each separator"""
+
+    __slots__ = ("text", "_offsets")
+
+    def __init__(self, text: str):
+        self.text = text
+        self._offsets: Dict[str, List[int]] = {}
+
+    def offsets(self, separator: str) -> List[int]:
+        found = self._offsets.get(separator)
+        if found is None:
+            # str.split finds the same non-overlapping matches as re.split; each match starts
+            # where the text before it ends, so the offsets are a running sum of piece lengths
+            step = len(separator)
+            pieces = self.text.split(separator)
+            found = list(accumulate(map(step.__add__, map(len, pieces[:-1])), initial=-step))
+            del found[0]
+            self._offsets[separator] = found
+        return found
+
+    def cuts(self, separator: str, start: int, end: int) -> List[int]:
+        """Offsets where re.split(separator) would cut text[start:end]"""
+        offsets = self.offsets(separator)
+        first = bisect_left(offsets, start)
+        if first and offsets[first - 1] + len(separator) > start:
+            # A match straddles start, so the range's own scan may pair characters differently
+            return [start + match.start() for match in re.finditer(re.escape(separator), self.text[start:end])]
+        last = bisect_left(offsets, end - len(separator) + 1, first)
+        return offsets[first:last]
+
+
+class FastTextSplitter:
+    """Drop-in for RecursiveCharacterTextSplitter's split_text / split_documents"""
+
+    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200,
+                 length_function: Optional[Callable[[str], int]] = None,
+                 separators: Sequence[str] = DEFAULT_SEPARATORS):
+        if chunk_size <= 0:
+            raise ValueError(f"chunk_size must be > 0, got {chunk_size}")
+        if not 0 <= chunk_overlap <= chunk_size:
+            raise ValueError(f"chunk_overlap must be between 0 and chunk_size, got {chunk_overlap}")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        # None measures in characters straight from the offsets, without slicing
+        self.length_function = length_function
+        self.separators = tuple(separators)
+
+    def _merge(self, text: str, bounds: List[int], lengths: List[int], first: int, stop: int) -> Iterator[str]:
+        """Pack pieces first..stop-1 into chunks with overlap, as TextSplitter._merge_splits does.
+
+        Piece i is text[bounds[i]:bounds[i + 1]]; pieces are contiguous, so a
+        chunk is one slice of the page.
+        """
+        chunk_size, chunk_overlap = self.chunk_size, self.chunk_overlap
+        head = first  # first piece of the chunk being built
+        total = 0
+        for index in range(first, stop):
+            length = lengths[index]
+            if total + length > chunk_size and head < index:
+                chunk = text[bounds[head]:bounds[index]].strip()
+                if chunk:
+                    yield chunk
+                # Drop pieces from the front until what is left fits the overlap
+                while total > chunk_overlap or (total + length > chunk_size and total > 0):
+                    total -= lengths[head]
+                    head += 1
+            total += length
+        if head < stop:
+            chunk = text[bounds[head]:bounds[stop]].strip()
+            if chunk:
+                yield chunk
+
+    def _split(self, page: _Page, start: int, end: int, separators: Tuple[str, ...]) -> Iterator[str]:
+        text = page.text
+        separator, remaining = separators[-1], ()
+        for i, candidate in enumerate(separators):
+            if not candidate:
+                separator = candidate
+                break
+            if text.find(candidate, start, end) != -1:
+                separator, remaining = candidate, separators[i + 1:]
+                break
+
+        # Pieces are text[bounds[i]:bounds[i + 1]], each starting with its separator
+        if separator:
+            bounds = [start, *page.cuts(separator, start, end), end]
+            if bounds[1] == start:
+                # Only the first piece can be empty, when the range starts with the separator
+                del bounds[0]
+        else:
+            bounds = list(range(start, end + 1))
+        if self.length_function is None:
+            lengths = [b - a for a, b in zip(bounds, bounds[1:])]
+        else:
+            lengths = [self.length_function(text[a:b]) for a, b in zip(bounds, bounds[1:])]
+
+        chunk_size = self.chunk_size
+        first = 0
+        for index in [i for i, length in enumerate(lengths) if length >= chunk_size]:
+            if first < index:
+                yield from self._merge(text, bounds, lengths, first, index)
+            if remaining:
+                yield from self._split(page, bounds[index], bounds[index + 1], remaining)
+            else:
+                yield text[bounds[index]:bounds[index + 1]]
+            first = index + 1
+        if first < len(lengths):
+            yield from self._merge(text, bounds, lengths, first, len(lengths))
+
+    def iter_text(self, text: str) -> Iterator[str]:
+        return self._split(_Page(text), 0, len(text), self.separators)
+
+    def split_text(self, text: str) -> List[str]:
+        return list(self.iter_text(text))
+
+    def iter_documents(self, documents: Iterable[Document]) -> Iterator[Document]:
+        """Chunks of a stream of pages, yielded as each page is split"""
+        for document in documents:
+            for chunk in self.iter_text(document.page_content):
+                yield Document(page_content=chunk, metadata=dict(document.metadata))
+
+    def split_documents(self, documents: Iterable[Document]) -> List[Document]:
+        return list(self.iter_documents(documents))
@@ -0,0 +1,140 @@
+"""Versioned, self-contained vector index snapshots built ahead of a deploy.
+
+``manage.py build_index`` embeds the data folder and every upload into a new
+directory under CHATBOT_INDEX_DIR, one store per scope, laid out like the live
+``chroma_db/`` or ``numpy_db/``. Next to the stores it writes snapshot.json
+with each scope's catalog entries, chunk count and a digest of its chunks.
+Setting CHATBOT_INDEX_SNAPSHOT to a version (or ``current``, the one named in
+CURRENT) makes workers open their stores from a copy of that directory under
+live/, made once per version by whichever process attaches it first. The
+snapshot itself stays read-only, so it can be verified or attached again. When
+the copy is made, the catalog is loaded from snapshot.json, so the first
+request is served warm and nothing is re-embedded.
+"""
+import hashlib
+import json
+import os
+import shutil
+import uuid
+from collections import Counter
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from django.utils import timezone
+
+try:
+    import fcntl
+except ImportError:  # Windows: locking is per-process only
+    fcntl = None
+
+SNAPSHOT_MANIFEST = "snapshot.json"
+CURRENT_FILE = "CURRENT"
+# Writable copies of attached snapshots, one per version
+LIVE_DIR = "live"
+# Chunks fetched from Chroma per page when hashing a collection
+CHROMA_PAGE_SIZE = 1000
+
+
+def new_version() -> str:
+    """Sortable, unique snapshot name: build time plus a random suffix"""
+    return f"{timezone.now().strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+
+def current_version(root: str) -> Optional[str]:
+    try:
+        with open(os.path.join(root, CURRENT_FILE), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def resolve(root: str, name: str) -> Optional[str]:
+    """Directory of a snapshot version or "current"; None if there is none"""
+    version = current_version(root) if name == "current" else name
+    if not version:
+        return None
+    path = os.path.join(root, version)
+    return path if os.path.exists(os.path.join(path, SNAPSHOT_MANIFEST)) else None
+
+
+def activate(root: str, version: str) -> None:
+    """Point CURRENT at a version; workers started with "current" attach it"""
+    path = os.path.join(root, CURRENT_FILE)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        f.write(version + "\n")
+    os.replace(f"{path}.tmp", path)
+
+
+def live_copy(root: str, path: str, on_create: Optional[Callable[[], None]] = None) -> str:
+    """Writable copy of the snapshot at path, created (then on_create run) if it does not exist yet"""
+    live_root = os.path.join(root, LIVE_DIR)
+    os.makedirs(live_root, exist_ok=True)
+    live_path = os.path.join(live_root, os.path.basename(os.path.normpath(path)))
+    with open(f"{live_path}.lock", "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        if os.path.exists(live_path):
+            return live_path
+        # Other workers wait on the lock, and a crash leaves no half-copied directory behind
+        tmp_path = f"{live_path}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        try:
+            shutil.copytree(path, tmp_path)
+            if on_create is not None:
+                on_create()
+        except BaseException:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+        os.replace(tmp_path, live_path)
+    return live_path
+
+
+def read_manifest(path: str) -> Dict[str, Any]:
+    with open(os.path.join(path, SNAPSHOT_MANIFEST), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_manifest(path: str, manifest: Dict[str, Any]) -> None:
+    with open(os.path.join(path, SNAPSHOT_MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+
+def iter_chunks(store) -> Iterator[Tuple[str, str, Dict[str, Any]]]:
+    """(id, content, metadata) of every chunk in a NumPy or Chroma store"""
+    if hasattr(store, "iter_chunks"):
+        yield from store.iter_chunks()
+        return
+    offset = 0
+    while True:
+        page = store._collection.get(include=["documents", "metadatas"], limit=CHROMA_PAGE_SIZE, offset=offset)
+        if not page["ids"]:
+            return
+        yield from zip(page["ids"], page["documents"], page["metadatas"])
+        offset += len(page["ids"])
+
+
+def summarize_store(store) -> Dict[str, Any]:
+    """Chunk count, order-independent digest of IDs and text, and chunks per file hash"""
+    entries, per_file = [], Counter()
+    for chunk_id, content, metadata in iter_chunks(store):
+        entries.append(f"{chunk_id}:{hashlib.sha256(content.encode('utf-8')).hexdigest()}")
+        per_file[(metadata or {}).get("file_hash", "")] += 1
+    digest = hashlib.sha256("\n".join(sorted(entries)).encode("utf-8")).hexdigest()
+    return {"chunk_count": len(entries), "digest": digest, "chunks_per_file": dict(per_file)}
+
+
+def verify_scope(name: str, expected: Dict[str, Any], store) -> List[str]:
+    """Problems found when checking one scope's store against its manifest entry"""
+    problems = []
+    actual = summarize_store(store)
+    if actual["chunk_count"] != expected["chunk_count"]:
+        problems.append(f"{name}: {actual['chunk_count']} chunks, manifest says {expected['chunk_count']}")
+    if actual["digest"] != expected["digest"]:
+        problems.append(f"{name}: chunk digest does not match the manifest")
+    recorded = Counter()
+    for file in expected["files"]:
+        recorded[file["file_hash"]] += file["chunk_count"]
+    if Counter(actual["chunks_per_file"]) != recorded:
+        problems.append(f"{name}: chunks per file do not match the catalog entries")
+    if hasattr(store, "check_vectors"):
+        problems.extend(f"{name}: {problem}" for problem in store.check_vectors())
+    return problems
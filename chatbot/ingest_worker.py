@@ -0,0 +1,185 @@
+"""Database-backed background ingestion of UploadedDocument rows.
+
+Pending uploads are claimed with an atomic status update, parsed, embedded
+into the owner's vector store and marked processed with chunk counts and
+timings. No broker is involved: the table is the queue, so a web process
+thread and the ``process_uploads`` command can drain it side by side.
+"""
+import threading
+import time
+from datetime import timedelta
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import catalog
+from .ingestion import iter_splits
+from .embedding_sidecar import SidecarEmbeddings
+from .langgraph import chatbot, file_sha256, get_embeddings, splitter_options
+from .models import UploadedDocument
+
+_worker_lock = threading.Lock()
+_worker_thread = None
+
+
+def claimable_documents():
+    """Pending uploads, plus ones whose worker died mid-processing"""
+    stale_before = timezone.now() - timedelta(seconds=settings.CHATBOT_INGEST_STALE_SECONDS)
+    return UploadedDocument.objects.filter(
+        Q(status=UploadedDocument.STATUS_PENDING)
+        | Q(status=UploadedDocument.STATUS_PROCESSING, started_at__lt=stale_before)
+    )
+
+
+def claim_next_document() -> Optional[UploadedDocument]:
+    """Atomically move the oldest claimable upload to processing and return it"""
+    candidate_ids = list(claimable_documents().order_by('uploaded_at').values_list('id', flat=True)[:10])
+    for document_id in candidate_ids:
+        claimed = claimable_documents().filter(id=document_id).update(
+            status=UploadedDocument.STATUS_PROCESSING,
+            started_at=timezone.now(),
+        )
+        if claimed:
+            return UploadedDocument.objects.get(id=document_id)
+    return None
+
+
+def timed(iterable: Iterable, totals: List[float]) -> Iterator:
+    """Yield from iterable, adding the time spent producing each item to totals[0]"""
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            totals[0] += time.perf_counter() - start
+        yield item
+
+
+def embed_upload(document: UploadedDocument) -> Tuple[str, List[str], float]:
+    """Parse and embed one upload into its owner's vector store, batch by batch.
+
+    Returns the file hash, the chunk IDs written and the seconds spent parsing;
+    the document row and the catalog are left to the caller.
+    """
+    user_id = str(document.user_id)
+    file_path = document.file.path
+    file_hash = file_sha256(file_path)
+    parse_seconds = [0.0]
+    batches = iter_splits(file_path, batch_size=settings.CHATBOT_INGEST_BATCH_SIZE, **splitter_options())
+    chunk_ids = []
+    with chatbot.lease_user_vector_store(user_id) as vector_store:
+        try:
+            chatbot.add_split_batches(vector_store, timed(batches, parse_seconds),
+                                      f"upload:{document.id}", file_hash, {
+                                          "user_id": user_id,
+                                          "file_name": document.file_name,
+                                          "file_hash": file_hash,
+                                          "source": "upload",
+                                          "document_id": document.id,
+                                          "loaded_at": str(timezone.now()),
+                                      }, chunk_ids)
+        except BaseException:
+            # Half a file must not stay searchable while its upload is marked failed
+            if chunk_ids:
+                vector_store.delete(ids=chunk_ids)
+            raise
+    return file_hash, chunk_ids, parse_seconds[0]
+
+
+def discard_chunks(user_id: str, chunk_ids: List[str]) -> None:
+    """Remove the chunks of an upload whose row no longer exists"""
+    if not chunk_ids:
+        return
+    try:
+        with chatbot.lease_user_vector_store(user_id) as vector_store:
+            vector_store.delete(ids=chunk_ids)
+    except Exception as e:
+        print(f"✗ Error discarding {len(chunk_ids)} chunks for user {user_id}: {e}")
+
+
+def process_document(document: UploadedDocument) -> None:
+    """Ingest one upload and record the outcome on the document and in the catalog"""
+    user_id = str(document.user_id)
+    file_hash, chunk_ids = '', []
+    try:
+        start = time.perf_counter()
+        file_hash, chunk_ids, parse_seconds = embed_upload(document)
+        total = time.perf_counter() - start
+
+        document.status = UploadedDocument.STATUS_DONE
+        document.processed = True
+        document.chunk_count = len(chunk_ids)
+        document.error = ''
+        # Parsing and embedding interleave; each is the total time spent in it
+        document.parse_seconds = parse_seconds
+        document.embed_seconds = total - parse_seconds
+        print(f"✓ Ingested upload {document.file_name} for user {user_id}: {len(chunk_ids)} chunks "
+              f"(parse {document.parse_seconds:.2f}s, embed {document.embed_seconds:.2f}s)")
+    except Exception as e:
+        document.status = UploadedDocument.STATUS_FAILED
+        document.error = str(e)
+        print(f"✗ Error ingesting upload {document.file_name}: {e}")
+
+    document.processed_at = timezone.now()
+    try:
+        with transaction.atomic():
+            document.save(update_fields=[
+                'status', 'processed', 'chunk_count', 'error', 'processed_at', 'parse_seconds', 'embed_seconds',
+            ])
+    except DatabaseError as e:
+        # Deleted while it was being ingested (delete_chat_history); keep nothing of it
+        print(f"✗ Upload {document.file_name} was deleted during ingestion, discarding its chunks: {e}")
+        discard_chunks(user_id, chunk_ids)
+        return
+
+    # Recorded only once the row says done, so the catalog never lists a file that failed or is gone
+    if document.status == UploadedDocument.STATUS_DONE:
+        key = f"upload:{document.id}"
+        catalog.record_file(user_id, key, document.file_name, file_hash, "upload", len(chunk_ids))
+        if not UploadedDocument.objects.filter(id=document.id).exists():
+            catalog.remove_files(user_id, keys=[key])
+            discard_chunks(user_id, chunk_ids)
+
+
+def process_pending_uploads(limit: Optional[int] = None) -> int:
+    """Drain the queue (up to limit documents); returns how many were processed"""
+    processed = 0
+    while limit is None or processed < limit:
+        document = claim_next_document()
+        if document is None:
+            break
+        process_document(document)
+        processed += 1
+    return processed
+
+
+def _drain_in_background() -> None:
+    try:
+        process_pending_uploads()
+    finally:
+        # Threads get their own DB connections; don't leak them
+        connections.close_all()
+
+
+def start_background_ingestion() -> None:
+    """Drain pending uploads on a daemon thread unless one is already running"""
+    global _worker_thread
+    embeddings = get_embeddings()
+    if isinstance(embeddings, SidecarEmbeddings):
+        # The sidecar owns ingestion; the rows stay pending if it cannot be reached
+        try:
+            embeddings.request("ingest")
+        except Exception as e:
+            print(f"✗ Error handing uploads to the embedding sidecar: {e}")
+        return
+    with _worker_lock:
+        if _worker_thread is not None and _worker_thread.is_alive():
+            return
+        _worker_thread = threading.Thread(target=_drain_in_background, name="upload-ingestion", daemon=True)
+        _worker_thread.start()
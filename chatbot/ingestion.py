@@ -0,0 +1,130 @@
+"""Document parsing and chunking for ingestion.
+
+This module deliberately avoids Django imports so it can run inside spawned
+worker processes. Pages are streamed through the splitter one at a time and
+chunks are handed to the caller in batches as they are produced, so a large
+PDF never sits in memory as a whole. Files parsed in the process pool come
+back as one list each instead (results cross the process boundary per file).
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+# Chunks handed to the caller at a time when a file is split in-process
+BATCH_SIZE = 256
+
+SUPPORTED_EXTENSIONS = ('.pdf', '.docx', '.txt')
+
+
+def get_loader(file_path: str):
+    """Return a document loader for a supported file, or None"""
+    from langchain_community.document_loaders import PyPDFLoader, TextLoader, Docx2txtLoader
+    filename = file_path.lower()
+    if filename.endswith('.pdf'):
+        return PyPDFLoader(file_path)
+    elif filename.endswith('.docx'):
+        return Docx2txtLoader(file_path)
+    elif filename.endswith('.txt'):
+        return TextLoader(file_path)
+    return None
+
+
+def chunking_signature(chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP,
+                       token_encoding: Optional[str] = None) -> str:
+    """What chunk boundaries depend on; files indexed under another signature must be re-split"""
+    if token_encoding:
+        return f"tokens:{token_encoding}:{chunk_size}:{chunk_overlap}"
+    return f"chars:{chunk_size}:{chunk_overlap}"
+
+
+def make_splitter(chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP,
+                  splitter: str = "fast", token_encoding: Optional[str] = None):
+    """Text splitter by name; sizes are tokens of token_encoding if given, else characters.
+
+    "fast" (FastTextSplitter) and "recursive" (LangChain) produce identical
+    chunks for the same sizes; "fast" is the single-pass offset version.
+    """
+    length_function = None
+    if token_encoding:
+        from .context_packer import count_tokens
+        length_function = lambda text: count_tokens(text, token_encoding)
+    if splitter == "fast":
+        from .fast_splitter import FastTextSplitter
+        return FastTextSplitter(chunk_size, chunk_overlap, length_function=length_function)
+    if splitter == "recursive":
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+        return RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+                                              length_function=length_function or len)
+    raise ValueError(f"Unknown splitter {splitter!r} (expected 'fast' or 'recursive')")
+
+
+def iter_splits(file_path: str, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP,
+                splitter: str = "fast", token_encoding: Optional[str] = None,
+                batch_size: int = BATCH_SIZE) -> Iterator[List[Document]]:
+    """Parse a file page by page and yield its chunks in batches of up to batch_size as they are split"""
+    loader = get_loader(file_path)
+    text_splitter = make_splitter(chunk_size, chunk_overlap, splitter, token_encoding)
+    batch = []
+    for page in loader.lazy_load():
+        for split in text_splitter.split_documents([page]):
+            batch.append(split)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def parse_file(file_path: str, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP,
+               splitter: str = "fast", token_encoding: Optional[str] = None) -> List[Document]:
+    """Every chunk of a file in one list; used where results must be pickled back from a worker"""
+    return [split for batch in iter_splits(file_path, chunk_size, chunk_overlap, splitter, token_encoding)
+            for split in batch]
+
+
+def _parse_file_safe(file_path: str, chunk_size: int, chunk_overlap: int, splitter: str,
+                     token_encoding: Optional[str]) -> Tuple[str, Optional[List[Document]], Optional[str]]:
+    try:
+        return file_path, parse_file(file_path, chunk_size, chunk_overlap, splitter, token_encoding), None
+    except Exception as e:
+        return file_path, None, str(e)
+
+
+def parse_files(file_paths: List[str], max_workers: int = 1, chunk_size: int = CHUNK_SIZE,
+                chunk_overlap: int = CHUNK_OVERLAP, splitter: str = "fast", token_encoding: Optional[str] = None,
+                batch_size: int = BATCH_SIZE) -> Iterator[Tuple[str, Optional[Iterable[List[Document]]], Optional[str]]]:
+    """Yield (file_path, batches of splits, error) for each file.
+
+    With one worker, each file's batches are produced lazily while the caller
+    iterates them, so parse errors are raised from that iteration. With more,
+    files are parsed across a spawned process pool (forking a threaded web
+    worker is unsafe) and each arrives as a single batch once parsed. At most
+    two files per worker are in flight, so memory is bounded by the pool size,
+    not the corpus.
+    """
+    if max_workers <= 1 or len(file_paths) <= 1:
+        for file_path in file_paths:
+            yield file_path, iter_splits(file_path, chunk_size, chunk_overlap, splitter, token_encoding, batch_size), None
+        return
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as executor:
+        remaining = iter(file_paths)
+        in_flight = set()
+        while True:
+            while len(in_flight) < max_workers * 2:
+                file_path = next(remaining, None)
+                if file_path is None:
+                    break
+                in_flight.add(executor.submit(_parse_file_safe, file_path, chunk_size, chunk_overlap,
+                                               splitter, token_encoding))
+            if not in_flight:
+                return
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                file_path, splits, error = future.result()
+                yield file_path, None if error else [splits], error
@@ -1,200 +1,619 @@
 import os
 import time
-from typing import List, Dict, Any, Annotated
+import json
+import hashlib
+from typing import List, Dict, Any, Annotated, ContextManager, Iterable, Iterator, AsyncIterator, Optional, TYPE_CHECKING
+import asyncio
+import threading
 import uuid
+from contextlib import ExitStack
 from dotenv import load_dotenv
-from langchain_groq import ChatGroq
 from langchain_core.documents import Document
-from langchain_community.document_loaders import PyPDFLoader, TextLoader, Docx2txtLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_chroma import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
-from langgraph.graph import StateGraph, END
-from langgraph.graph.message import add_messages
 from typing_extensions import TypedDict
+from django.conf import settings
 from django.utils import timezone
+from .ingestion import CHUNK_OVERLAP, CHUNK_SIZE, SUPPORTED_EXTENSIONS, chunking_signature, parse_files
+from .store_pool import StorePool
+from .numpy_store import NumpyVectorStore
+from .answer_cache import SemanticAnswerCache, context_key, stream_pieces
+from .retrieval_cache import RetrievalCache
+from .context_packer import pack_context, count_message_tokens
+from .router import RETRIEVE, route, route_stats
+from .llm_gateway import LLMGateway
+from .embedding_sidecar import SidecarEmbeddings
+from . import catalog, index_snapshot
+
+if TYPE_CHECKING:
+    from langchain_chroma import Chroma
+    from langchain_core.embeddings import Embeddings
+    from langchain_core.runnables import RunnableConfig
+    from langchain_groq import ChatGroq
 
 load_dotenv()
 
-# Initialize LLM
-llm = ChatGroq(
-    groq_api_key=os.getenv("GROQ_API_KEY"),
-    model_name="openai/gpt-oss-120b"
-)
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+# Heavy clients (Groq, MiniLM) are created on first use, not at import time,
+# so management commands never pay for them. Call chatbot.warm_up() on worker boot.
+_llm = None
+_embeddings = None
+_models_lock = threading.Lock()
+
 
-# Initialize embeddings
-embeddings = HuggingFaceEmbeddings(
-    model_name="sentence-transformers/all-MiniLM-L6-v2"
+def get_llm() -> "ChatGroq":
+    """Return the shared LLM client, creating it on first use"""
+    global _llm
+    if _llm is None:
+        with _models_lock:
+            if _llm is None:
+                from langchain_groq import ChatGroq
+                _llm = ChatGroq(
+                    groq_api_key=os.getenv("GROQ_API_KEY"),
+                    model_name="openai/gpt-oss-120b",
+                    max_tokens=settings.CHATBOT_LLM_COMPLETION_TOKENS,  # the gateway never budgets past this
+                    max_retries=0  # llm_gateway retries, honouring Retry-After
+                )
+    return _llm
+
+
+# Every LLM call goes through this; see llm_gateway for budgets, coalescing and retries
+llm_gateway = LLMGateway(
+    get_llm,
+    requests_per_minute=settings.CHATBOT_LLM_REQUESTS_PER_MINUTE,
+    tokens_per_minute=settings.CHATBOT_LLM_TOKENS_PER_MINUTE,
+    completion_tokens=settings.CHATBOT_LLM_COMPLETION_TOKENS,
+    max_queue=settings.CHATBOT_LLM_MAX_QUEUE,
+    max_wait=settings.CHATBOT_LLM_MAX_WAIT_SECONDS,
+    max_retries=settings.CHATBOT_LLM_MAX_RETRIES,
+    encoding_name=settings.CHATBOT_TOKEN_ENCODING,
+    background_headroom=settings.CHATBOT_LLM_BACKGROUND_HEADROOM,
 )
 
+
+def get_embeddings(local: bool = False) -> "Embeddings":
+    """Return the shared embedding function, loading the model on first use.
+
+    With CHATBOT_EMBEDDING_SOCKET set, this is a client of the embedding sidecar
+    instead; the sidecar itself passes local=True on its first call.
+    """
+    global _embeddings
+    if _embeddings is None:
+        with _models_lock:
+            if _embeddings is None and settings.CHATBOT_EMBEDDING_SOCKET and not local:
+                _embeddings = SidecarEmbeddings(settings.CHATBOT_EMBEDDING_SOCKET)
+            if _embeddings is None:
+                from langchain_huggingface import HuggingFaceEmbeddings
+                from .embedding_cache import CachedEmbeddings
+                from .embedding_batcher import BatchingEmbeddings
+                embeddings = HuggingFaceEmbeddings(
+                    model_name=EMBEDDING_MODEL_NAME
+                )
+                if settings.CHATBOT_EMBEDDING_CACHE:
+                    # Reuse vectors for text this model has already embedded, across users and restarts
+                    embeddings = CachedEmbeddings(
+                        embeddings,
+                        EMBEDDING_MODEL_NAME,
+                        settings.CHATBOT_EMBEDDING_CACHE_DIR,
+                        max_entries=settings.CHATBOT_EMBEDDING_CACHE_MAX_ENTRIES
+                    )
+                if settings.CHATBOT_EMBEDDING_BATCHING:
+                    # Coalesce concurrent question embeddings into one forward pass
+                    embeddings = BatchingEmbeddings(
+                        embeddings,
+                        max_batch_size=settings.CHATBOT_EMBEDDING_BATCH_SIZE,
+                        max_wait=settings.CHATBOT_EMBEDDING_BATCH_MAX_WAIT_MS / 1000
+                    )
+                _embeddings = embeddings
+    return _embeddings
+
+
+def embedding_stats() -> Dict[str, Any]:
+    """Stats of each wrapper around this process's embedding model (batching, cache, sidecar)"""
+    from .embedding_batcher import BatchingEmbeddings
+    from .embedding_cache import CachedEmbeddings
+    names = {BatchingEmbeddings: "batching", CachedEmbeddings: "cache", SidecarEmbeddings: "sidecar"}
+    stats = {}
+    # Not loaded yet: report nothing rather than loading the model for a stats call
+    embeddings = _embeddings
+    while embeddings is not None:
+        name = names.get(type(embeddings))
+        if name:
+            try:
+                stats[name] = embeddings.stats()
+            except Exception as e:
+                stats[name] = {"error": str(e)}
+        embeddings = getattr(embeddings, "underlying", None)
+    return stats
+
+
+def merge_messages(left, right):
+    """Reducer for GraphState.messages; defers importing langgraph until a graph runs"""
+    from langgraph.graph.message import add_messages
+    return add_messages(left, right)
+
+
+MANIFEST_FILENAME = "ingest_manifest.json"
+
+# The data folder corpus is embedded once into this collection and shared by all users
+SHARED_SCOPE = "shared"
+SHARED_COLLECTION_NAME = "shared_corpus"
+
+
+def file_sha256(file_path: str) -> str:
+    """Content hash of a file, read in blocks"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_id(file_name: str, file_hash: str, index: int) -> str:
+    """Deterministic ID for the index-th chunk of a given file version"""
+    return hashlib.sha256(f"{file_name}:{file_hash}:{index}".encode("utf-8")).hexdigest()
+
+
+def splitter_options() -> Dict[str, Any]:
+    """parse_file / parse_files keyword arguments for the configured splitter and chunk unit"""
+    if settings.CHATBOT_CHUNK_UNIT == "tokens":
+        return {
+            "chunk_size": settings.CHATBOT_CHUNK_TOKENS,
+            "chunk_overlap": settings.CHATBOT_CHUNK_OVERLAP_TOKENS,
+            "splitter": settings.CHATBOT_SPLITTER,
+            "token_encoding": settings.CHATBOT_TOKEN_ENCODING,
+        }
+    return {"chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP, "splitter": settings.CHATBOT_SPLITTER}
+
+
+def current_chunking() -> str:
+    options = splitter_options()
+    return chunking_signature(options["chunk_size"], options["chunk_overlap"], options.get("token_encoding"))
+
+
 # Define state
 class GraphState(TypedDict):
-    messages: Annotated[List[Dict], add_messages]
+    messages: Annotated[List[Dict], merge_messages]
     user_id: str
     question: str
     context: str
     documents: List[Document]
+    question_embedding: Optional[List[float]]
+    summary: str
+    history: List[Dict]
     response: str
 
 class DocumentAwareChatbot:
     def __init__(self):
-        self.vector_stores = {}  # user_id -> Chroma vector store
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200
+        self.stores_lock = threading.RLock()  # Chroma clients must not be created concurrently
+        # Data folder corpus, embedded once for everyone; pooled so it is swapped like user stores
+        self.shared_store = StorePool(
+            lambda scope: self.open_vector_store(SHARED_SCOPE, SHARED_COLLECTION_NAME),
+            max_size=1,
+            idle_seconds=float("inf"),
+            lock=self.stores_lock,
+            version=lambda scope: catalog.get_snapshot(scope)['version']
         )
+        # user_id -> Chroma vector store (per-user uploads), bounded with idle eviction
+        self.vector_stores = StorePool(
+            self._open_user_vector_store,
+            max_size=settings.CHATBOT_VECTOR_STORE_POOL_SIZE,
+            idle_seconds=settings.CHATBOT_VECTOR_STORE_IDLE_SECONDS,
+            lock=self.stores_lock,
+            # Reopened when another process (upload drainer, sidecar) has written the scope since
+            version=lambda scope: catalog.get_snapshot(scope)['version']
+        )
+        # Prebuilt snapshot (manage.py build_index) to start from when one is configured; never written
+        self.index_snapshot = self.resolve_index_snapshot()
+        # Directory stores are opened from instead of the live ones: the snapshot's writable copy once
+        # attached, or a snapshot being built or verified
+        self.index_root = None
         self.data_folder = "./data"  # Path to your data folder
-        self.documents_loaded = {}  # Track which users have documents loaded
+        self.corpus_loaded = False  # Whether the data folder has been synced this process
+        self.corpus_lock = threading.Lock()
+        self.llm_semaphore = None  # Created lazily inside the running event loop
+        self.agent = None  # Compiled once per process by get_agent()
+        self.agent_lock = threading.Lock()
+        # Answers reused for near-identical questions over the same retrieved context
+        self.answer_cache = SemanticAnswerCache(
+            max_entries=settings.CHATBOT_ANSWER_CACHE_MAX_ENTRIES,
+            ttl_seconds=settings.CHATBOT_ANSWER_CACHE_TTL_SECONDS,
+            threshold=settings.CHATBOT_ANSWER_CACHE_THRESHOLD
+        )
+        # Question embeddings and retrieval results for repeated questions
+        self.retrieval_cache = RetrievalCache(
+            EMBEDDING_MODEL_NAME,
+            max_embeddings=settings.CHATBOT_RETRIEVAL_CACHE_MAX_ENTRIES,
+            max_results=settings.CHATBOT_RETRIEVAL_CACHE_MAX_ENTRIES,
+            shared_alias=settings.CHATBOT_RETRIEVAL_CACHE_ALIAS or None,
+            shared_timeout=settings.CHATBOT_RETRIEVAL_CACHE_TIMEOUT
+        )
     
-    def get_user_vector_store(self, user_id: str) -> Chroma:
-        """Get or create vector store for a user"""
-        if user_id not in self.vector_stores:
-            # Create a unique collection name for each user
-            collection_name = f"user_{user_id}"
-            self.vector_stores[user_id] = Chroma(
-                collection_name=collection_name,
-                embedding_function=embeddings,
-                persist_directory=f"./chroma_db/{user_id}"
+    def resolve_index_snapshot(self) -> Optional[str]:
+        """Directory of the configured index snapshot, checked against this process's settings"""
+        if not settings.CHATBOT_INDEX_SNAPSHOT:
+            return None
+        from django.core.exceptions import ImproperlyConfigured
+        path = index_snapshot.resolve(settings.CHATBOT_INDEX_DIR, settings.CHATBOT_INDEX_SNAPSHOT)
+        if path is None:
+            raise ImproperlyConfigured(
+                f"Index snapshot {settings.CHATBOT_INDEX_SNAPSHOT!r} not found in {settings.CHATBOT_INDEX_DIR}")
+        manifest = index_snapshot.read_manifest(path)
+        expected = (settings.CHATBOT_VECTOR_BACKEND, EMBEDDING_MODEL_NAME)
+        if (manifest["backend"], manifest["embedding_model"]) != expected:
+            raise ImproperlyConfigured(
+                f"Index snapshot {manifest['version']} was built for {manifest['backend']} with "
+                f"{manifest['embedding_model']}, not {expected[0]} with {expected[1]}")
+        return path
+    
+    def attach_index_snapshot(self) -> None:
+        """Open stores from the snapshot's live copy; the first process to make it loads the snapshot's catalog"""
+        with self.stores_lock:
+            if self.index_root is not None:
+                return
+            manifest = index_snapshot.read_manifest(self.index_snapshot)
+            
+            def import_catalog():
+                # Only for a fresh copy: later uploads and syncs into it are already in the catalog
+                for scope, info in manifest["scopes"].items():
+                    catalog.import_files(scope, info["files"])
+            
+            self.index_root = index_snapshot.live_copy(settings.CHATBOT_INDEX_DIR, self.index_snapshot, import_catalog)
+        print(f"✓ Attached index snapshot {manifest['version']}: "
+              f"{sum(info['chunk_count'] for info in manifest['scopes'].values())} chunks in {len(manifest['scopes'])} scopes")
+    
+    def get_persist_directory(self, scope: str) -> str:
+        """Directory holding a collection (a user ID or SHARED_SCOPE) and its manifest"""
+        if self.index_snapshot and self.index_root is None:
+            self.attach_index_snapshot()
+        if self.index_root:
+            return os.path.join(self.index_root, scope)
+        if settings.CHATBOT_VECTOR_BACKEND == "numpy":
+            return f"./numpy_db/{scope}"
+        return f"./chroma_db/{scope}"
+    
+    def open_vector_store(self, scope: str, collection_name: str):
+        """Open a scope's store with the configured backend; caller holds stores_lock"""
+        if settings.CHATBOT_VECTOR_BACKEND == "numpy":
+            return NumpyVectorStore(
+                self.get_persist_directory(scope),
+                get_embeddings(),
+                dtype=settings.CHATBOT_NUMPY_DTYPE,
+                rerank_factor=settings.CHATBOT_NUMPY_RERANK_FACTOR
             )
-        return self.vector_stores[user_id]
+        from langchain_chroma import Chroma
+        return Chroma(
+            collection_name=collection_name,
+            embedding_function=get_embeddings(),
+            persist_directory=self.get_persist_directory(scope)
+        )
+    
+    def delete_by_source(self, vector_store, source: str) -> None:
+        """Delete every chunk with the given metadata source from a store"""
+        if isinstance(vector_store, NumpyVectorStore):
+            vector_store.delete_where("source", source)
+        else:
+            vector_store._collection.delete(where={"source": source})
+    
+    def get_shared_vector_store(self) -> "Chroma":
+        """Get or create the vector store shared by all users for the data folder"""
+        return self.shared_store.get(SHARED_SCOPE)
+    
+    def lease_shared_vector_store(self) -> ContextManager["Chroma"]:
+        """The shared store, kept open for the duration of a with block even if it is reopened"""
+        return self.shared_store.lease(SHARED_SCOPE)
+    
+    def get_user_vector_store(self, user_id: str) -> "Chroma":
+        """Get or create vector store for a user's own uploads"""
+        return self.vector_stores.get(user_id)
+    
+    def lease_user_vector_store(self, user_id: str) -> ContextManager["Chroma"]:
+        """A user's store, kept open for the duration of a with block even if the pool reopens it"""
+        return self.vector_stores.lease(user_id)
+    
+    def _open_user_vector_store(self, user_id: str) -> "Chroma":
+        """StorePool factory; called with stores_lock held"""
+        # Create a unique collection name for each user
+        return self.open_vector_store(user_id, f"user_{user_id}")
+    
+    def delete_user_uploads(self, user_id: str) -> None:
+        """Drop the chunks and catalog entries of a user's uploads, in the process that writes the stores"""
+        embeddings = get_embeddings()
+        if isinstance(embeddings, SidecarEmbeddings):
+            embeddings.request("delete_uploads", user_id=user_id)
+            # Our catalog snapshot predates the sidecar's delete; the pool reopens the store once it moves
+            catalog.invalidate(user_id)
+            return
+        with self.lease_user_vector_store(user_id) as vector_store:
+            self.delete_by_source(vector_store, "upload")
+        catalog.remove_files(user_id, source="upload")
+    
+    def add_split_batches(self, vector_store: "Chroma", batches: Iterable[List[Document]], file_key: str,
+                          file_hash: str, metadata: Dict[str, Any], chunk_ids: Optional[List[str]] = None) -> List[str]:
+        """Tag, embed and upsert chunks batch by batch as they are parsed; returns the chunk IDs written.
+
+        IDs are appended to chunk_ids as each batch lands, so a caller can undo a write that fails partway.
+        """
+        batch_size = settings.CHATBOT_INGEST_BATCH_SIZE
+        chunk_ids = [] if chunk_ids is None else chunk_ids
+        for batch in batches:
+            # Files parsed in the process pool arrive as one batch; keep each write bounded anyway
+            for start in range(0, len(batch), batch_size):
+                splits = batch[start:start + batch_size]
+                for split in splits:
+                    split.metadata.update(metadata)
+                ids = [chunk_id(file_key, file_hash, len(chunk_ids) + i) for i in range(len(splits))]
+                vector_store.add_documents(splits, ids=ids)
+                chunk_ids.extend(ids)
+        return chunk_ids
     
-    def load_documents_from_data_folder(self, user_id: str) -> bool:
-        """Load all documents from the data folder for a user"""
+    def load_manifest(self, scope: str) -> Optional[Dict[str, Any]]:
+        """Load the ingestion manifest: file_name -> {hash, mtime, chunk_ids}"""
+        manifest_path = os.path.join(self.get_persist_directory(scope), MANIFEST_FILENAME)
+        if not os.path.exists(manifest_path):
+            return None
         try:
-            # Check if documents are already loaded for this user
-            if user_id in self.documents_loaded and self.documents_loaded[user_id]:
-                print(f"Documents already loaded for user {user_id}")
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"✗ Unreadable ingestion manifest for {scope}, rebuilding: {e}")
+            return None
+    
+    def save_manifest(self, scope: str, manifest: Dict[str, Any]) -> None:
+        """Atomically persist the ingestion manifest next to its collection"""
+        persist_directory = self.get_persist_directory(scope)
+        os.makedirs(persist_directory, exist_ok=True)
+        manifest_path = os.path.join(persist_directory, MANIFEST_FILENAME)
+        tmp_path = f"{manifest_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, manifest_path)
+    
+    def load_documents_from_data_folder(self) -> bool:
+        """Incrementally sync the data folder into the shared vector store.
+
+        Files are tracked in a persisted manifest by content hash and mtime, so
+        only new or changed files are embedded (upserted under deterministic
+        chunk IDs) and chunks of deleted files are removed.
+        """
+        if self.corpus_loaded:
+            return True
+        with self.corpus_lock:
+            if self.corpus_loaded:
                 return True
-            
+            if isinstance(get_embeddings(), SidecarEmbeddings):
+                return self._sync_through_sidecar(get_embeddings())
+            return self._sync_data_folder()
+    
+    def _sync_through_sidecar(self, sidecar: SidecarEmbeddings) -> bool:
+        """Have the sidecar sync the data folder, so only one process writes the shared store"""
+        try:
+            loaded = sidecar.request("sync_corpus", timeout=3600)[0]["loaded"]
+        except Exception as e:
+            print(f"✗ Error syncing data folder through the embedding sidecar: {e}")
+            return False
+        # Our catalog snapshot may predate what the sidecar just wrote; once the version moves the
+        # pool swaps in a new handle and closes the old one after in-flight searches finish
+        catalog.invalidate(SHARED_SCOPE)
+        self.corpus_loaded = loaded
+        return loaded
+    
+    def _sync_data_folder(self, update_catalog: bool = True) -> bool:
+        """Body of load_documents_from_data_folder; caller holds corpus_lock"""
+        try:
             if not os.path.exists(self.data_folder):
                 print(f"Data folder '{self.data_folder}' does not exist. Creating empty folder.")
                 os.makedirs(self.data_folder, exist_ok=True)
                 return False
             
-            all_splits = []
-            supported_files = []
+            with self.lease_shared_vector_store() as vector_store:
+                return self._sync_shared_store(vector_store, update_catalog)
+        except Exception as e:
+            print(f"✗ Error loading documents from data folder: {e}")
+            return False
+    
+    def _sync_shared_store(self, vector_store: "Chroma", update_catalog: bool = True) -> bool:
+        """Embed new and changed data folder files into the shared store and drop removed ones"""
+        manifest = self.load_manifest(SHARED_SCOPE)
+        if manifest is None:
+            # Chunks ingested before the manifest existed have random IDs; drop them once
+            self.delete_by_source(vector_store, "data_folder")
+            manifest = {}
+        
+        seen_files = set()
+        embedded_chunks = 0
+        chunking = current_chunking()
+        changed_files = {}  # file_path -> (filename, mtime, file_hash, previous entry)
+        
+        # Find new or changed files in the data folder
+        for filename in sorted(os.listdir(self.data_folder)):
+            file_path = os.path.join(self.data_folder, filename)
+            
+            if not os.path.isfile(file_path):
+                continue
             
-            # Process all files in the data folder
-            for filename in os.listdir(self.data_folder):
-                file_path = os.path.join(self.data_folder, filename)
-                
-                if os.path.isfile(file_path):
-                    # Determine loader based on file extension
-                    if filename.lower().endswith('.pdf'):
-                        loader = PyPDFLoader(file_path)
-                        supported_files.append(filename)
-                    elif filename.lower().endswith('.docx'):
-                        loader = Docx2txtLoader(file_path)
-                        supported_files.append(filename)
-                    elif filename.lower().endswith('.txt'):
-                        loader = TextLoader(file_path)
-                        supported_files.append(filename)
-                    else:
-                        print(f"Skipping unsupported file type: {filename}")
-                        continue
-                    
-                    try:
-                        print(f"Processing document: {filename}")
-                        documents = loader.load()
-                        splits = self.text_splitter.split_documents(documents)
-                        
-                        # Add metadata
-                        for split in splits:
-                            split.metadata["user_id"] = user_id
-                            split.metadata["file_name"] = filename
-                            split.metadata["source"] = "data_folder"
-                            split.metadata["loaded_at"] = str(timezone.now())
-                        
-                        all_splits.extend(splits)
-                        print(f"✓ Processed {filename}: {len(splits)} chunks")
-                        
-                    except Exception as e:
-                        print(f"✗ Error processing {filename}: {e}")
-                        continue
+            if not filename.lower().endswith(SUPPORTED_EXTENSIONS):
+                print(f"Skipping unsupported file type: {filename}")
+                continue
+            seen_files.add(filename)
             
-            if all_splits:
-                # Store in vector database
-                vector_store = self.get_user_vector_store(user_id)
-                vector_store.add_documents(all_splits)
-                self.documents_loaded[user_id] = True
-                print(f"✓ Successfully loaded {len(all_splits)} document chunks from {len(supported_files)} files for user {user_id}")
-                return True
-            else:
-                print("ℹ️ No supported documents found in data folder")
-                self.documents_loaded[user_id] = False
-                return False
+            entry = manifest.get(filename)
+            mtime = os.path.getmtime(file_path)
+            # Entries from before chunking was recorded used the default character sizes
+            same_chunking = entry and entry.get("chunking", chunking_signature()) == chunking
+            if same_chunking and entry["mtime"] == mtime:
+                continue
+            
+            file_hash = file_sha256(file_path)
+            if same_chunking and entry["hash"] == file_hash:
+                # Touched but unchanged: just refresh the recorded mtime
+                entry["mtime"] = mtime
+                continue
+            
+            changed_files[file_path] = (filename, mtime, file_hash, entry)
+        
+        # Parse changed files in parallel and write each one as soon as it is ready
+        for file_path, batches, error in parse_files(list(changed_files), max_workers=settings.CHATBOT_INGEST_WORKERS,
+                                                      batch_size=settings.CHATBOT_INGEST_BATCH_SIZE,
+                                                      **splitter_options()):
+            filename, mtime, file_hash, entry = changed_files[file_path]
+            if error:
+                print(f"✗ Error processing {filename}: {error}")
+                continue
+            
+            try:
+                chunk_ids = self.add_split_batches(vector_store, batches, filename, file_hash, {
+                    "file_name": filename,
+                    "file_hash": file_hash,
+                    "source": "data_folder",
+                    "loaded_at": str(timezone.now()),
+                })
+                # Drop the previous version's chunks only once the new ones are written
+                if entry and entry["chunk_ids"]:
+                    written = set(chunk_ids)
+                    stale = [old_id for old_id in entry["chunk_ids"] if old_id not in written]
+                    if stale:
+                        vector_store.delete(ids=stale)
                 
-        except Exception as e:
-            print(f"✗ Error loading documents from data folder: {e}")
-            self.documents_loaded[user_id] = False
+                manifest[filename] = {"hash": file_hash, "mtime": mtime, "chunk_ids": chunk_ids, "chunking": chunking}
+                embedded_chunks += len(chunk_ids)
+                print(f"✓ Processed {filename}: {len(chunk_ids)} chunks")
+                
+            except Exception as e:
+                print(f"✗ Error processing {filename}: {e}")
+                continue
+        
+        # Remove chunks of files that disappeared from the data folder
+        for filename in set(manifest) - seen_files:
+            chunk_ids = manifest.pop(filename)["chunk_ids"]
+            if chunk_ids:
+                vector_store.delete(ids=chunk_ids)
+            print(f"✓ Removed {filename}: {len(chunk_ids)} chunks")
+        
+        self.save_manifest(SHARED_SCOPE, manifest)
+        if update_catalog:
+            catalog.sync_files(SHARED_SCOPE, "data_folder", {
+                filename: {"file_name": filename, "file_hash": entry["hash"], "chunk_count": len(entry["chunk_ids"])}
+                for filename, entry in manifest.items()
+            })
+        
+        total_chunks = sum(len(entry["chunk_ids"]) for entry in manifest.values())
+        self.corpus_loaded = True
+        if total_chunks:
+            print(f"✓ Shared corpus synced: {embedded_chunks} chunks embedded, {total_chunks} chunks from {len(manifest)} files indexed")
+            return True
+        else:
+            print("ℹ️ No supported documents found in data folder")
             return False
     
-    def retrieve_relevant_documents(self, question: str, user_id: str, k: int = 3) -> List[Document]:
-        """Retrieve relevant documents from user's vector store, auto-load if empty"""
+    def start_corpus_sync(self) -> None:
+        """Sync the data folder on a daemon thread if it has not been synced yet"""
+        if self.corpus_loaded or self.corpus_lock.locked():
+            return
+        threading.Thread(target=self.load_documents_from_data_folder, name="corpus-sync", daemon=True).start()
+    
+    def has_documents(self, user_id: str) -> bool:
+        """Whether retrieval can return anything for this user (catalog lookup, no Chroma call)"""
+        return (catalog.get_snapshot(SHARED_SCOPE)['chunk_count'] > 0
+                or catalog.get_snapshot(user_id)['chunk_count'] > 0)
+    
+    def corpus_version(self, user_id: str) -> str:
+        """Version of everything retrievable for a user; changes whenever either corpus does"""
+        return f"{catalog.get_snapshot(SHARED_SCOPE)['version']}.{catalog.get_snapshot(user_id)['version']}"
+    
+    def embed_question(self, question: str) -> List[float]:
+        """Embed a question, reusing the vector computed for an identical earlier question"""
+        if not settings.CHATBOT_RETRIEVAL_CACHE:
+            return get_embeddings().embed_query(question)
+        embedding = self.retrieval_cache.get_embedding(question)
+        if embedding is None:
+            embedding = get_embeddings().embed_query(question)
+            self.retrieval_cache.set_embedding(question, embedding)
+        return embedding
+    
+    def load_chunks(self, chunks: List[tuple], stores: Dict[str, Any]) -> Optional[List[Document]]:
+        """Fetch (scope, chunk ID) pairs in order from open stores; None if any chunk no longer exists"""
+        found = {}
+        for scope in {scope for scope, _ in chunks}:
+            store = stores.get(scope)
+            if store is None:
+                return None
+            ids = [chunk for chunk_scope, chunk in chunks if chunk_scope == scope]
+            found.update((doc.id, doc) for doc in store.get_by_ids(ids))
+        if any(chunk not in found for _, chunk in chunks):
+            return None
+        return [found[chunk] for _, chunk in chunks]
+    
+    def retrieve_relevant_documents(self, question: str, user_id: str, k: int = 3,
+                                    query_embedding: Optional[List[float]] = None) -> List[Document]:
+        """Retrieve relevant chunks from the shared corpus and the user's uploads, merged by score"""
         try:
-            vector_store = self.get_user_vector_store(user_id)
+            # Sync the shared corpus in the background; never block a chat turn on ingestion
+            self.start_corpus_sync()
             
-            # Auto-load documents if vector store is empty or not loaded yet
-            if vector_store._collection.count() == 0 or not self.documents_loaded.get(user_id, False):
-                print(f"Vector store empty for user {user_id}, loading documents from data folder...")
-                success = self.load_documents_from_data_folder(user_id)
-                
-                if not success:
-                    print("No documents available after loading attempt")
+            with ExitStack() as leases:
+                stores = []
+                if catalog.get_snapshot(SHARED_SCOPE)['chunk_count'] > 0:
+                    stores.append((SHARED_SCOPE, leases.enter_context(self.lease_shared_vector_store())))
+                if catalog.get_snapshot(user_id)['chunk_count'] > 0:
+                    stores.append((user_id, leases.enter_context(self.lease_user_vector_store(user_id))))
+                if not stores:
+                    print("No documents available for retrieval")
                     return []
-            
-            if vector_store._collection.count() == 0:
-                print("Vector store still empty after loading attempt")
-                return []
 
-            print(f"Searching for relevant documents for question: '{question}'")
-            retriever = vector_store.as_retriever(search_kwargs={"k": k})
+                # Identical question over an unchanged corpus: skip embedding and search
+                version = self.corpus_version(user_id)
+                if settings.CHATBOT_RETRIEVAL_CACHE:
+                    cached = self.retrieval_cache.get_results(user_id, version, question, k)
+                    relevant_docs = self.load_chunks(cached, dict(stores)) if cached is not None else None
+                    if relevant_docs is not None:
+                        print(f"Found {len(relevant_docs)} relevant document chunks (cached)")
+                        return relevant_docs
+
+                print(f"Searching for relevant documents for question: '{question}'")
+                # Embed the question once and search every collection with the same vector
+                if query_embedding is None:
+                    query_embedding = self.embed_question(question)
+                scored_docs = []
+                for scope, store in stores:
+                    scored_docs.extend(
+                        (doc, distance, scope)
+                        for doc, distance in store.similarity_search_by_vector_with_relevance_scores(query_embedding, k=k)
+                    )
             
-            # Try different method names for compatibility
-            relevant_docs = []
-            try:
-                # Method 1: Newest LangChain version
-                relevant_docs = retriever.invoke(question)
-            except AttributeError:
-                try:
-                    # Method 2: Older version
-                    relevant_docs = retriever.get_relevant_documents(question)
-                except AttributeError:
-                    try:
-                        # Method 3: Direct similarity search
-                        relevant_docs = vector_store.similarity_search(question, k=k)
-                    except Exception as e:
-                        print(f"All retrieval methods failed: {e}")
-                        return []
+                # Chroma returns distances: lower is more relevant
+                scored_docs.sort(key=lambda item: item[1])
+                relevant_docs = [doc for doc, _, _ in scored_docs[:k]]
             
-            print(f"Found {len(relevant_docs)} relevant document chunks")
+                print(f"Found {len(relevant_docs)} relevant document chunks")
             
-            return relevant_docs
+                if settings.CHATBOT_RETRIEVAL_CACHE and all(doc.id for doc in relevant_docs):
+                    chunks = [(scope, doc.id) for doc, _, scope in scored_docs[:k]]
+                    self.retrieval_cache.set_results(user_id, version, question, k, chunks)
+                return relevant_docs
         except Exception as e:
             print(f"Error retrieving documents: {e}")
             return []  
 
+    def answer_cache_context(self, state: Dict[str, Any], config: Optional["RunnableConfig"] = None) -> Optional[str]:
+        """Answer cache key for this turn's context, or None when the cache does not apply"""
+        if not settings.CHATBOT_ANSWER_CACHE or state.get("question_embedding") is None:
+            return None
+        # Answers shaped by the user's own memory (recent turns or the rolling summary) must not
+        # be served to anyone else, so only questions asked without it are cached
+        if state.get("history") or state.get("summary"):
+            return None
+        model = (config or {}).get("configurable", {}).get("model")
+        return context_key(self.corpus_version(state["user_id"]), state.get("documents") or [], model)
+
     def get_loaded_documents_info(self, user_id: str) -> Dict[str, Any]:
         """Get information about loaded documents for a user"""
         try:
-            vector_store = self.get_user_vector_store(user_id)
-            count = vector_store._collection.count()
-            
-            # Get unique document names from metadata
-            if count > 0:
-                results = vector_store._collection.get()
-                if results and 'metadatas' in results:
-                    unique_files = set(metadata.get('file_name', 'Unknown') for metadata in results['metadatas'])
-                    return {
-                        'total_chunks': count,
-                        'loaded_files': list(unique_files),
-                        'documents_loaded': self.documents_loaded.get(user_id, False)
-                    }
-            
+            shared = catalog.get_snapshot(SHARED_SCOPE)
+            uploads = catalog.get_snapshot(user_id)
             return {
-                'total_chunks': 0,
-                'loaded_files': [],
-                'documents_loaded': self.documents_loaded.get(user_id, False)
+                'total_chunks': shared['chunk_count'] + uploads['chunk_count'],
+                'loaded_files': sorted(set(shared['files']) | set(uploads['files'])),
+                'documents_loaded': self.corpus_loaded
             }
         except Exception as e:
             print(f"Error getting document info: {e}")
@@ -202,27 +621,52 @@ class DocumentAwareChatbot:
     
     def create_agent(self):
         """Create LangGraph agent with memory and retrieval"""
+        from langchain_core.runnables import RunnableLambda
+        from langgraph.config import get_stream_writer
+        from langgraph.graph import StateGraph, END
+        
+        def route_question(state: GraphState) -> str:
+            """Decision node: whether this turn needs retrieval, decided before any embedding work"""
+            user_id = state["user_id"]
+            has_documents = chatbot.has_documents(user_id)
+            if not settings.CHATBOT_ROUTER:
+                return "retrieve" if has_documents else "generate_response"
+            decision, reason = route(state["messages"][-1].content, has_documents, bool(state.get("history")))
+            route_stats.record(decision, reason)
+            print(f"ℹ️ Route: {decision} ({reason}) for user {user_id}")
+            return "retrieve" if decision == RETRIEVE else "generate_response"
         
-        def should_retrieve(state: GraphState) -> str:
-            """Decision node: whether to retrieve documents"""
-            # Always retrieve if user has documents
-            vector_store = chatbot.get_user_vector_store(state["user_id"])
-            if vector_store._collection.count() > 0:
-                return "retrieve"
-            return "generate_response"
+        def load_conversation(state: GraphState) -> GraphState:
+            """Load the rolling summary and recent turns of this user's conversation"""
+            if not settings.CHATBOT_MEMORY:
+                return {**state, "summary": "", "history": []}
+            from .memory import load_memory
+            summary, history = load_memory(state["user_id"])
+            return {**state, "summary": summary, "history": history}
         
-        def retrieve_documents(state: GraphState) -> GraphState:
+        def retrieve_documents(state: GraphState, config: "RunnableConfig") -> GraphState:
             """Retrieve relevant documents"""
             question = state["messages"][-1].content
-            relevant_docs = chatbot.retrieve_relevant_documents(question, state["user_id"])
+            k = config.get("configurable", {}).get("k", 3)
+            # The answer cache matches on the question embedding, so compute it even without documents
+            query_embedding = None
+            if settings.CHATBOT_ANSWER_CACHE:
+                query_embedding = chatbot.embed_question(question)
+            relevant_docs = chatbot.retrieve_relevant_documents(question, state["user_id"], k=k,
+                                                                query_embedding=query_embedding)
             
-            context = "\n\n".join([doc.page_content for doc in relevant_docs])
-            return {**state, "context": context, "documents": relevant_docs}
+            # Stitch overlapping neighbours and cap the context at the token budget
+            packed = pack_context(relevant_docs, settings.CHATBOT_CONTEXT_TOKEN_BUDGET, settings.CHATBOT_TOKEN_ENCODING)
+            if relevant_docs:
+                print(f"ℹ️ Context: {packed.tokens} tokens from {len(relevant_docs)} chunks "
+                      f"({packed.chunks_merged} merged, {packed.passages_dropped} passages over budget)")
+            return {**state, "context": packed.text, "documents": packed.documents, "question_embedding": query_embedding}
         
-        def generate_response(state: GraphState) -> GraphState:
-            """Generate response with context"""
+        def build_llm_messages(state: GraphState) -> List[Dict]:
+            """Build the LLM prompt from the conversation and retrieved context"""
             messages = state["messages"]
             context = state.get("context", "")
+            summary = state.get("summary", "")
             user_message = messages[-1].content if messages else ""
             
             # Check if this is a document-only query
@@ -248,42 +692,191 @@ class DocumentAwareChatbot:
 
         Answer naturally as if you're having a normal conversation."""
                 
+                if summary:
+                    system_message += f"\n\n        Summary of the earlier conversation:\n        {summary}"
+                
                 # Convert messages to the format LLM expects
                 messages_with_context = [{"role": "system", "content": system_message}]
-                for msg in messages:
-                    messages_with_context.append({"role": "user", "content": msg.content})
+            elif summary:
+                # No context - regular conversation, reminded of what came before
+                messages_with_context = [{"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"}]
             else:
-                # No context - regular conversation
-                messages_with_context = [{"role": "user", "content": msg.content} for msg in messages]
-                
-            # Generate response
-            response = llm.invoke(messages_with_context)
+                messages_with_context = []
+            
+            # Recent turns verbatim, then the current message
+            messages_with_context.extend(state.get("history") or [])
+            for msg in messages:
+                messages_with_context.append({"role": "user", "content": msg.content})
             
-            return {**state, "response": response.content}
+            return messages_with_context
+        
+        def prompt_messages(state: GraphState) -> List[Dict]:
+            """Build the prompt and report its size"""
+            messages = build_llm_messages(state)
+            print(f"ℹ️ Prompt: {count_message_tokens(messages, settings.CHATBOT_TOKEN_ENCODING)} tokens "
+                  f"for user {state['user_id']}")
+            return messages
+        
+        def get_model(config: "RunnableConfig") -> Optional[str]:
+            """Model name override from runtime config, if set"""
+            return config.get("configurable", {}).get("model")
+        
+        def answer_from_cache(state: GraphState, context: Optional[str]) -> Optional[str]:
+            """Return a cached answer and stream it to "custom" stream consumers, or None"""
+            if context is None:
+                return None
+            cached = chatbot.answer_cache.lookup(context, state["question_embedding"])
+            if cached is None:
+                return None
+            answer, similarity = cached
+            print(f"✓ Answer cache hit (similarity {similarity:.3f}, "
+                  f"hit rate {chatbot.answer_cache.stats()['hit_rate']:.1%})")
+            write = get_stream_writer()
+            for piece in stream_pieces(answer):
+                write(piece)
+            return answer
+        
+        def generate_response(state: GraphState, config: "RunnableConfig") -> GraphState:
+            """Generate response with context"""
+            context = chatbot.answer_cache_context(state, config)
+            cached = answer_from_cache(state, context)
+            if cached is not None:
+                return {**state, "response": cached}
+            
+            # Generate response, streaming chunks so the graph can forward tokens. A call
+            # coalesced with an identical one in flight emits no LLM events, so its chunks
+            # go to the "custom" stream instead
+            response = ""
+            for chunk in llm_gateway.stream(prompt_messages(state), get_model(config), on_shared=get_stream_writer()):
+                response += chunk
+            
+            if context is not None:
+                chatbot.answer_cache.store(context, state["question_embedding"], response)
+            return {**state, "response": response}
+        
+        async def agenerate_response(state: GraphState, config: "RunnableConfig") -> GraphState:
+            """Async variant of generate_response, cancellable mid-generation"""
+            context = chatbot.answer_cache_context(state, config)
+            cached = answer_from_cache(state, context)
+            if cached is not None:
+                return {**state, "response": cached}
+            
+            response = ""
+            async for chunk in llm_gateway.astream(prompt_messages(state), get_model(config), on_shared=get_stream_writer()):
+                response += chunk
+            
+            if context is not None:
+                chatbot.answer_cache.store(context, state["question_embedding"], response)
+            return {**state, "response": response}
         
         # Build graph
         workflow = StateGraph(GraphState)
         
         # Define nodes
+        workflow.add_node("load_conversation", load_conversation)
         workflow.add_node("retrieve", retrieve_documents)
-        workflow.add_node("generate_response", generate_response)
+        workflow.add_node("generate_response", RunnableLambda(generate_response, afunc=agenerate_response))
         
         # Define entry point
-        workflow.set_entry_point("retrieve")
+        workflow.set_entry_point("load_conversation")
         
         # Add conditional edges
         workflow.add_conditional_edges(
-            "retrieve",
-            should_retrieve,
+            "load_conversation",
+            route_question,
             {
-                "retrieve": "generate_response",
+                "retrieve": "retrieve",
                 "generate_response": "generate_response",
             }
         )
         
+        workflow.add_edge("retrieve", "generate_response")
         workflow.add_edge("generate_response", END)
         
         return workflow.compile()
 
+    def warm_up(self) -> Dict[str, float]:
+        """Create clients, load the embedding model and compile the agent before the first request"""
+        timings = {}
+        start = time.perf_counter()
+        
+        step = time.perf_counter()
+        get_llm()
+        timings["llm"] = time.perf_counter() - step
+        
+        step = time.perf_counter()
+        try:
+            get_embeddings().embed_query("warm-up")
+        except ConnectionError as e:
+            # The sidecar may still be starting; requests retry the connection
+            print(f"✗ {e}")
+        timings["embeddings"] = time.perf_counter() - step
+        
+        step = time.perf_counter()
+        if self.index_snapshot:
+            self.attach_index_snapshot()
+        self.get_shared_vector_store()
+        timings["vector_store"] = time.perf_counter() - step
+        
+        step = time.perf_counter()
+        self.get_agent()
+        timings["agent"] = time.perf_counter() - step
+        
+        self.start_corpus_sync()
+        timings["total"] = time.perf_counter() - start
+        print(f"✓ Warm-up finished in {timings['total']:.2f}s (pid {os.getpid()}: "
+              + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in timings.items() if name != "total") + ")")
+        return timings
+    
+    def get_agent(self):
+        """Return the process-wide compiled agent, building it on first use.
+
+        The compiled graph holds no per-request state, so one instance is shared
+        across threads and async tasks. Per-request options (``k``, ``model``)
+        are passed as ``config={"configurable": {...}}`` at invoke time.
+        """
+        if self.agent is None:
+            with self.agent_lock:
+                if self.agent is None:
+                    self.agent = self.create_agent()
+        return self.agent
+
+    def stream_agent_response(self, agent, inputs: Dict[str, Any], config: Optional["RunnableConfig"] = None) -> Iterator[str]:
+        """Yield LLM token chunks from the generate_response node as they arrive"""
+        # "custom" carries answers replayed from the answer cache and chunks of coalesced calls
+        for mode, payload in agent.stream(inputs, config, stream_mode=["messages", "custom"]):
+            if mode == "custom":
+                yield payload
+                continue
+            chunk, metadata = payload
+            if metadata.get("langgraph_node") != "generate_response":
+                continue
+            if chunk.content:
+                yield chunk.content
+
+    def get_llm_semaphore(self) -> asyncio.Semaphore:
+        """Per-process cap on in-flight LLM generations for the async views"""
+        if self.llm_semaphore is None:
+            self.llm_semaphore = asyncio.Semaphore(settings.CHATBOT_MAX_CONCURRENT_LLM_CALLS)
+        return self.llm_semaphore
+
+    async def ainvoke_agent(self, agent, inputs: Dict[str, Any], config: Optional["RunnableConfig"] = None) -> Dict[str, Any]:
+        """Run the agent asynchronously while holding an LLM concurrency slot"""
+        async with self.get_llm_semaphore():
+            return await agent.ainvoke(inputs, config)
+
+    async def astream_agent_response(self, agent, inputs: Dict[str, Any], config: Optional["RunnableConfig"] = None) -> AsyncIterator[str]:
+        """Async variant of stream_agent_response; cancelling it aborts the upstream generation"""
+        async with self.get_llm_semaphore():
+            async for mode, payload in agent.astream(inputs, config, stream_mode=["messages", "custom"]):
+                if mode == "custom":
+                    yield payload
+                    continue
+                chunk, metadata = payload
+                if metadata.get("langgraph_node") != "generate_response":
+                    continue
+                if chunk.content:
+                    yield chunk.content
+
 # Global instance
 chatbot = DocumentAwareChatbot()
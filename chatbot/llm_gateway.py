@@ -0,0 +1,464 @@
+"""Per-process gateway for every LLM call: rate budget, coalescing, retries, load shedding.
+
+Each call reserves one request and its estimated tokens from two token buckets
+refilled at CHATBOT_LLM_REQUESTS_PER_MINUTE and CHATBOT_LLM_TOKENS_PER_MINUTE,
+then waits until the reservation is covered. A burst is therefore spread out
+instead of being sent to Groq all at once. If that wait would exceed
+CHATBOT_LLM_MAX_WAIT_SECONDS, or CHATBOT_LLM_MAX_QUEUE callers are already
+waiting, the call fails at once with LLMOverloaded and the views answer 503.
+The token estimate is the prompt plus the average size of recent answers,
+capped at the model's max_tokens. It is corrected once the answer is known.
+
+Background calls (memory summaries) are never shed. They wait until a
+CHATBOT_LLM_BACKGROUND_HEADROOM share of both buckets would still be left for
+chat turns after them.
+
+A call whose model and messages match one already in flight does not go to
+Groq: it follows the first call's output as it streams. Rate limits (429),
+server errors and connection failures are retried with jittered exponential
+backoff until output starts. A Retry-After from Groq pauses every caller in
+the process, not just the one that got the 429.
+"""
+import asyncio
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+from .context_packer import count_message_tokens, count_tokens
+
+# HTTP statuses worth retrying: rate limited, or Groq temporarily unavailable
+RETRYABLE_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+RETRYABLE_ERRORS = {"APIConnectionError", "APITimeoutError", "ConnectionError", "TimeoutError"}
+
+
+class LLMOverloaded(Exception):
+    """Raised without calling the LLM when this process is over its budget"""
+
+    def __init__(self, retry_after: float):
+        self.retry_after = retry_after
+        super().__init__(f"The assistant is busy, please retry in {max(1, round(retry_after))} s")
+
+
+class TokenBucket:
+    """Refills at rate per second up to capacity; reservations may run it into debt"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float, now: float) -> float:
+        """Seconds until amount would be covered, without reserving it"""
+        self._refill(now)
+        # Never wait for more than a full bucket, or an oversized prompt would block forever
+        shortfall = min(amount, self.capacity) - self.level
+        return max(0.0, shortfall / self.rate) if self.rate > 0 else 0.0
+
+    def available(self, now: float) -> float:
+        self._refill(now)
+        return self.level
+
+    def take(self, amount: float, now: float) -> None:
+        self._refill(now)
+        self.level -= min(amount, self.capacity)
+
+    def drain(self, now: float) -> None:
+        self._refill(now)
+        self.level = min(self.level, 0.0)
+
+    def give(self, amount: float, now: float) -> None:
+        self._refill(now)
+        self.level = min(self.capacity, self.level + amount)
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """Seconds from a Retry-After value ("7", "1.5") or a Groq reset value ("2m59.5s", "120ms")"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    units = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+    parts = re.findall(r"([\d.]+)(ms|h|m|s)", value)
+    if not parts or "".join(number + unit for number, unit in parts) != value:
+        return None
+    return sum(float(number) * units[unit] for number, unit in parts)
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Server-requested wait carried by a Groq API error, if any"""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    for header in ("retry-after", "x-ratelimit-reset-requests", "x-ratelimit-reset-tokens"):
+        seconds = parse_duration(headers.get(header))
+        if seconds is not None:
+            return seconds
+    return None
+
+
+def is_retryable(error: Exception) -> bool:
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status in RETRYABLE_STATUSES
+    return type(error).__name__ in RETRYABLE_ERRORS
+
+
+def flight_key(messages: List[Dict[str, str]], model: Optional[str]) -> str:
+    payload = json.dumps([model, [[message["role"], message["content"]] for message in messages]])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def as_dicts(messages: List[Any]) -> List[Dict[str, str]]:
+    """Chat messages as role/content dicts, accepting LangChain message objects too"""
+    roles = {"human": "user", "ai": "assistant"}
+    return [
+        message if isinstance(message, dict) else {"role": roles.get(message.type, message.type), "content": message.content}
+        for message in messages
+    ]
+
+
+class Flight:
+    """Output of one in-flight LLM call, readable by callers that sent the same prompt"""
+
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.followers = 0
+        self._condition = threading.Condition()
+        self._events = []  # (loop, asyncio.Event) of async followers
+
+    def publish(self, chunk: Optional[str] = None, done: bool = False, error: Optional[BaseException] = None) -> None:
+        with self._condition:
+            if chunk:
+                self.chunks.append(chunk)
+            self.done = self.done or done or error is not None
+            self.error = self.error or error
+            self._condition.notify_all()
+            events = list(self._events)
+        for loop, event in events:
+            loop.call_soon_threadsafe(event.set)
+
+    def _read(self, start: int):
+        return self.chunks[start:], self.done, self.error
+
+    def follow(self) -> Iterator[str]:
+        position = 0
+        while True:
+            with self._condition:
+                while position >= len(self.chunks) and not self.done:
+                    self._condition.wait()
+                chunks, done, error = self._read(position)
+            position += len(chunks)
+            yield from chunks
+            if done:
+                if error is not None:
+                    raise error
+                return
+
+    async def afollow(self) -> AsyncIterator[str]:
+        event = asyncio.Event()
+        entry = (asyncio.get_running_loop(), event)
+        with self._condition:
+            self._events.append(entry)
+        try:
+            position = 0
+            while True:
+                event.clear()
+                with self._condition:
+                    chunks, done, error = self._read(position)
+                position += len(chunks)
+                for chunk in chunks:
+                    yield chunk
+                if done:
+                    if error is not None:
+                        raise error
+                    return
+                if not chunks:
+                    await event.wait()
+        finally:
+            with self._condition:
+                self._events.remove(entry)
+
+
+class LLMGateway:
+    """Budgeted, coalescing, retrying front for the shared chat model"""
+
+    def __init__(self, llm_factory: Callable[[], Any], requests_per_minute: float = 30,
+                 tokens_per_minute: float = 8000, completion_tokens: int = 1024, max_queue: int = 64,
+                 max_wait: float = 30.0, max_retries: int = 4, base_delay: float = 0.5,
+                 max_delay: float = 20.0, encoding_name: str = "o200k_base", background_headroom: float = 0.5):
+        self.llm_factory = llm_factory
+        self.completion_tokens = completion_tokens  # the model's max_tokens
+        # Reserving max_tokens for every answer would admit a fraction of the calls the limit allows;
+        # start at a quarter of it and follow the answers actually generated
+        self.completion_estimate = max(1.0, completion_tokens / 4)
+        self.background_headroom = background_headroom
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.encoding_name = encoding_name
+        # Requests may burst by ten seconds' worth; the token bucket holds a minute so one long
+        # prompt still fits. A rate of 0 means unlimited
+        self.requests = TokenBucket(requests_per_minute / 60, max(1.0, requests_per_minute / 6) if requests_per_minute else 0)
+        self.tokens = TokenBucket(tokens_per_minute / 60, tokens_per_minute)
+        self._lock = threading.Lock()
+        self._flights: Dict[str, Flight] = {}
+        self._paused_until = 0.0
+        self.waiting = 0
+        self.counters = {"calls": 0, "coalesced": 0, "shed": 0, "retries": 0, "rate_limited": 0, "failures": 0}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.counters[name] += 1
+
+    def _model(self, model: Optional[str]):
+        llm = self.llm_factory()
+        return llm.bind(model=model) if model else llm
+
+    # Admission
+
+    def _wait_for(self, tokens: float, now: float) -> float:
+        return max(self._paused_until - now, self.requests.delay(1, now), self.tokens.delay(tokens, now))
+
+    def _headroom_wait(self, tokens: float) -> float:
+        """Seconds until a background call would leave the headroom share of both buckets untouched"""
+        with self._lock:
+            now = time.monotonic()
+            return max(
+                self._paused_until - now,
+                self.requests.delay(1 + self.background_headroom * self.requests.capacity, now),
+                self.tokens.delay(tokens + self.background_headroom * self.tokens.capacity, now),
+            )
+
+    def check_admission(self) -> None:
+        """Raise LLMOverloaded if a new call would be shed; reserves nothing"""
+        with self._lock:
+            wait = self._wait_for(0, time.monotonic())
+            if self.waiting >= self.max_queue or wait > self.max_wait:
+                self.counters["shed"] += 1
+                raise LLMOverloaded(max(wait, 1.0))
+
+    def _reserve(self, tokens: float) -> float:
+        """Reserve one request and tokens; returns how long the caller must wait first"""
+        with self._lock:
+            now = time.monotonic()
+            wait = self._wait_for(tokens, now)
+            if self.waiting >= self.max_queue or wait > self.max_wait:
+                self.counters["shed"] += 1
+                raise LLMOverloaded(max(wait, 1.0))
+            self.requests.take(1, now)
+            self.tokens.take(tokens, now)
+            if wait > 0:
+                self.waiting += 1
+            return wait
+
+    def _release(self, wait: float) -> None:
+        if wait > 0:
+            with self._lock:
+                self.waiting -= 1
+
+    def _refund(self, tokens: float) -> None:
+        with self._lock:
+            self.tokens.give(tokens, time.monotonic())
+
+    def _charge(self, tokens: float) -> None:
+        with self._lock:
+            self.tokens.take(tokens, time.monotonic())
+
+    # Retries
+
+    def _backoff(self, error: Exception, attempt: int) -> Optional[float]:
+        """Delay before retrying after error, or None if it should be raised"""
+        if attempt >= self.max_retries or not is_retryable(error):
+            return None
+        self._count("retries")
+        requested = retry_after(error)
+        if getattr(error, "status_code", None) == 429:
+            self._count("rate_limited")
+            with self._lock:
+                # Groq's limit is per key, so every caller in this process backs off and
+                # calls resume at the budgeted pace rather than as another burst
+                now = time.monotonic()
+                self.requests.drain(now)
+                if requested is not None:
+                    self._paused_until = max(self._paused_until, now + requested)
+        if requested is not None:
+            return requested + random.uniform(0, self.base_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    # Coalescing
+
+    def _join(self, key: str):
+        """(flight, True) for the first caller with this prompt, (flight, False) for followers"""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.followers += 1
+                self.counters["coalesced"] += 1
+                return flight, False
+            flight = self._flights[key] = Flight()
+            self.counters["calls"] += 1
+            return flight, True
+
+    def _finish(self, key: str, flight: Flight, error: Optional[BaseException] = None) -> None:
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        flight.publish(done=True, error=error)
+
+    def _estimate(self, messages: List[Dict[str, str]]) -> Tuple[int, int]:
+        """(prompt tokens, prompt plus expected completion tokens)"""
+        prompt_tokens = count_message_tokens(messages, self.encoding_name)
+        with self._lock:
+            completion = min(self.completion_tokens, round(self.completion_estimate))
+        return prompt_tokens, prompt_tokens + completion
+
+    def _settle(self, estimate: int, prompt_tokens: int, response: str) -> None:
+        """Replace the completion estimate with the tokens actually generated"""
+        completion = count_tokens(response, self.encoding_name)
+        with self._lock:
+            self.completion_estimate += 0.2 * (completion - self.completion_estimate)
+        used = prompt_tokens + completion
+        if used < estimate:
+            self._refund(estimate - used)
+        elif used > estimate:
+            self._charge(used - estimate)
+
+    # Calls
+
+    def stream(self, messages: List[Any], model: Optional[str] = None,
+               on_shared: Optional[Callable[[str], None]] = None, background: bool = False) -> Iterator[str]:
+        """Yield response chunks; chunks copied from an identical in-flight call also go to on_shared"""
+        messages = as_dicts(messages)
+        key = flight_key(messages, model)
+        flight, leader = self._join(key)
+        if not leader:
+            for chunk in flight.follow():
+                if on_shared is not None:
+                    on_shared(chunk)
+                yield chunk
+            return
+
+        prompt_tokens, estimate = self._estimate(messages)
+        response = ""
+        try:
+            attempt = 0
+            while True:
+                amount = estimate if attempt == 0 else 1
+                headroom = self._headroom_wait(amount) if background else 0
+                while headroom:
+                    time.sleep(headroom)
+                    headroom = self._headroom_wait(amount)
+                wait = self._reserve(amount)
+                try:
+                    if wait:
+                        time.sleep(wait)
+                finally:
+                    self._release(wait)
+                try:
+                    for chunk in self._model(model).stream(messages):
+                        if chunk.content:
+                            response += chunk.content
+                            flight.publish(chunk.content)
+                            yield chunk.content
+                    break
+                except Exception as e:
+                    delay = None if response else self._backoff(e, attempt)
+                    if delay is None:
+                        raise
+                    print(f"✗ LLM call failed ({e}), retrying in {delay:.1f} s")
+                    time.sleep(delay)
+                    attempt += 1
+        except BaseException as e:
+            if not isinstance(e, (LLMOverloaded, GeneratorExit)):
+                self._count("failures")
+            self._finish(key, flight, e if not isinstance(e, GeneratorExit) else LLMOverloaded(1.0))
+            raise
+        self._settle(estimate, prompt_tokens, response)
+        self._finish(key, flight)
+
+    async def astream(self, messages: List[Any], model: Optional[str] = None,
+                      on_shared: Optional[Callable[[str], None]] = None, background: bool = False) -> AsyncIterator[str]:
+        """Async variant of stream; cancelling it cancels the upstream request"""
+        messages = as_dicts(messages)
+        key = flight_key(messages, model)
+        flight, leader = self._join(key)
+        if not leader:
+            async for chunk in flight.afollow():
+                if on_shared is not None:
+                    on_shared(chunk)
+                yield chunk
+            return
+
+        prompt_tokens, estimate = self._estimate(messages)
+        response = ""
+        try:
+            attempt = 0
+            while True:
+                amount = estimate if attempt == 0 else 1
+                headroom = self._headroom_wait(amount) if background else 0
+                while headroom:
+                    await asyncio.sleep(headroom)
+                    headroom = self._headroom_wait(amount)
+                wait = self._reserve(amount)
+                try:
+                    if wait:
+                        await asyncio.sleep(wait)
+                finally:
+                    self._release(wait)
+                try:
+                    async for chunk in self._model(model).astream(messages):
+                        if chunk.content:
+                            response += chunk.content
+                            flight.publish(chunk.content)
+                            yield chunk.content
+                    break
+                except Exception as e:
+                    delay = None if response else self._backoff(e, attempt)
+                    if delay is None:
+                        raise
+                    print(f"✗ LLM call failed ({e}), retrying in {delay:.1f} s")
+                    await asyncio.sleep(delay)
+                    attempt += 1
+        except BaseException as e:
+            if not isinstance(e, (LLMOverloaded, GeneratorExit, asyncio.CancelledError)):
+                self._count("failures")
+            # Followers of a cancelled call are told to retry rather than left waiting
+            cancelled = isinstance(e, (GeneratorExit, asyncio.CancelledError))
+            self._finish(key, flight, LLMOverloaded(1.0) if cancelled else e)
+            raise
+        self._settle(estimate, prompt_tokens, response)
+        self._finish(key, flight)
+
+    def invoke(self, messages: List[Any], model: Optional[str] = None, background: bool = False) -> str:
+        """Complete response text for messages"""
+        return "".join(self.stream(messages, model, background=background))
+
+    async def ainvoke(self, messages: List[Any], model: Optional[str] = None, background: bool = False) -> str:
+        return "".join([chunk async for chunk in self.astream(messages, model, background=background)])
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            now = time.monotonic()
+            return {
+                **self.counters,
+                "in_flight": len(self._flights),
+                "waiting": self.waiting,
+                "paused_seconds": round(max(0.0, self._paused_until - now), 3),
+                "request_budget": round(self.requests.available(now), 2),
+                "token_budget": round(self.tokens.available(now), 1),
+                "completion_estimate": round(self.completion_estimate, 1),
+            }
@@ -0,0 +1,132 @@
+import os
+import shutil
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from chatbot import index_snapshot
+from chatbot.ingest_worker import embed_upload
+from chatbot.langgraph import EMBEDDING_MODEL_NAME, SHARED_COLLECTION_NAME, SHARED_SCOPE, chatbot, get_embeddings
+from chatbot.models import UploadedDocument
+from chatbot.store_pool import close_vector_store
+
+
+def collection_name(scope: str) -> str:
+    return SHARED_COLLECTION_NAME if scope == SHARED_SCOPE else f"user_{scope}"
+
+
+def open_store(scope: str):
+    with chatbot.stores_lock:
+        return chatbot.open_vector_store(scope, collection_name(scope))
+
+
+def close_stores() -> None:
+    chatbot.vector_stores.clear()
+    chatbot.shared_store.clear()
+
+
+class Command(BaseCommand):
+    help = "Build a versioned index snapshot of the data folder and all uploads, or verify one"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=settings.CHATBOT_INDEX_DIR,
+                            help='Snapshot root directory (default: CHATBOT_INDEX_DIR)')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Parser processes for the data folder (default: all cores)')
+        parser.add_argument('--activate', action='store_true',
+                            help='Point CURRENT at the new snapshot once it verifies')
+        parser.add_argument('--verify', nargs='?', const='current', metavar='VERSION',
+                            help='Only verify a snapshot (default: the current one)')
+
+    def handle(self, *args, **options):
+        root = options['output']
+        if options['verify'] is not None:
+            path = index_snapshot.resolve(root, options['verify'])
+            if path is None:
+                raise CommandError(f"No snapshot {options['verify']!r} in {root}")
+            self.verify(path)
+            return
+
+        # This process embeds everything itself, even when workers use the sidecar
+        get_embeddings(local=True)
+        settings.CHATBOT_INGEST_WORKERS = max(1, options['workers'])
+        os.makedirs(root, exist_ok=True)
+        version = index_snapshot.new_version()
+        path = os.path.join(root, version)
+        build_path = f"{path}.partial"
+
+        # Every store is written under the build directory. The live stores, the catalog and the
+        # upload rows are not touched: catalog entries for snapshot.json are gathered here, and
+        # pending uploads are left to the ingestion worker
+        close_stores()
+        chatbot.index_root = build_path
+        chatbot.corpus_loaded = False
+        try:
+            with chatbot.corpus_lock:
+                chatbot._sync_data_folder(update_catalog=False)
+            files = {SHARED_SCOPE: [
+                {"key": filename, "file_name": filename, "file_hash": entry["hash"],
+                 "source": "data_folder", "chunk_count": len(entry["chunk_ids"])}
+                for filename, entry in sorted((chatbot.load_manifest(SHARED_SCOPE) or {}).items())
+            ]}
+            # Already processed uploads are mostly embedding cache hits
+            for document in UploadedDocument.objects.filter(status=UploadedDocument.STATUS_DONE).order_by('id'):
+                try:
+                    file_hash, chunk_ids, _ = embed_upload(document)
+                except Exception as e:
+                    self.stderr.write(f"✗ Skipping upload {document.file_name} of user {document.user_id}: {e}")
+                    continue
+                files.setdefault(str(document.user_id), []).append({
+                    "key": f"upload:{document.id}", "file_name": document.file_name, "file_hash": file_hash,
+                    "source": "upload", "chunk_count": len(chunk_ids),
+                })
+            close_stores()
+
+            scopes = {}
+            for scope in sorted(os.listdir(build_path)):
+                if not os.path.isdir(os.path.join(build_path, scope)):
+                    continue
+                store = open_store(scope)
+                scopes[scope] = {**index_snapshot.summarize_store(store),
+                                 "files": sorted(files.get(scope, []), key=lambda file: file["key"])}
+                close_vector_store(store)
+            index_snapshot.write_manifest(build_path, {
+                "version": version,
+                "created_at": timezone.now().isoformat(),
+                "backend": settings.CHATBOT_VECTOR_BACKEND,
+                "numpy_dtype": settings.CHATBOT_NUMPY_DTYPE,
+                "embedding_model": EMBEDDING_MODEL_NAME,
+                "scopes": scopes,
+            })
+        except BaseException:
+            close_stores()
+            shutil.rmtree(build_path, ignore_errors=True)
+            raise
+        os.replace(build_path, path)
+
+        total = sum(info["chunk_count"] for info in scopes.values())
+        self.stdout.write(f"✓ Built index snapshot {version}: {total} chunks in {len(scopes)} scopes at {path}")
+        self.verify(path)
+        if options['activate']:
+            index_snapshot.activate(root, version)
+            self.stdout.write(f"✓ {version} is now the current snapshot")
+
+    def verify(self, path: str) -> None:
+        manifest = index_snapshot.read_manifest(path)
+        chatbot.index_root = path
+        problems = []
+        for scope, expected in manifest["scopes"].items():
+            if not os.path.isdir(os.path.join(path, scope)):
+                problems.append(f"{scope}: store directory missing")
+                continue
+            store = open_store(scope)
+            try:
+                problems.extend(index_snapshot.verify_scope(scope, expected, store))
+            finally:
+                close_vector_store(store)
+        if problems:
+            raise CommandError(f"Snapshot {manifest['version']} failed verification:\n  " + "\n  ".join(problems))
+        self.stdout.write(f"✓ Snapshot {manifest['version']} verified: "
+                          f"{sum(info['chunk_count'] for info in manifest['scopes'].values())} chunks "
+                          f"in {len(manifest['scopes'])} scopes match the manifest")
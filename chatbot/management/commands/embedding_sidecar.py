@@ -0,0 +1,39 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from chatbot.embedding_sidecar import SidecarServer
+from chatbot.ingest_worker import start_background_ingestion
+from chatbot.langgraph import chatbot, get_embeddings
+
+
+class Command(BaseCommand):
+    help = "Serve the embedding model and ingestion to web workers over a Unix socket"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--socket', default=settings.CHATBOT_EMBEDDING_SOCKET,
+                            help='Socket path (default: CHATBOT_EMBEDDING_SOCKET)')
+
+    def handle(self, *args, **options):
+        socket_path = options['socket']
+        if not socket_path:
+            raise CommandError("Pass --socket or set CHATBOT_EMBEDDING_SOCKET")
+
+        # This process is the one that loads the model
+        embeddings = get_embeddings(local=True)
+        embeddings.embed_query("warm-up")
+        server = SidecarServer(socket_path, embeddings)
+        self.stdout.write(f"Embedding sidecar listening on {socket_path} (pid {os.getpid()})")
+
+        # Catch up on work left while no sidecar was running
+        chatbot.start_corpus_sync()
+        start_background_ingestion()
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from chatbot.ingest_worker import process_pending_uploads
+
+
+class Command(BaseCommand):
+    help = "Process pending UploadedDocument rows (once, or continuously with --poll)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll', type=float, default=0,
+                            help='Keep running, checking for new uploads every N seconds')
+        parser.add_argument('--limit', type=int, default=None,
+                            help='Maximum number of documents to process per pass')
+
+    def handle(self, *args, **options):
+        while True:
+            processed = process_pending_uploads(limit=options['limit'])
+            self.stdout.write(f"Processed {processed} upload(s)")
+            if not options['poll']:
+                return
+            time.sleep(options['poll'])
@@ -0,0 +1,138 @@
+"""Per-user conversation memory: recent turns verbatim plus a rolling summary.
+
+A prompt carries at most CHATBOT_MEMORY_TURNS recent turns from the current
+session, each truncated to CHATBOT_MEMORY_TURN_TOKENS, plus one summary of
+everything older, capped at CHATBOT_MEMORY_SUMMARY_TOKENS. Its size therefore
+stays flat however long the conversation gets. After a turn is saved, a
+background thread folds the turns that have left the verbatim window into the
+stored summary. It only sends the LLM the old summary and those new turns,
+never the whole history.
+"""
+import threading
+from datetime import timedelta
+from typing import Dict, List, Tuple, Union
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from .chat_writer import chat_writer
+from .context_packer import truncate_to_tokens
+from .models import Chat, ConversationMemory
+
+# Turns folded into the summary per LLM call
+MAX_TURNS_PER_UPDATE = 20
+
+SUMMARY_PROMPT = """You maintain a running summary of a conversation between a user and an AI assistant.
+
+Current summary:
+{summary}
+
+New turns to fold in:
+{turns}
+
+Write the updated summary in at most {max_words} words. Keep facts about the user, their goals, decisions made and open questions; drop small talk. Reply with the summary only."""
+
+_pending = set()
+_pending_lock = threading.Lock()
+_worker_thread = None
+
+
+def active_turns(user_id: Union[int, str], summarized_until: int = 0) -> List[Chat]:
+    """The most recent turns of the current session that are sent verbatim, oldest first"""
+    if not settings.CHATBOT_MEMORY_TURNS:
+        return []
+    since = timezone.now() - timedelta(minutes=settings.CHATBOT_MEMORY_SESSION_MINUTES)
+    turns = Chat.objects.filter(
+        user_id=user_id, id__gt=summarized_until, created_at__gte=since
+    ).order_by('-id')[:settings.CHATBOT_MEMORY_TURNS]
+    return list(turns)[::-1]
+
+
+def load_memory(user_id: Union[int, str]) -> Tuple[str, List[Dict[str, str]]]:
+    """Return (summary, recent turns as chat messages) for a user's next prompt"""
+    memory = ConversationMemory.objects.filter(user_id=user_id).first()
+    summary = memory.summary if memory else ''
+    # Turns still in the write-behind queue are the most recent ones
+    turns = active_turns(user_id, memory.summarized_until if memory else 0) + chat_writer.pending_for_user(user_id)
+    history = []
+    for turn in turns[-settings.CHATBOT_MEMORY_TURNS:] if settings.CHATBOT_MEMORY_TURNS else []:
+        history.append({"role": "user", "content": truncate_to_tokens(
+            turn.message, settings.CHATBOT_MEMORY_TURN_TOKENS, settings.CHATBOT_TOKEN_ENCODING)})
+        history.append({"role": "assistant", "content": truncate_to_tokens(
+            turn.response, settings.CHATBOT_MEMORY_TURN_TOKENS, settings.CHATBOT_TOKEN_ENCODING)})
+    return summary, history
+
+
+def update_summary(user_id: Union[int, str]) -> bool:
+    """Fold turns that left the verbatim window into the summary; True if it changed"""
+    from .langgraph import llm_gateway
+
+    memory, _ = ConversationMemory.objects.get_or_create(user_id=user_id)
+    active_ids = [turn.id for turn in active_turns(user_id, memory.summarized_until)]
+    pending = list(
+        Chat.objects.filter(user_id=user_id, id__gt=memory.summarized_until)
+        .exclude(id__in=active_ids)
+        .order_by('id')[:MAX_TURNS_PER_UPDATE]
+    )
+    # Batch LLM calls while a session is active; flush everything once it has ended
+    if not pending or (active_ids and len(pending) < settings.CHATBOT_MEMORY_SUMMARY_BATCH):
+        return False
+
+    turn_tokens = settings.CHATBOT_MEMORY_TURN_TOKENS
+    encoding = settings.CHATBOT_TOKEN_ENCODING
+    turns = "\n".join(
+        f"User: {truncate_to_tokens(turn.message, turn_tokens, encoding)}\n"
+        f"Assistant: {truncate_to_tokens(turn.response, turn_tokens, encoding)}"
+        for turn in pending
+    )
+    prompt = SUMMARY_PROMPT.format(
+        summary=memory.summary or "(none yet)",
+        turns=turns,
+        max_words=int(settings.CHATBOT_MEMORY_SUMMARY_TOKENS * 0.75),
+    )
+    # Summaries can wait; they only use budget that chat turns leave spare
+    summary = llm_gateway.invoke([{"role": "user", "content": prompt}], background=True).strip()
+    summary = truncate_to_tokens(summary, settings.CHATBOT_MEMORY_SUMMARY_TOKENS, encoding)
+
+    # Another worker may have folded the same turns meanwhile; keep whichever landed first
+    updated = ConversationMemory.objects.filter(
+        pk=memory.pk, summarized_until=memory.summarized_until
+    ).update(summary=summary, summarized_until=pending[-1].id, updated_at=timezone.now())
+    if updated:
+        print(f"✓ Summarized {len(pending)} turns for user {user_id}")
+    return bool(updated)
+
+
+def _drain_pending() -> None:
+    global _worker_thread
+    try:
+        while True:
+            with _pending_lock:
+                if not _pending:
+                    # Cleared under the lock so a concurrent schedule starts a fresh thread
+                    _worker_thread = None
+                    return
+                user_id = _pending.pop()
+            try:
+                # A backlog (e.g. after enabling memory) takes several rounds
+                while update_summary(user_id):
+                    pass
+            except Exception as e:
+                print(f"✗ Error updating conversation summary for user {user_id}: {e}")
+    finally:
+        # Threads get their own DB connections; don't leak them
+        connections.close_all()
+
+
+def schedule_summary_update(user_id: Union[int, str]) -> None:
+    """Queue a user's summary update on the background thread; never blocks the request"""
+    global _worker_thread
+    if not settings.CHATBOT_MEMORY:
+        return
+    with _pending_lock:
+        _pending.add(str(user_id))
+        if _worker_thread is not None and _worker_thread.is_alive():
+            return
+        _worker_thread = threading.Thread(target=_drain_pending, name="memory-summary", daemon=True)
+        _worker_thread.start()
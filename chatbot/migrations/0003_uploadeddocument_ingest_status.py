@@ -0,0 +1,54 @@
+# Generated by Django 5.1.5 on 2026-10-17 04:20
+
+from django.db import migrations, models
+
+
+def mark_processed_done(apps, schema_editor):
+    UploadedDocument = apps.get_model('chatbot', 'UploadedDocument')
+    UploadedDocument.objects.filter(processed=True).update(status='done')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0002_uploadeddocument'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadeddocument',
+            name='chunk_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='uploadeddocument',
+            name='embed_seconds',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='uploadeddocument',
+            name='error',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='uploadeddocument',
+            name='parse_seconds',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='uploadeddocument',
+            name='processed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='uploadeddocument',
+            name='started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='uploadeddocument',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('done', 'Done'), ('failed', 'Failed')], db_index=True, default='pending', max_length=20),
+        ),
+        migrations.RunPython(mark_processed_done, migrations.RunPython.noop),
+    ]
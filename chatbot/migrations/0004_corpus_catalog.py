@@ -0,0 +1,60 @@
+# Generated by Django 5.1.5 on 2026-10-17 04:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def catalog_processed_uploads(apps, schema_editor):
+    UploadedDocument = apps.get_model('chatbot', 'UploadedDocument')
+    CorpusCatalog = apps.get_model('chatbot', 'CorpusCatalog')
+    CorpusFile = apps.get_model('chatbot', 'CorpusFile')
+    for document in UploadedDocument.objects.filter(status='done'):
+        catalog, _ = CorpusCatalog.objects.get_or_create(scope=str(document.user_id))
+        CorpusFile.objects.create(
+            catalog=catalog,
+            key=f'upload:{document.id}',
+            file_name=document.file_name,
+            file_hash='',
+            source='upload',
+            chunk_count=document.chunk_count,
+        )
+        catalog.chunk_count += document.chunk_count
+        catalog.version += 1
+        catalog.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0003_uploadeddocument_ingest_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CorpusCatalog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(max_length=64, unique=True)),
+                ('version', models.PositiveIntegerField(default=0)),
+                ('chunk_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CorpusFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255)),
+                ('file_name', models.CharField(max_length=255)),
+                ('file_hash', models.CharField(max_length=64)),
+                ('source', models.CharField(max_length=20)),
+                ('chunk_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('catalog', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='files', to='chatbot.corpuscatalog')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('catalog', 'key'), name='unique_corpus_file_key')],
+            },
+        ),
+        migrations.RunPython(catalog_processed_uploads, migrations.RunPython.noop),
+    ]
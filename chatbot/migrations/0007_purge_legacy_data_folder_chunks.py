@@ -0,0 +1,43 @@
+import os
+
+from django.conf import settings
+from django.db import migrations
+
+
+def purge_data_folder_chunks(apps, schema_editor):
+    """Data folder chunks used to be copied into every user's Chroma collection; drop them once"""
+    # The live Chroma stores, chroma_db/<scope> in the project root
+    chroma_root = os.path.join(settings.BASE_DIR, "chroma_db")
+    if not os.path.isdir(chroma_root):
+        return
+    import chromadb
+
+    for scope in sorted(os.listdir(chroma_root)):
+        path = os.path.join(chroma_root, scope)
+        if scope == "shared" or not os.path.isdir(path):
+            continue
+        client = chromadb.PersistentClient(path=path)
+        try:
+            collection = client.get_collection(f"user_{scope}")
+            legacy = collection.get(where={"source": "data_folder"}, include=[])["ids"]
+            if legacy:
+                collection.delete(ids=legacy)
+                print(f"✓ Removed {len(legacy)} copied data folder chunks from user {scope}")
+        except Exception as e:
+            print(f"✗ Could not clean up vector store of user {scope}: {e}")
+        finally:
+            # Older chromadb releases, such as the pinned 1.2.1, have no Client.close()
+            close = getattr(client, "close", None)
+            if close is not None:
+                close()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0006_chat_user_created_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(purge_data_folder_chunks, migrations.RunPython.noop),
+    ]
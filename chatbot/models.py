@@ -8,16 +8,82 @@ class Chat(models.Model):
     response = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # History pages are keyset-paginated on (created_at, id) per user
+            models.Index(fields=['user', 'created_at'], name='chat_user_created_idx'),
+        ]
+
     def __str__(self):
         return f'{self.user.username}: {self.message}'
 
 
 class UploadedDocument(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_PROCESSING = 'processing'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_PROCESSING, 'Processing'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     file = models.FileField(upload_to='documents/')
     file_name = models.CharField(max_length=255)
     uploaded_at = models.DateTimeField(auto_now_add=True)
     processed = models.BooleanField(default=False)
 
+    # Background ingestion queue state
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING, db_index=True)
+    chunk_count = models.IntegerField(default=0)
+    error = models.TextField(blank=True, default='')
+    started_at = models.DateTimeField(null=True, blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    parse_seconds = models.FloatField(null=True, blank=True)
+    embed_seconds = models.FloatField(null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.user.username}: {self.file_name}'
+
+class ConversationMemory(models.Model):
+    """Rolling summary of a user's turns that are no longer sent to the LLM verbatim"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='conversation_memory')
+    summary = models.TextField(blank=True, default='')
+    # ID of the last Chat folded into the summary; later turns are not summarized yet
+    summarized_until = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.user.username}: summary up to chat {self.summarized_until}'
+
+
+class CorpusCatalog(models.Model):
+    """What is indexed for one scope: the shared data folder corpus or one user's uploads"""
+    scope = models.CharField(max_length=64, unique=True)
+    version = models.PositiveIntegerField(default=0)
+    chunk_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.scope} v{self.version}: {self.chunk_count} chunks'
+
+
+class CorpusFile(models.Model):
+    catalog = models.ForeignKey(CorpusCatalog, on_delete=models.CASCADE, related_name='files')
+    key = models.CharField(max_length=255)
+    file_name = models.CharField(max_length=255)
+    file_hash = models.CharField(max_length=64)
+    source = models.CharField(max_length=20)
+    chunk_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['catalog', 'key'], name='unique_corpus_file_key'),
+        ]
+
     def __str__(self):
-        return f'{self.user.username}: {self.file_name}'
\ No newline at end of file
+        return f'{self.catalog.scope}: {self.file_name}'
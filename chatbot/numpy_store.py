@@ -0,0 +1,320 @@
+"""In-process exact-search vector store on a memory-mapped NumPy matrix.
+
+For per-user corpora of a few thousand MiniLM chunks, a vectorized dot product
+over a contiguous matrix of normalized rows answers top-k faster than a round
+trip through the Chroma client and its SQLite store. Rows stay contiguous:
+deleting a row moves the last row into its slot. Chunk text and metadata live
+in a small SQLite table keyed by row.
+
+With a compact dtype (float16, or int8 with a per-vector scale) the scan runs
+over the compact matrix and only the best ``k * rerank_factor`` candidates are
+re-scored against the full float32 vectors. Those stay in a memory-mapped file
+of their own, so only the compact matrix needs to stay resident.
+
+It implements the subset of the Chroma vector store API the chatbot uses and
+is selected with CHATBOT_VECTOR_BACKEND=numpy. Several processes may open the
+same directory (every gunicorn worker syncs the data folder, upload drainers
+write user stores). Writes take an exclusive flock on the directory and reads
+a shared one. Every write bumps a generation number in the meta table. A handle
+that finds the generation moved since its last access reloads the row count
+and remaps the vector files before going on.
+"""
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Iterator, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+try:
+    import fcntl
+except ImportError:  # Windows: locking is per-process only
+    fcntl = None
+
+# Rows are preallocated in steps of this size and the file grows geometrically
+INITIAL_CAPACITY = 1024
+# Rows upcast at a time when scoring a compact matrix
+SCORE_BLOCK_ROWS = 16384
+COMPACT_DTYPES = ("float16", "int8")
+
+
+def quantize_int8(matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-vector int8 quantization; returns (codes, scales)"""
+    scales = np.maximum(np.abs(matrix).max(axis=-1) / 127.0, 1e-12).astype(np.float32)
+    codes = np.rint(matrix / scales[..., None]).astype(np.int8)
+    return codes, scales
+
+
+class NumpyVectorStore:
+    """Exact cosine-similarity search over normalized embeddings"""
+
+    def __init__(self, persist_directory: str, embedding_function, dtype: str = "float32", rerank_factor: int = 4):
+        self.embedding_function = embedding_function
+        self.dtype = np.dtype(dtype)
+        if self.dtype.name not in ("float32",) + COMPACT_DTYPES:
+            raise ValueError(f"Unsupported vector dtype: {dtype}")
+        self.compact = self.dtype.name in COMPACT_DTYPES
+        self.rerank_factor = max(1, rerank_factor)
+        os.makedirs(persist_directory, exist_ok=True)
+        # Full-precision vectors; with a compact dtype they are only read to re-rank candidates
+        self.full_path = os.path.join(persist_directory, "vectors.float32")
+        self.vectors_path = os.path.join(persist_directory, f"vectors.{self.dtype.name}")
+        self.scales_path = os.path.join(persist_directory, "scales.float32")
+        self.lock_path = os.path.join(persist_directory, "store.lock")
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(os.path.join(persist_directory, "chunks.sqlite3"), check_same_thread=False)
+        self._full = self._matrix = self._scales = None
+        self._dim = None
+        self._count = 0
+        self._generation = None  # meta generation this handle last loaded
+        with self._locked(exclusive=True, reload=False):
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks (row INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, content TEXT NOT NULL, metadata TEXT NOT NULL)"
+            )
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            self._conn.commit()
+            rebuild = self.compact and not os.path.exists(self.vectors_path)
+            self._reload()
+            if rebuild and self._count:
+                # Switching an existing float32 store to a compact dtype
+                self._write_compact(0, self._full[:self._count])
+                self._commit()
+
+    @contextmanager
+    def _locked(self, exclusive: bool = False, reload: bool = True):
+        """Serialize access across threads and, where supported, processes; pick up other processes' writes"""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self.lock_path, "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+                try:
+                    if reload and self._read_generation() != self._generation:
+                        self._reload()
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_generation(self) -> int:
+        row = self._conn.execute("SELECT value FROM meta WHERE name = 'generation'").fetchone()
+        return row[0] if row else 0
+
+    def _reload(self) -> None:
+        """Load the dimension and row count from SQLite and map the vector files to match"""
+        row = self._conn.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+        self._dim = row[0] if row else None
+        self._count = self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+        if self._dim is not None:
+            self._map(max(INITIAL_CAPACITY, self._count))
+        self._generation = self._read_generation()
+
+    def _commit(self) -> None:
+        """Flush the vectors, then commit the rows that point at them under a new generation"""
+        self._flush()
+        self._conn.execute(
+            "INSERT INTO meta (name, value) VALUES ('generation', 1) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1"
+        )
+        self._conn.commit()
+        self._generation = self._read_generation()
+
+    @staticmethod
+    def _map_file(path: str, dtype: np.dtype, capacity: int, dim: Optional[int]) -> np.memmap:
+        row_size = (dim or 1) * dtype.itemsize
+        if not os.path.exists(path) or os.path.getsize(path) < capacity * row_size:
+            with open(path, "ab") as f:
+                f.truncate(capacity * row_size)
+        rows = os.path.getsize(path) // row_size
+        return np.memmap(path, dtype=dtype, mode="r+", shape=(rows, dim) if dim else (rows,))
+
+    def _map(self, capacity: int) -> None:
+        """(Re)map the vector files with room for at least capacity rows"""
+        self._flush()
+        self._full = self._map_file(self.full_path, np.dtype(np.float32), capacity, self._dim)
+        self._matrix = self._full
+        self._scales = None
+        if self.compact:
+            self._matrix = self._map_file(self.vectors_path, self.dtype, capacity, self._dim)
+        if self.dtype == np.int8:
+            self._scales = self._map_file(self.scales_path, np.dtype(np.float32), capacity, None)
+
+    def _arrays(self) -> List[np.memmap]:
+        compact = self._matrix if self.compact else None
+        return [array for array in (self._full, compact, self._scales) if array is not None]
+
+    def _flush(self) -> None:
+        for array in self._arrays():
+            array.flush()
+
+    def _capacity(self) -> int:
+        return min(array.shape[0] for array in self._arrays())
+
+    def _ensure_capacity(self, dim: int, needed: int) -> None:
+        if self._dim is None:
+            self._dim = dim
+            self._conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('dim', ?)", (dim,))
+            self._map(max(INITIAL_CAPACITY, needed))
+        elif needed > self._capacity():
+            self._map(max(needed, self._capacity() * 2))
+
+    def _write_compact(self, start: int, vectors: np.ndarray) -> None:
+        """Fill compact rows from full-precision vectors, block by block"""
+        for offset in range(0, len(vectors), SCORE_BLOCK_ROWS):
+            block = np.asarray(vectors[offset:offset + SCORE_BLOCK_ROWS], dtype=np.float32)
+            rows = slice(start + offset, start + offset + len(block))
+            if self.dtype == np.int8:
+                self._matrix[rows], self._scales[rows] = quantize_int8(block)
+            else:
+                self._matrix[rows] = block
+
+    @staticmethod
+    def _normalize(vectors) -> np.ndarray:
+        matrix = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-12)
+
+    def count(self) -> int:
+        with self._locked():
+            return self._count
+
+    def add_embeddings(self, ids: List[str], vectors, documents: List[Document]) -> None:
+        """Upsert precomputed vectors; existing IDs are overwritten in place"""
+        matrix = self._normalize(vectors)
+        with self._locked(exclusive=True):
+            self._ensure_capacity(matrix.shape[1], self._count + len(ids))
+            for chunk_id, vector, document in zip(ids, matrix, documents):
+                existing = self._conn.execute("SELECT row FROM chunks WHERE id = ?", (chunk_id,)).fetchone()
+                if existing:
+                    row = existing[0]
+                else:
+                    row = self._count
+                    self._count += 1
+                self._full[row] = vector
+                if self.compact:
+                    self._write_compact(row, vector[None, :])
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO chunks (row, id, content, metadata) VALUES (?, ?, ?, ?)",
+                    (row, chunk_id, document.page_content, json.dumps(document.metadata)),
+                )
+            self._commit()
+
+    def add_documents(self, documents: List[Document], ids: List[str]) -> List[str]:
+        vectors = self.embedding_function.embed_documents([doc.page_content for doc in documents])
+        self.add_embeddings(ids, vectors, documents)
+        return ids
+
+    def _delete_rows(self, rows: List[int]) -> None:
+        """Delete rows, keeping the matrices contiguous by moving the last row into each gap"""
+        for row in sorted(rows, reverse=True):
+            last = self._count - 1
+            self._conn.execute("DELETE FROM chunks WHERE row = ?", (row,))
+            if row != last:
+                for array in self._arrays():
+                    array[row] = array[last]
+                self._conn.execute("UPDATE chunks SET row = ? WHERE row = ?", (row, last))
+            self._count -= 1
+
+    def delete(self, ids: List[str]) -> None:
+        with self._locked(exclusive=True):
+            rows = []
+            for chunk_id in ids:
+                existing = self._conn.execute("SELECT row FROM chunks WHERE id = ?", (chunk_id,)).fetchone()
+                if existing:
+                    rows.append(existing[0])
+            self._delete_rows(rows)
+            # Moved vectors must be on disk before the row renumbering that points at them commits
+            self._commit()
+
+    def delete_where(self, key: str, value: Any) -> None:
+        """Delete every chunk whose metadata[key] equals value"""
+        with self._locked(exclusive=True):
+            rows = [row for (row,) in self._conn.execute(
+                "SELECT row FROM chunks WHERE json_extract(metadata, ?) = ?", (f"$.{key}", value)
+            )]
+            self._delete_rows(rows)
+            self._commit()
+
+    def _scores(self, query: np.ndarray) -> np.ndarray:
+        """Dot product of the query with every stored row (approximate for compact dtypes)"""
+        if not self.compact:
+            return self._matrix[:self._count] @ query
+        # NumPy has no BLAS path for float16/int8; upcast block by block to bound memory
+        scores = np.empty(self._count, dtype=np.float32)
+        for start in range(0, self._count, SCORE_BLOCK_ROWS):
+            end = min(start + SCORE_BLOCK_ROWS, self._count)
+            scores[start:end] = self._matrix[start:end].astype(np.float32) @ query
+            if self._scales is not None:
+                scores[start:end] *= self._scales[start:end]
+        return scores
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding: List[float], k: int = 4) -> List[Tuple[Document, float]]:
+        """Top-k by cosine similarity; returns (document, distance) with distance = 1 - cosine, like Chroma"""
+        with self._locked():
+            if not self._count:
+                return []
+            query = self._normalize(embedding)
+            scores = self._scores(query)
+            k = min(k, self._count)
+            candidates = min(k * self.rerank_factor, self._count) if self.compact else k
+            top = np.argpartition(-scores, candidates - 1)[:candidates]
+            if self.compact:
+                # Re-score the candidates exactly; sorted rows keep the reads sequential
+                top = np.sort(top)
+                scores = dict(zip(top.tolist(), (self._full[top] @ query).tolist()))
+                top = sorted(scores, key=scores.get, reverse=True)[:k]
+            else:
+                top = top[np.argsort(-scores[top])]
+            results = []
+            for row in top:
+                chunk_id, content, metadata = self._conn.execute(
+                    "SELECT id, content, metadata FROM chunks WHERE row = ?", (int(row),)
+                ).fetchone()
+                document = Document(page_content=content, metadata=json.loads(metadata), id=chunk_id)
+                results.append((document, 1.0 - float(scores[row])))
+            return results
+
+    def get_by_ids(self, ids: List[str]) -> List[Document]:
+        """Documents for the given chunk IDs; unknown IDs are skipped"""
+        with self._locked():
+            documents = []
+            for chunk_id in ids:
+                found = self._conn.execute("SELECT content, metadata FROM chunks WHERE id = ?", (chunk_id,)).fetchone()
+                if found:
+                    documents.append(Document(page_content=found[0], metadata=json.loads(found[1]), id=chunk_id))
+            return documents
+
+    def iter_chunks(self) -> Iterator[Tuple[str, str, dict]]:
+        """(id, content, metadata) of every stored chunk, in row order"""
+        with self._locked():
+            rows = self._conn.execute("SELECT id, content, metadata FROM chunks ORDER BY row").fetchall()
+        for chunk_id, content, metadata in rows:
+            yield chunk_id, content, json.loads(metadata)
+
+    def check_vectors(self) -> List[str]:
+        """Problems with the stored matrices: missing rows, non-finite or non-unit vectors"""
+        with self._locked():
+            if not self._count:
+                return []
+            problems = []
+            rows = self._conn.execute("SELECT MIN(row), MAX(row) FROM chunks").fetchone()
+            if rows != (0, self._count - 1):
+                problems.append(f"chunk rows {rows} are not contiguous for {self._count} chunks")
+            norms = np.linalg.norm(self._full[:self._count], axis=1)
+            bad = int(np.count_nonzero(~np.isfinite(norms) | (np.abs(norms - 1.0) > 1e-3)))
+            if bad:
+                problems.append(f"{bad} vectors are not unit length")
+            return problems
+
+    def similarity_search(self, query: str, k: int = 4) -> List[Document]:
+        embedding = self.embedding_function.embed_query(query)
+        return [doc for doc, _ in self.similarity_search_by_vector_with_relevance_scores(embedding, k)]
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush()
+            self._conn.close()
@@ -0,0 +1,150 @@
+"""Two-level cache in front of query embedding and vector search.
+
+Level one maps a normalized question to its embedding, so retries and
+repeated questions skip the model's forward pass. Level two maps a user's
+corpus version, the question and k to the (scope, chunk ID) pairs retrieval
+returned, so the vector search is skipped too. Ingestion bumps the corpus
+version, so stale results are never looked up again. Both levels are bounded
+in-process LRU maps. When a Django cache alias is configured, they also read
+and write through it, so workers share what any one of them computed.
+"""
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Key prefixes in the shared Django cache
+EMBEDDING_PREFIX = "chatbot:qemb:"
+RESULTS_PREFIX = "chatbot:qres:"
+
+
+def normalize_question(question: str) -> str:
+    """Case- and whitespace-insensitive form of a question (MiniLM lowercases its input anyway)"""
+    return re.sub(r"\s+", " ", question).strip().lower()
+
+
+class LRUMap:
+    """Thread-safe, size-bounded mapping with least-recently-used eviction"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+class RetrievalCache:
+    """Question -> embedding and (user, corpus version, question, k) -> chunk IDs"""
+
+    def __init__(self, model_name: str, max_embeddings: int = 10000, max_results: int = 10000,
+                 shared_alias: Optional[str] = None, shared_timeout: Optional[int] = 3600):
+        self.model_name = model_name
+        self.embeddings = LRUMap(max_embeddings)
+        self.results = LRUMap(max_results)
+        self.shared_alias = shared_alias
+        self.shared_timeout = shared_timeout
+        self._stats_lock = threading.Lock()
+        self.counters = {
+            "embedding_hits": 0,
+            "embedding_misses": 0,
+            "result_hits": 0,
+            "result_misses": 0,
+            "shared_hits": 0,
+        }
+
+    def _count(self, name: str) -> None:
+        with self._stats_lock:
+            self.counters[name] += 1
+
+    def _shared(self):
+        if not self.shared_alias:
+            return None
+        from django.core.cache import caches
+        return caches[self.shared_alias]
+
+    def _lookup(self, level: LRUMap, prefix: str, key: str) -> Any:
+        value = level.get(key)
+        if value is None:
+            shared = self._shared()
+            if shared is not None:
+                value = shared.get(prefix + key)
+                if value is not None:
+                    self._count("shared_hits")
+                    level.set(key, value)
+        return value
+
+    def _remember(self, level: LRUMap, prefix: str, key: str, value: Any) -> None:
+        level.set(key, value)
+        shared = self._shared()
+        if shared is not None:
+            shared.set(prefix + key, value, self.shared_timeout)
+
+    def _embedding_key(self, question: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\x00{normalize_question(question)}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _results_key(user_id: str, corpus_version: str, question: str, k: int) -> str:
+        raw = f"{user_id}\x00{corpus_version}\x00{k}\x00{normalize_question(question)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get_embedding(self, question: str) -> Optional[List[float]]:
+        value = self._lookup(self.embeddings, EMBEDDING_PREFIX, self._embedding_key(question))
+        self._count("embedding_hits" if value is not None else "embedding_misses")
+        # Stored as float32 bytes: a quarter of the size of a pickled list of floats
+        return np.frombuffer(value, dtype=np.float32).tolist() if value is not None else None
+
+    def set_embedding(self, question: str, embedding: List[float]) -> None:
+        value = np.asarray(embedding, dtype=np.float32).tobytes()
+        self._remember(self.embeddings, EMBEDDING_PREFIX, self._embedding_key(question), value)
+
+    def get_results(self, user_id: str, corpus_version: str, question: str, k: int) -> Optional[List[Tuple[str, str]]]:
+        """Ranked (scope, chunk ID) pairs from an earlier identical retrieval, or None"""
+        value = self._lookup(self.results, RESULTS_PREFIX, self._results_key(user_id, corpus_version, question, k))
+        self._count("result_hits" if value is not None else "result_misses")
+        return [tuple(pair) for pair in value] if value is not None else None
+
+    def set_results(self, user_id: str, corpus_version: str, question: str, k: int, chunks: List[Tuple[str, str]]) -> None:
+        key = self._results_key(user_id, corpus_version, question, k)
+        self._remember(self.results, RESULTS_PREFIX, key, [list(pair) for pair in chunks])
+
+    def clear(self) -> None:
+        """Drop the in-process levels (the shared cache expires on its own)"""
+        self.embeddings.clear()
+        self.results.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            counters = dict(self.counters)
+        for level in ("embedding", "result"):
+            lookups = counters[f"{level}_hits"] + counters[f"{level}_misses"]
+            counters[f"{level}_hit_rate"] = counters[f"{level}_hits"] / lookups if lookups else 0.0
+        counters["embeddings"] = len(self.embeddings)
+        counters["results"] = len(self.results)
+        counters["evictions"] = self.embeddings.evictions + self.results.evictions
+        return counters
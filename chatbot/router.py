@@ -0,0 +1,83 @@
+"""Pre-retrieval routing: decide whether a turn needs document retrieval.
+
+Runs before any embedding work, using only local lexical signals, so
+greetings, thanks and follow-ups about the previous answer go straight to the
+LLM without a query embedding or a vector search. A question is routed to
+retrieval unless a rule positively identifies it as one of those.
+"""
+import re
+import threading
+from collections import Counter
+from typing import Dict, Tuple
+
+RETRIEVE = "retrieve"
+SKIP = "skip"
+
+# Whole-message chit-chat: greetings, thanks, acknowledgements, farewells
+SMALLTALK = re.compile(
+    r"^(?:(?:hi|hello|hey|yo|hiya|greetings|good (?:morning|afternoon|evening|night))(?: there)?"
+    r"|(?:many )?thanks?(?: you)?(?: (?:so|very) much)?(?: a lot)?|thank you(?: (?:so|very) much)?|thx|ty|cheers"
+    r"|ok(?:ay)?|k|cool|nice|great|awesome|perfect|got it|understood|sounds good|makes sense|i see|sure|yes|yeah|yep|no|nope"
+    r"|bye|goodbye|see you|see ya|later|how are you(?: doing)?|what'?s up|sup|who are you|lol|haha)"
+    r"(?: (?:thanks|thank you|again|so much))*[\s!.?,:)]*$"
+)
+
+# Requests to rework the previous answer rather than to look anything up
+FOLLOW_UP = re.compile(
+    r"^(?:(?:can|could|would) you |please )?"
+    r"(?:explain (?:that|it|this)(?: again| more| further| simply)?|elaborate(?: on (?:that|it|this))?|expand on (?:that|it|this)"
+    r"|what do you mean|what does that mean|rephrase(?: (?:that|it))?|simplify(?: (?:that|it))?|shorten(?: (?:that|it))?"
+    r"|make (?:it|that) (?:shorter|longer|simpler|clearer)|summari[sz]e (?:that|it|this)|tl;?dr|say (?:that|it) again"
+    r"|translate (?:that|it|this)(?: (?:to|into) \w+)?|give (?:me )?an example|another example|more details?|go on|continue|why)"
+    r"[\s!.?,]*(?:please)?[\s!.?]*$"
+)
+
+# Phrases that always mean the user wants their documents consulted
+DOCUMENT_HINTS = re.compile(r"\b(?:document|documents|file|files|pdf|upload|uploaded|resume|cv|attachment|page)\b")
+
+
+def normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def route(question: str, has_documents: bool, has_history: bool) -> Tuple[str, str]:
+    """Return (RETRIEVE or SKIP, reason) for a user message"""
+    text = normalize(question)
+    if not has_documents:
+        return SKIP, "no documents"
+    if not text:
+        return SKIP, "empty message"
+    if DOCUMENT_HINTS.search(text):
+        return RETRIEVE, "mentions documents"
+    if SMALLTALK.match(text):
+        return SKIP, "small talk"
+    if has_history and FOLLOW_UP.match(text):
+        return SKIP, "follow-up on previous answer"
+    return RETRIEVE, "default"
+
+
+class RouteStats:
+    """Per-process counts of routing decisions by reason"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = Counter()
+
+    def record(self, decision: str, reason: str) -> None:
+        with self._lock:
+            self._counts[(decision, reason)] += 1
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            counts = dict(self._counts)
+        total = sum(counts.values())
+        skipped = sum(count for (decision, _), count in counts.items() if decision == SKIP)
+        return {
+            "total": total,
+            "skipped": skipped,
+            "skip_rate": skipped / total if total else 0.0,
+            **{f"{decision}: {reason}": count for (decision, reason), count in sorted(counts.items())},
+        }
+
+
+route_stats = RouteStats()
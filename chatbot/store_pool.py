@@ -0,0 +1,199 @@
+"""Bounded LRU pool of per-user vector store handles.
+
+Keeps at most ``max_size`` handles open and drops any handle unused for
+``idle_seconds``, closing the underlying client so long-running workers do not
+accumulate memory and file handles for every user they have ever served.
+
+Another process (the ``process_uploads`` drainer, another worker's ingestion
+thread, the embedding sidecar) may write a store this process has open, and
+an open handle does not see those writes. With ``version`` set, each handle is
+tagged with the scope's catalog version when opened and reopened once that
+version moves. Handles taken with ``lease()`` are never closed under their
+user: a retired handle is closed when its last lease ends, and the
+replacement is opened only after that. Chroma shares one client per directory
+within a process, so it only rereads the store once every handle is closed.
+"""
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Hashable, Iterator, Optional
+
+
+def release_chroma_system(client) -> None:
+    """Stop and forget the System a Chroma client runs on, for chromadb versions without Client.close().
+
+    Those versions cache one System per directory for the life of the process,
+    so a closed store would keep its memory and keep serving stale data when
+    reopened. The pool never has two handles on one directory open at once, so
+    no other client still uses the System.
+    """
+    from chromadb.api.shared_system_client import SharedSystemClient
+    system = SharedSystemClient._identifier_to_system.pop(client._identifier, None)
+    if system is not None:
+        system.stop()
+
+
+def close_vector_store(vector_store) -> None:
+    """Release a store's resources; for Chroma, stop its System once no client uses it"""
+    close = getattr(vector_store, "close", None)
+    client = getattr(vector_store, "_client", None)
+    if close is None and client is not None:
+        close = getattr(client, "close", None) or (lambda: release_chroma_system(client))
+    if close is not None:
+        try:
+            close()
+        except Exception as e:
+            print(f"✗ Error closing vector store: {e}")
+
+
+class StorePool:
+    """Thread-safe LRU cache of handles built on demand by ``factory(key)``"""
+
+    def __init__(self, factory: Callable[[Hashable], Any], max_size: int = 256, idle_seconds: float = 1800,
+                 on_evict: Optional[Callable[[Any], None]] = close_vector_store, lock: Optional[threading.RLock] = None,
+                 version: Optional[Callable[[Hashable], Any]] = None, drain_timeout: float = 5.0):
+        self.factory = factory
+        self.max_size = max_size
+        self.idle_seconds = idle_seconds
+        self.on_evict = on_evict
+        self.lock = lock or threading.RLock()
+        self.version = version
+        self.drain_timeout = drain_timeout
+        self._drained = threading.Condition(self.lock)
+        self._entries = OrderedDict()  # key -> (handle, last_used, version), least recently used first
+        self._leases = {}  # id(handle) -> active leases
+        self._retired = {}  # id(handle) -> handle closed once its last lease ends
+        self._draining = {}  # key -> retired handle a replacement waits for
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.reopens = 0
+
+    def get(self, key: Hashable) -> Any:
+        """Return the handle for key, creating it (and evicting others) if needed"""
+        version = self.version(key) if self.version is not None else None
+        with self.lock:
+            return self._get(key, version, time.monotonic())
+
+    @contextmanager
+    def lease(self, key: Hashable) -> Iterator[Any]:
+        """Handle for key that stays open until the block ends, even if retired meanwhile"""
+        version = self.version(key) if self.version is not None else None
+        with self.lock:
+            handle = self._get(key, version, time.monotonic())
+            self._leases[id(handle)] = self._leases.get(id(handle), 0) + 1
+        try:
+            yield handle
+        finally:
+            with self.lock:
+                remaining = self._leases[id(handle)] - 1
+                if remaining:
+                    self._leases[id(handle)] = remaining
+                else:
+                    del self._leases[id(handle)]
+                    if self._retired.pop(id(handle), None) is not None:
+                        self._close(handle)
+
+    def _get(self, key: Hashable, version: Any, now: float) -> Any:
+        # Caller holds lock
+        self._evict_idle(now)
+        entry = self._entries.get(key)
+        if entry is not None and entry[2] != version:
+            # Written elsewhere since this handle was opened
+            self.reopens += 1
+            self._evict(key)
+            entry = None
+        if entry is not None:
+            self.hits += 1
+            handle = entry[0]
+        else:
+            self._wait_for_drain(key)
+            entry = self._entries.get(key)  # opened by another thread while we waited
+            if entry is not None:
+                self.hits += 1
+                handle, version = entry[0], entry[2]
+            else:
+                self.misses += 1
+                handle = self.factory(key)
+        self._entries[key] = (handle, now, version)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._evict(next(iter(self._entries)))
+        return handle
+
+    def _wait_for_drain(self, key: Hashable) -> None:
+        """Let the retired handle of key close before opening its replacement"""
+        deadline = time.monotonic() + self.drain_timeout
+        while key in self._draining:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                print(f"✗ Vector store {key} still in use after {self.drain_timeout}s; opening a new handle anyway")
+                self._draining.pop(key, None)
+                return
+            self._drained.wait(remaining)
+
+    def _close(self, handle: Any) -> None:
+        # Caller holds lock
+        for key, draining in list(self._draining.items()):
+            if draining is handle:
+                del self._draining[key]
+        if self.on_evict is not None:
+            self.on_evict(handle)
+        self._drained.notify_all()
+
+    def _retire(self, key: Hashable, handle: Any) -> None:
+        """Close a handle now, or once its last lease ends"""
+        if self._leases.get(id(handle)):
+            self._retired[id(handle)] = handle
+            self._draining[key] = handle
+        else:
+            self._close(handle)
+
+    def pop(self, key: Hashable) -> None:
+        """Close and forget a handle, e.g. when its data is deleted"""
+        with self.lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._retire(key, entry[0])
+
+    def clear(self) -> None:
+        """Close and forget every handle"""
+        with self.lock:
+            entries = list(self._entries.items())
+            self._entries.clear()
+            for key, (handle, _, _) in entries:
+                self._retire(key, handle)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self.lock:
+            return key in self._entries
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self._entries)
+
+    def _evict_idle(self, now: float) -> None:
+        while self._entries:
+            key, (_, last_used, _) = next(iter(self._entries.items()))
+            if now - last_used < self.idle_seconds:
+                break
+            self._evict(key)
+
+    def _evict(self, key: Hashable) -> None:
+        handle, _, _ = self._entries.pop(key)
+        self.evictions += 1
+        self._retire(key, handle)
+
+    def stats(self) -> Dict[str, int]:
+        """Hit, miss, eviction and reopen counters plus the number of open handles"""
+        with self.lock:
+            return {
+                "open": len(self._entries),
+                "leased": len(self._leases),
+                "draining": len(self._retired),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "reopens": self.reopens,
+            }
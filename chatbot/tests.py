@@ -1,3 +1,526 @@
-from django.test import TestCase
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from contextlib import contextmanager
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError
+from django.test import SimpleTestCase, TestCase, override_settings
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from .store_pool import StorePool
+
+
+def open_chroma(root: str, key: str):
+    from langchain_chroma import Chroma
+    return Chroma(collection_name=f"user_{key}", persist_directory=os.path.join(root, key))
+
+
+class StorePoolTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+
+    def test_evicted_chroma_store_releases_its_system(self):
+        from chromadb.api.shared_system_client import SharedSystemClient
+        pool = StorePool(lambda key: open_chroma(self.root, key), max_size=1)
+        identifier = pool.get("1")._client._identifier
+        self.assertIn(identifier, SharedSystemClient._identifier_to_system)
+        pool.get("2")  # evicts "1"
+        self.assertNotIn(identifier, SharedSystemClient._identifier_to_system)
+        pool.clear()
+        self.assertEqual(pool.stats()["open"], 0)
+
+    def test_reopened_chroma_store_sees_another_process_writes(self):
+        versions = {"1": 0}
+        pool = StorePool(lambda key: open_chroma(self.root, key), version=versions.get)
+        with pool.lease("1") as store:
+            store._collection.add(ids=["a"], embeddings=[[1.0, 0.0]], documents=["first"])
+        # Another process (an upload drainer) writes the same store
+        subprocess.run([sys.executable, "-c", (
+            "import chromadb, sys; chromadb.PersistentClient(path=sys.argv[1]).get_collection('user_1')"
+            ".add(ids=['b'], embeddings=[[0.0, 1.0]], documents=['second'])"
+        ), os.path.join(self.root, "1")], check=True)
+        versions["1"] = 1  # the catalog version moves with that write
+        result = pool.get("1")._collection.query(query_embeddings=[[0.0, 1.0]], n_results=1)
+        self.assertEqual(result["documents"], [["second"]])
+        self.assertEqual(pool.stats()["reopens"], 1)
+        pool.clear()
+
+
+
+class NumpyVectorStoreTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+
+    def open(self, dtype="float32"):
+        from .numpy_store import NumpyVectorStore
+        store = NumpyVectorStore(os.path.join(self.root, dtype), None, dtype=dtype)
+        self.addCleanup(store.close)
+        return store
+
+    def nearest(self, store, vector):
+        return [doc.page_content for doc, _ in store.similarity_search_by_vector_with_relevance_scores(vector, k=1)]
+
+    def test_upsert_and_delete_keep_rows_contiguous(self):
+        store = self.open()
+        store.add_embeddings(["a", "b", "c"], [[1, 0, 0], [0, 1, 0], [0, 0, 1]],
+                             [Document(page_content=text) for text in ("a", "b", "c")])
+        store.add_embeddings(["b"], [[0, 2, 0]], [Document(page_content="b2")])  # same ID: overwritten
+        self.assertEqual(store.count(), 3)
+        store.delete(["a", "missing"])  # "c" moves into row 0
+        self.assertEqual(store.count(), 2)
+        self.assertEqual(self.nearest(store, [0, 0, 1]), ["c"])
+        self.assertEqual(self.nearest(store, [0, 1, 0]), ["b2"])
+        self.assertEqual(store.check_vectors(), [])
+        # A second handle on the same directory sees the same rows
+        self.assertEqual([doc.page_content for doc in self.open().get_by_ids(["a", "b", "c"])], ["b2", "c"])
+
+    def test_int8_search_ranks_like_float32(self):
+        import numpy as np
+        rng = np.random.default_rng(0)
+        vectors = rng.standard_normal((500, 64)).astype(np.float32)
+        documents = [Document(page_content=str(i)) for i in range(len(vectors))]
+        exact, quantized = self.open(), self.open("int8")
+        for store in (exact, quantized):
+            store.add_embeddings([str(i) for i in range(len(vectors))], vectors, documents)
+        for query in rng.standard_normal((20, 64)):
+            expected = exact.similarity_search_by_vector_with_relevance_scores(query, k=3)
+            actual = quantized.similarity_search_by_vector_with_relevance_scores(query, k=3)
+            # Candidates are re-scored at full precision, so ranking and distances match
+            self.assertEqual([doc.id for doc, _ in actual], [doc.id for doc, _ in expected])
+            for (_, distance), (_, expected_distance) in zip(actual, expected):
+                self.assertAlmostEqual(distance, expected_distance, places=5)
+
+
+class Chunk:
+    def __init__(self, content):
+        self.content = content
+
+
+class RateLimited(Exception):
+    status_code = 429
+
+    def __init__(self, retry_after):
+        super().__init__("rate limited")
+        self.response = mock.Mock(headers={"retry-after": retry_after})
+
+
+class FakeLLM:
+    """Streams a fixed answer; raises the queued errors first and can hold the stream after its first chunk"""
+
+    def __init__(self, answer="Hello there", errors=()):
+        import threading
+        self.answer, self.errors, self.calls = answer, list(errors), 0
+        self.started, self.gate = threading.Event(), threading.Event()
+        self.gate.set()
+
+    def stream(self, messages):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        pieces = self.answer.split(" ")
+        yield Chunk(pieces[0])
+        self.started.set()
+        self.gate.wait(5)
+        for piece in pieces[1:]:
+            yield Chunk(" " + piece)
+
+
+class LLMGatewayTests(SimpleTestCase):
+    def gateway(self, llm, **options):
+        from .llm_gateway import LLMGateway
+        return LLMGateway(lambda: llm, **{"requests_per_minute": 0, "tokens_per_minute": 0, **options})
+
+    def test_identical_concurrent_prompts_share_one_call(self):
+        import threading
+        import time
+        llm = FakeLLM()
+        llm.gate.clear()
+        gateway = self.gateway(llm)
+        messages = [{"role": "user", "content": "hi"}]
+        answers = []
+        leader = threading.Thread(target=lambda: answers.append(gateway.invoke(messages)))
+        leader.start()
+        self.assertTrue(llm.started.wait(5))
+        follower = threading.Thread(target=lambda: answers.append(gateway.invoke(messages)))
+        follower.start()
+        deadline = time.monotonic() + 5
+        while gateway.stats()["coalesced"] < 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        llm.gate.set()
+        leader.join(5)
+        follower.join(5)
+        self.assertEqual(answers, ["Hello there", "Hello there"])
+        self.assertEqual(llm.calls, 1)
+        self.assertEqual(gateway.stats()["in_flight"], 0)
+
+    def test_calls_beyond_the_request_budget_are_shed(self):
+        from .llm_gateway import LLMOverloaded
+        # One request per ten seconds, and no caller may wait more than one
+        gateway = self.gateway(FakeLLM(), requests_per_minute=6, max_wait=1)
+        self.assertEqual(gateway.invoke([{"role": "user", "content": "first"}]), "Hello there")
+        with self.assertRaises(LLMOverloaded) as raised:
+            gateway.invoke([{"role": "user", "content": "second"}])
+        self.assertGreater(raised.exception.retry_after, 1)
+        self.assertEqual(gateway.stats()["shed"], 1)
+
+    def test_retry_after_pauses_every_caller(self):
+        from .llm_gateway import LLMOverloaded
+        llm = FakeLLM(errors=[RateLimited("30")])
+        gateway = self.gateway(llm)
+        with mock.patch("chatbot.llm_gateway.time.sleep") as sleep:
+            self.assertEqual(gateway.invoke([{"role": "user", "content": "hi"}]), "Hello there")
+        self.assertGreaterEqual(sleep.call_args_list[0].args[0], 30)
+        self.assertEqual(llm.calls, 2)
+        stats = gateway.stats()
+        self.assertEqual((stats["retries"], stats["rate_limited"]), (1, 1))
+        # The pause Groq asked for applies to the next caller too
+        self.assertGreater(stats["paused_seconds"], 20)
+        gateway.max_wait = 10
+        with self.assertRaises(LLMOverloaded):
+            gateway.check_admission()
+
+    def test_client_errors_are_not_retried(self):
+        error = RateLimited("1")
+        error.status_code = 400
+        llm = FakeLLM(errors=[error])
+        gateway = self.gateway(llm)
+        with self.assertRaises(RateLimited):
+            gateway.invoke([{"role": "user", "content": "hi"}])
+        self.assertEqual(llm.calls, 1)
+        self.assertEqual(gateway.stats()["failures"], 1)
+
+
+class SemanticAnswerCacheTests(SimpleTestCase):
+    def test_context_key_covers_corpus_chunks_and_model(self):
+        from .answer_cache import context_key
+        a, b = Document(page_content="alpha"), Document(page_content="beta")
+        key = context_key("v1", [a, b], "llama")
+        self.assertEqual(context_key("v1", [b, a], "llama"), key)  # retrieval order does not matter
+        self.assertNotEqual(context_key("v2", [a, b], "llama"), key)
+        self.assertNotEqual(context_key("v1", [a], "llama"), key)
+        self.assertNotEqual(context_key("v1", [a, b], "mixtral"), key)
+
+    def test_lookup_matches_similar_questions_in_the_same_context_only(self):
+        from .answer_cache import SemanticAnswerCache
+        cache = SemanticAnswerCache(threshold=0.95)
+        cache.store("ctx", [1.0, 0.0], "answer")
+        self.assertEqual(cache.lookup("ctx", [0.99, 0.05])[0], "answer")
+        self.assertIsNone(cache.lookup("ctx", [0.0, 1.0]))
+        self.assertIsNone(cache.lookup("other", [1.0, 0.0]))
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    def test_entries_expire_and_are_evicted(self):
+        from .answer_cache import SemanticAnswerCache
+        cache = SemanticAnswerCache(ttl_seconds=0)
+        cache.store("ctx", [1.0, 0.0], "answer")
+        self.assertIsNone(cache.lookup("ctx", [1.0, 0.0]))
+        self.assertEqual(cache.expirations, 1)
+        cache = SemanticAnswerCache(max_entries=1)
+        cache.store("old", [1.0, 0.0], "first")
+        cache.store("new", [1.0, 0.0], "second")
+        self.assertIsNone(cache.lookup("old", [1.0, 0.0]))
+        self.assertEqual(cache.lookup("new", [1.0, 0.0])[0], "second")
+        self.assertEqual(cache.evictions, 1)
+
+
+class AnswerCacheBypassTests(TestCase):
+    def turn(self, **state):
+        return {"user_id": "1", "question_embedding": [1.0, 0.0], "documents": [], "history": [], "summary": "", **state}
+
+    def test_fresh_question_is_cached(self):
+        from .langgraph import chatbot
+        self.assertIsNotNone(chatbot.answer_cache_context(self.turn()))
+
+    def test_questions_with_personal_memory_are_not_cached(self):
+        from .langgraph import chatbot
+        self.assertIsNone(chatbot.answer_cache_context(self.turn(history=[{"role": "user", "content": "hi"}])))
+        # The rolling summary outlives the verbatim turns and is just as private
+        self.assertIsNone(chatbot.answer_cache_context(self.turn(summary="The user is planning a trip to Oslo.")))
+
+
+class FakeStore:
+    """Records upserts and deletes; fails on the fail_on-th add_documents call"""
+
+    def __init__(self, fail_on=None):
+        self.ids, self.calls, self.fail_on = set(), 0, fail_on
+
+    def add_documents(self, documents, ids):
+        self.calls += 1
+        if self.calls == self.fail_on:
+            raise RuntimeError("embedding service went away")
+        self.ids.update(ids)
+
+    def delete(self, ids):
+        self.ids.difference_update(ids)
+
+
+class ProcessDocumentTests(TestCase):
+    def setUp(self):
+        from . import ingest_worker
+        from .langgraph import chatbot
+        self.user = User.objects.create_user("alice")
+        self.document = ingest_worker.UploadedDocument.objects.create(
+            user=self.user, file="documents/notes.txt", file_name="notes.txt")
+        self.store = FakeStore()
+
+        @contextmanager
+        def lease(user_id):
+            yield self.store
+
+        batches = [[Document(page_content=f"chunk {i}") for i in range(2)] for _ in range(3)]
+        for patcher in (
+            mock.patch.object(chatbot, "lease_user_vector_store", lease),
+            mock.patch.object(ingest_worker, "iter_splits", lambda *args, **kwargs: iter(batches)),
+            mock.patch.object(ingest_worker, "file_sha256", lambda path: "hash"),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def catalog_files(self):
+        from . import catalog
+        catalog.invalidate(str(self.user.id))
+        return catalog.get_snapshot(str(self.user.id))["files"]
+
+    def test_ingested_upload_is_recorded(self):
+        from .ingest_worker import process_document
+        process_document(self.document)
+        self.document.refresh_from_db()
+        self.assertEqual(self.document.status, self.document.STATUS_DONE)
+        self.assertEqual(len(self.store.ids), 6)
+        self.assertEqual(self.catalog_files(), ["notes.txt"])
+
+    def test_failure_partway_leaves_nothing_searchable(self):
+        from .ingest_worker import process_document
+        self.store.fail_on = 3
+        process_document(self.document)
+        self.document.refresh_from_db()
+        self.assertEqual(self.document.status, self.document.STATUS_FAILED)
+        self.assertEqual(self.store.ids, set())
+        self.assertEqual(self.catalog_files(), [])
+
+    def test_upload_deleted_during_ingestion_is_rolled_back(self):
+        from .ingest_worker import process_document
+        from .models import UploadedDocument
+        UploadedDocument.objects.filter(id=self.document.id).delete()
+        process_document(self.document)  # must not raise
+        self.assertEqual(self.store.ids, set())
+        self.assertEqual(self.catalog_files(), [])
+
+
+class ChatHistoryCursorTests(TestCase):
+    def setUp(self):
+        from .models import Chat
+        self.user = User.objects.create_user("bob")
+        self.client.force_login(self.user)
+        self.chats = [Chat.objects.create(user=self.user, message=f"q{i}", response=f"a{i}") for i in range(5)]
+        # Two chats in the same microsecond must still page apart on the ID tie-breaker
+        Chat.objects.filter(id=self.chats[2].id).update(created_at=self.chats[1].created_at)
+
+    def page(self, before=None):
+        params = {"limit": 2, **({"before": before} if before else {})}
+        return self.client.get("/chat_history/", params)
+
+    def test_pages_walk_back_without_gaps_or_repeats(self):
+        seen, cursor = [], None
+        while True:
+            data = self.page(cursor).json()
+            seen = [chat["id"] for chat in data["chats"]] + seen
+            cursor = data["next_cursor"]
+            if cursor is None:
+                break
+        self.assertEqual(seen, [chat.id for chat in self.chats])
+
+    def test_malformed_cursors_are_rejected(self):
+        for cursor in ("nonsense", "1-2-3", "9" * 30 + "-1", "1-" + "9" * 30):
+            self.assertEqual(self.page(cursor).status_code, 400, cursor)
+
+
+class SidecarRetryTests(SimpleTestCase):
+    """The first connection drops each request after reading it, as a sidecar crashing mid-op would"""
+
+    def setUp(self):
+        import socketserver
+        import threading
+        from .embedding_sidecar import recv_message, send_message
+        self.received = []
+        received = self.received
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                header, _ = recv_message(self.request)
+                received.append(header["op"])
+                if len(received) > 1:
+                    send_message(self.request, {"ok": True})
+
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        self.path = os.path.join(root, "sidecar.sock")
+        server = socketserver.ThreadingUnixStreamServer(self.path, Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+    def test_reads_are_resent_on_a_new_connection(self):
+        from .embedding_sidecar import SidecarEmbeddings
+        self.assertEqual(SidecarEmbeddings(self.path, timeout=5).request("stats")[0], {"ok": True})
+        self.assertEqual(self.received, ["stats", "stats"])
+
+    def test_writes_that_reached_the_sidecar_are_not_resent(self):
+        from .embedding_sidecar import SidecarEmbeddings
+        with self.assertRaises(ConnectionError):
+            SidecarEmbeddings(self.path, timeout=5).request("delete_uploads", user_id="1")
+        self.assertEqual(self.received, ["delete_uploads"])
+
+
+
+class ChatWriterTests(TestCase):
+    def setUp(self):
+        from .chat_writer import ChatWriter
+        self.user = User.objects.create_user("carol")
+        # Flushed by hand: the background thread's interval is longer than any test
+        self.writer = ChatWriter(max_batch=10, flush_interval=3600, max_failures=2)
+        patcher = mock.patch("chatbot.memory.schedule_summary_update")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def enqueue(self, count):
+        from .models import Chat
+        for i in range(count):
+            self.writer.enqueue(Chat(user=self.user, message=f"q{i}", response=f"a{i}"))
+
+    def test_queued_turns_are_visible_until_flushed_in_one_batch(self):
+        from .models import Chat
+        self.enqueue(3)
+        self.assertEqual([chat.message for chat in self.writer.pending_for_user(self.user.id)], ["q0", "q1", "q2"])
+        self.assertEqual(self.writer.flush(), 3)
+        self.assertEqual(Chat.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(self.writer.pending_for_user(self.user.id), [])
+        self.assertEqual(self.writer.stats()["batches"], 1)
+
+    def test_failed_batch_is_retried_then_saved_row_by_row(self):
+        from .models import Chat
+        self.enqueue(2)
+        with mock.patch.object(Chat.objects, "bulk_create", side_effect=DatabaseError("database is locked")):
+            self.assertEqual(self.writer.flush(), 0)
+            self.assertEqual(len(self.writer.pending_for_user(self.user.id)), 2)  # kept for the next flush
+            self.assertEqual(self.writer.flush(), 2)  # second failure in a row: one save per row
+        self.assertEqual(Chat.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(self.writer.stats()["failures"], 2)
+        self.assertEqual(self.writer.stats()["queued"], 0)
+
+
+class LetterEmbeddings(Embeddings):
+    """Deterministic stand-in for MiniLM: letter counts of the text"""
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        return [text.lower().count(letter) + 0.1 for letter in "etaoinshrdlu"]
+
+
+@override_settings(CHATBOT_VECTOR_BACKEND="numpy", CHATBOT_CATALOG_CACHE_SECONDS=0, CHATBOT_INDEX_SNAPSHOT="")
+class IndexSnapshotTests(TestCase):
+    def setUp(self):
+        from . import langgraph
+        from .models import UploadedDocument
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        self.index_dir = os.path.join(root, "index")
+        data_folder = os.path.join(root, "data")
+        os.makedirs(data_folder)
+        os.makedirs(os.path.join(root, "media", "documents"))
+        with open(os.path.join(data_folder, "guide.txt"), "w") as f:
+            f.write("Shared handbook text about the office.\n\nOpening hours are nine to five.")
+        with open(os.path.join(root, "media", "documents", "notes.txt"), "w") as f:
+            f.write("Private notes about a trip to Oslo.")
+
+        overrides = override_settings(MEDIA_ROOT=os.path.join(root, "media"), CHATBOT_INDEX_DIR=self.index_dir)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        for patcher in (
+            mock.patch.object(langgraph, "_embeddings", LetterEmbeddings()),
+            mock.patch.multiple(langgraph.chatbot, data_folder=data_folder, index_root=None,
+                                index_snapshot=None, corpus_loaded=False),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(langgraph.chatbot.vector_stores.clear)
+        self.addCleanup(langgraph.chatbot.shared_store.clear)
+
+        self.user = User.objects.create_user("dave")
+        self.document = UploadedDocument.objects.create(
+            user=self.user, file="documents/notes.txt", file_name="notes.txt", status=UploadedDocument.STATUS_DONE)
+
+    def build(self):
+        from . import index_snapshot
+        out = StringIO()
+        call_command("build_index", output=self.index_dir, workers=1, activate=True, stdout=out, stderr=StringIO())
+        self.assertIn("verified", out.getvalue())
+        return index_snapshot.resolve(self.index_dir, "current")
+
+    def verify(self):
+        call_command("build_index", output=self.index_dir, verify="current", stdout=StringIO())
+
+    def test_build_records_every_scope_without_touching_live_state(self):
+        from . import catalog, index_snapshot
+        path = self.build()
+        scopes = index_snapshot.read_manifest(path)["scopes"]
+        self.assertEqual([file["file_name"] for file in scopes["shared"]["files"]], ["guide.txt"])
+        self.assertEqual([file["key"] for file in scopes[str(self.user.id)]["files"]], [f"upload:{self.document.id}"])
+        self.assertEqual(catalog.get_snapshot(str(self.user.id))["files"], [])
+        self.assertFalse(os.path.exists(os.path.join(self.index_dir, "live")))
+
+    def test_verify_catches_a_store_that_no_longer_matches(self):
+        from .numpy_store import NumpyVectorStore
+        path = self.build()
+        store = NumpyVectorStore(os.path.join(path, "shared"), None)
+        store.delete([next(store.iter_chunks())[0]])
+        store.close()
+        with self.assertRaises(CommandError):
+            self.verify()
+
+    def test_attached_snapshot_is_copied_and_stays_read_only(self):
+        from . import catalog
+        from .langgraph import chatbot
+        path = self.build()
+        chatbot.index_root, chatbot.index_snapshot = None, path
+        with chatbot.lease_shared_vector_store() as store:
+            self.assertTrue(store.similarity_search_by_vector_with_relevance_scores(LetterEmbeddings().embed_query("hours")))
+            store.delete([next(store.iter_chunks())[0]])  # writes go to the live copy
+        self.assertEqual(chatbot.index_root, os.path.join(self.index_dir, "live", os.path.basename(path)))
+        self.assertEqual(catalog.get_snapshot("shared")["files"], ["guide.txt"])
+        chatbot.shared_store.clear()
+        self.verify()
+
+
+class FastTextSplitterTests(SimpleTestCase):
+    def test_chunks_match_recursive_character_splitter(self):
+        import random
+        from .ingestion import make_splitter
+        fragments = ["word", "another", "x" * 37, " ", "  ", "\n", "\n\n", "\n\n\n", " \n", "\t", "é"]
+        rng = random.Random(0)
+        for _ in range(300):
+            text = "".join(rng.choice(fragments) for _ in range(rng.randint(0, 300)))
+            chunk_size = rng.randint(1, 120)
+            chunk_overlap = rng.randint(0, chunk_size)
+            self.assertEqual(make_splitter(chunk_size, chunk_overlap, "fast").split_text(text),
+                             make_splitter(chunk_size, chunk_overlap, "recursive").split_text(text),
+                             (text, chunk_size, chunk_overlap))
+
+    def test_documents_keep_their_metadata(self):
+        from .ingestion import make_splitter
+        pages = [Document(page_content="one two three " * 50, metadata={"page": i}) for i in range(3)]
+        fast = make_splitter(100, 20, "fast").split_documents(pages)
+        recursive = make_splitter(100, 20, "recursive").split_documents(pages)
+        self.assertEqual([(doc.page_content, doc.metadata) for doc in fast],
+                         [(doc.page_content, doc.metadata) for doc in recursive])
@@ -1,11 +1,23 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
+if settings.CHATBOT_ASYNC_VIEWS:
+    chatbot_view = views.async_chatbot_view
+    stream_chat = views.async_stream_chat
+else:
+    chatbot_view = views.chatbot_view
+    stream_chat = views.stream_chat
+
 urlpatterns = [
-    path('', views.chatbot_view, name='chatbot'),
+    path('', chatbot_view, name='chatbot'),
     path('login', views.login, name='login'),
     path('register', views.register, name='register'),
     path('logout', views.logout, name='logout'),
     path('delete_chat/', views.delete_chat_history, name='delete_chat_history'), 
-    path('stream_chat/', views.stream_chat, name='stream_chat'),
+    path('stream_chat/', stream_chat, name='stream_chat'),
+    path('upload_document/', views.upload_document, name='upload_document'),
+    path('ingest_status/', views.ingest_status, name='ingest_status'),
+    path('chat_history/', views.chat_history, name='chat_history'),
+    path('cache_stats/', views.cache_stats, name='cache_stats'),
 ]
@@ -1,50 +1,104 @@
 import re
 import json
+import asyncio
+from contextlib import aclosing
 import tempfile
 import os
 from django.shortcuts import render, redirect
-from .langgraph import chatbot, llm
+from .langgraph import chatbot, embedding_stats, llm_gateway
+from .llm_gateway import LLMOverloaded
 from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.views.decorators.http import require_POST
 from django.contrib import auth
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.contrib import messages
-from .models import Chat, UploadedDocument
+from .models import Chat, UploadedDocument, ConversationMemory
+from .ingest_worker import start_background_ingestion
+from .chat_writer import chat_writer, save_chat, asave_chat
+from .router import route_stats
+from .ingestion import SUPPORTED_EXTENSIONS
 from django.utils import timezone
+from django.conf import settings
+from django.db.models import Q
 from django.views.decorators.csrf import csrf_exempt
-from langchain_core.messages import HumanMessage
+from asgiref.sync import sync_to_async
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+MAX_HISTORY_PAGE_SIZE = 100
 
 
 def ask_groq(message):
     """Fallback to original Groq function if needed"""
+    from langchain_core.messages import HumanMessage
     try:
-        response = llm.invoke([HumanMessage(content=message)])
-        return response.content
+        return llm_gateway.invoke([HumanMessage(content=message)])
     except Exception as e:
         return f"Error with Groq API: {str(e)}"
 
 
+def overloaded_response(error):
+    """503 telling the client when the LLM budget should allow another call"""
+    response = JsonResponse({'error': str(error)}, status=503)
+    response['Retry-After'] = str(max(1, round(error.retry_after)))
+    return response
+
+
+def sse_event(data, event=None):
+    """Format a Server-Sent Event; data is JSON-encoded so newlines survive"""
+    payload = f"event: {event}\n" if event else ""
+    return payload + f"data: {json.dumps(data)}\n\n"
+
+
+def encode_history_cursor(chat):
+    """Opaque keyset cursor: created_at in epoch microseconds and the chat ID"""
+    delta = chat.created_at - EPOCH
+    return f"{(delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds}-{chat.id}"
+
+
+def decode_history_cursor(cursor):
+    """Inverse of encode_history_cursor; ValueError or OverflowError for anything it could not have produced"""
+    microseconds, chat_id = cursor.split('-')
+    chat_id = int(chat_id)
+    if not 0 <= chat_id < 2 ** 63:
+        raise OverflowError('chat ID out of range')
+    return EPOCH + timedelta(microseconds=int(microseconds)), chat_id
+
+
+def chat_history_page(user, cursor=None, limit=None):
+    """One page of a user's chats older than the cursor, oldest first, plus the cursor for the next page"""
+    limit = limit or settings.CHATBOT_HISTORY_PAGE_SIZE
+    chats = Chat.objects.filter(user=user)
+    if cursor:
+        created_at, chat_id = decode_history_cursor(cursor)
+        chats = chats.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=chat_id))
+    page = list(chats.order_by('-created_at', '-id')[:limit + 1])
+    next_cursor = encode_history_cursor(page[limit - 1]) if len(page) > limit else None
+    return page[:limit][::-1], next_cursor
+
+
 @login_required(login_url='/login')
 def chatbot_view(request):
-    chats = Chat.objects.filter(user=request.user)
-
     if request.method == 'POST':
         message = request.POST.get('message', '').strip()
                 
         if message:
             # Create LangGraph agent
-            agent = chatbot.create_agent()
+            agent = chatbot.get_agent()
             
             # Prepare messages for the agent
             messages = [{"role": "user", "content": message}]
             
             # Invoke agent
-            result = agent.invoke({
-                "messages": messages,
-                "user_id": str(request.user.id),
-                "question": message
-            })
+            try:
+                result = agent.invoke({
+                    "messages": messages,
+                    "user_id": str(request.user.id),
+                    "question": message
+                })
+            except LLMOverloaded as e:
+                return overloaded_response(e)
             
             response = result["response"]
             
@@ -55,13 +109,15 @@ def chatbot_view(request):
                 response=response, 
                 created_at=timezone.now()
             )
-            chat.save()
+            save_chat(chat)
 
             return JsonResponse({'message': message, 'response': response})
         else:
             return JsonResponse({'error': 'No message provided'}, status=400)
 
-    return render(request, 'chatbot.html', {'chats': chats})
+    # Only the most recent page is rendered; older turns load on scroll
+    chats, history_cursor = chat_history_page(request.user)
+    return render(request, 'chatbot.html', {'chats': chats, 'history_cursor': history_cursor})
 
 
 @csrf_exempt
@@ -70,36 +126,41 @@ def stream_chat(request):
     """Streaming chat endpoint"""
     if request.method == 'POST':
         message = request.POST.get('message', '').strip()
+        # Shed load before the stream starts, while a status code can still be sent
+        try:
+            llm_gateway.check_admission()
+        except LLMOverloaded as e:
+            return overloaded_response(e)
 
         def generate():
+            response = ""
             try:
-                agent = chatbot.create_agent()
-                result = agent.invoke({
+                agent = chatbot.get_agent()
+                inputs = {
                     "messages": [{"role": "user", "content": message}],
                     "user_id": str(request.user.id),
                     "question": message
-                })
+                }
                 
-                response = result["response"]
+                # Forward tokens as SSE events as soon as the LLM emits them
+                for token in chatbot.stream_agent_response(agent, inputs):
+                    response += token
+                    yield sse_event(token)
                 
-                # Send response in chunks for better streaming
-                words = response.split()
-                for word in words:
-                    yield f"data: {word}\n\n"
-                
-                # Save to database (no file info)
+                # Save to database once the stream has finished (no file info)
                 chat = Chat(
                     user=request.user,
                     message=message,
                     response=response,
                     created_at=timezone.now()
                 )
-                chat.save()
+                save_chat(chat)
+                yield sse_event("", event="done")
                 
             except Exception as e:
-                yield f"data: Error: {str(e)}\n\n"
+                yield sse_event(f"Error: {str(e)}", event="error")
         
-        response = StreamingHttpResponse(generate(), content_type='text/plain')
+        response = StreamingHttpResponse(generate(), content_type='text/event-stream')
         response['Cache-Control'] = 'no-cache'
         response['X-Accel-Buffering'] = 'no'
         return response
@@ -107,22 +168,202 @@ def stream_chat(request):
     return JsonResponse({'error': 'Invalid request'}, status=400)
 
 
+@login_required(login_url='/login')
+async def async_chatbot_view(request):
+    """Async variant of chatbot_view for ASGI deployments"""
+    if request.method == 'POST':
+        user = await request.auser()
+        message = request.POST.get('message', '').strip()
+
+        if message:
+            agent = chatbot.get_agent()
+            try:
+                result = await chatbot.ainvoke_agent(agent, {
+                    "messages": [{"role": "user", "content": message}],
+                    "user_id": str(user.id),
+                    "question": message
+                })
+            except LLMOverloaded as e:
+                return overloaded_response(e)
+            except asyncio.CancelledError:
+                print(f"Client disconnected, cancelled generation for user {user.id}")
+                raise
+
+            response = result["response"]
+
+            chat = Chat(
+                user=user,
+                message=message,
+                response=response,
+                created_at=timezone.now()
+            )
+            await asave_chat(chat)
+
+            return JsonResponse({'message': message, 'response': response})
+        else:
+            return JsonResponse({'error': 'No message provided'}, status=400)
+
+    # Template rendering touches the ORM lazily, so keep it on a sync thread
+    return await sync_to_async(chatbot_view)(request)
+
+
+@csrf_exempt
+@login_required
+async def async_stream_chat(request):
+    """Async streaming chat endpoint; a client disconnect cancels the LLM call"""
+    if request.method == 'POST':
+        user = await request.auser()
+        message = request.POST.get('message', '').strip()
+        try:
+            llm_gateway.check_admission()
+        except LLMOverloaded as e:
+            return overloaded_response(e)
+
+        async def generate():
+            response = ""
+            try:
+                agent = chatbot.get_agent()
+                inputs = {
+                    "messages": [{"role": "user", "content": message}],
+                    "user_id": str(user.id),
+                    "question": message
+                }
+
+                # aclosing releases the LLM slot immediately if we are cancelled
+                async with aclosing(chatbot.astream_agent_response(agent, inputs)) as tokens:
+                    async for token in tokens:
+                        response += token
+                        yield sse_event(token)
+
+                chat = Chat(
+                    user=user,
+                    message=message,
+                    response=response,
+                    created_at=timezone.now()
+                )
+                await asave_chat(chat)
+                yield sse_event("", event="done")
+
+            except asyncio.CancelledError:
+                # Django cancels the stream on disconnect; nothing is saved
+                print(f"Client disconnected, cancelled stream for user {user.id}")
+                raise
+            except Exception as e:
+                yield sse_event(f"Error: {str(e)}", event="error")
+
+        response = StreamingHttpResponse(generate(), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    return JsonResponse({'error': 'Invalid request'}, status=400)
+
+
+@require_POST
+@login_required(login_url='/login')
+def upload_document(request):
+    """Queue an uploaded file for background ingestion"""
+    uploaded_file = request.FILES.get('file')
+    if uploaded_file is None:
+        return JsonResponse({'error': 'No file provided'}, status=400)
+    if not uploaded_file.name.lower().endswith(SUPPORTED_EXTENSIONS):
+        return JsonResponse({'error': 'Unsupported file type'}, status=400)
+
+    document = UploadedDocument.objects.create(
+        user=request.user,
+        file=uploaded_file,
+        file_name=uploaded_file.name
+    )
+    start_background_ingestion()
+
+    return JsonResponse({'id': document.id, 'file_name': document.file_name, 'status': document.status}, status=202)
+
+
+@login_required(login_url='/login')
+def ingest_status(request):
+    """Ingestion progress of the current user's uploads, for the UI to poll"""
+    documents = UploadedDocument.objects.filter(user=request.user).order_by('-uploaded_at')
+    if documents.filter(status=UploadedDocument.STATUS_PENDING).exists():
+        # Resume draining if the process restarted with work still queued
+        start_background_ingestion()
+
+    return JsonResponse({
+        'documents': [
+            {
+                'id': document.id,
+                'file_name': document.file_name,
+                'status': document.status,
+                'chunk_count': document.chunk_count,
+                'error': document.error,
+                'uploaded_at': document.uploaded_at.isoformat(),
+                'processed_at': document.processed_at.isoformat() if document.processed_at else None,
+                'parse_seconds': document.parse_seconds,
+                'embed_seconds': document.embed_seconds,
+            }
+            for document in documents
+        ]
+    })
+
+
+@login_required(login_url='/login')
+def chat_history(request):
+    """Older chats for infinite scroll: ?before=<cursor>&limit=<n>"""
+    try:
+        limit = min(int(request.GET.get('limit', settings.CHATBOT_HISTORY_PAGE_SIZE)), MAX_HISTORY_PAGE_SIZE)
+        chats, next_cursor = chat_history_page(request.user, request.GET.get('before') or None, max(limit, 1))
+    except (ValueError, OverflowError):
+        return JsonResponse({'error': 'Invalid cursor or limit'}, status=400)
+
+    return JsonResponse({
+        'chats': [
+            {
+                'id': chat.id,
+                'message': chat.message,
+                'response': chat.response,
+                'created_at': chat.created_at.isoformat(),
+            }
+            for chat in chats
+        ],
+        'next_cursor': next_cursor,
+    })
+
+
+@login_required(login_url='/login')
+def cache_stats(request):
+    """Per-process cache hit rates and pool usage, for staff"""
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Forbidden'}, status=403)
+    return JsonResponse({
+        'pid': os.getpid(),
+        'answer_cache': chatbot.answer_cache.stats(),
+        'retrieval_cache': chatbot.retrieval_cache.stats(),
+        'vector_stores': chatbot.vector_stores.stats(),
+        'chat_writer': chat_writer.stats(),
+        'router': route_stats.stats(),
+        'llm_gateway': llm_gateway.stats(),
+        'embeddings': embedding_stats(),
+    })
+
+
 @require_POST
 @login_required(login_url='/login')
 def delete_chat_history(request):
     """Deletes all chat records and documents for the current user"""
     try:
-        # Delete chats
+        # Delete chats, including turns still waiting in the write-behind queue
+        chat_writer.flush()
         Chat.objects.filter(user=request.user).delete()
         
+        # The summary describes the deleted turns
+        ConversationMemory.objects.filter(user=request.user).delete()
+        
         # Delete documents
         UploadedDocument.objects.filter(user=request.user).delete()
         
         # Delete vector store (optional - more complex cleanup)
         try:
-            user_id = str(request.user.id)
-            if user_id in chatbot.vector_stores:
-                del chatbot.vector_stores[user_id]
+            # Drop the ingested chunks of the deleted uploads too
+            chatbot.delete_user_uploads(str(request.user.id))
         except:
             pass
             
@@ -77,10 +77,23 @@ WSGI_APPLICATION = 'django_chatbot.wsgi.application'
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
 
+# SQLite tuned for concurrent chat traffic: writers queue on the lock (busy timeout, IMMEDIATE
+# transactions) instead of failing with "database is locked", and connections are reused across
+# requests. CHATBOT_SQLITE_WAL=true also lets reads proceed alongside the single writer; it
+# switches the database file to WAL mode, which adds db.sqlite3-wal / db.sqlite3-shm beside it
+CHATBOT_SQLITE_WAL = os.getenv('CHATBOT_SQLITE_WAL', 'false').lower() == 'true'
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': int(os.getenv('CHATBOT_DB_CONN_MAX_AGE', '600')),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': 20,
+            'transaction_mode': 'IMMEDIATE',
+            **({'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL'} if CHATBOT_SQLITE_WAL else {}),
+        },
     }
 }
 
@@ -129,3 +142,111 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 LOGIN_URL = '/login'
 
+
+# Chatbot
+# Serve chat endpoints with the async views (run under ASGI, e.g. uvicorn workers)
+CHATBOT_ASYNC_VIEWS = os.getenv('CHATBOT_ASYNC_VIEWS', 'false').lower() == 'true'
+
+# Maximum number of in-flight LLM generations per process for the async views
+CHATBOT_MAX_CONCURRENT_LLM_CALLS = int(os.getenv('CHATBOT_MAX_CONCURRENT_LLM_CALLS', '32'))
+
+# Disk-backed cache of embedding vectors keyed by (model, text), shared by workers
+CHATBOT_EMBEDDING_CACHE = os.getenv('CHATBOT_EMBEDDING_CACHE', 'true').lower() == 'true'
+CHATBOT_EMBEDDING_CACHE_DIR = os.getenv('CHATBOT_EMBEDDING_CACHE_DIR', os.path.join(BASE_DIR, 'embedding_cache'))
+CHATBOT_EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv('CHATBOT_EMBEDDING_CACHE_MAX_ENTRIES', '200000'))
+
+# Micro-batch query embeddings from concurrent requests (batch size / max wait in ms)
+CHATBOT_EMBEDDING_BATCHING = os.getenv('CHATBOT_EMBEDDING_BATCHING', 'true').lower() == 'true'
+CHATBOT_EMBEDDING_BATCH_SIZE = int(os.getenv('CHATBOT_EMBEDDING_BATCH_SIZE', '32'))
+CHATBOT_EMBEDDING_BATCH_MAX_WAIT_MS = float(os.getenv('CHATBOT_EMBEDDING_BATCH_MAX_WAIT_MS', '5'))
+
+# Ingestion: parser processes (1 parses inline) and chunks embedded per vector store write
+CHATBOT_INGEST_WORKERS = int(os.getenv('CHATBOT_INGEST_WORKERS', str(os.cpu_count() or 1)))
+CHATBOT_INGEST_BATCH_SIZE = int(os.getenv('CHATBOT_INGEST_BATCH_SIZE', '256'))
+
+# Uploads stuck in "processing" this long (worker died) are claimed again
+CHATBOT_INGEST_STALE_SECONDS = int(os.getenv('CHATBOT_INGEST_STALE_SECONDS', '600'))
+
+# Warm up models from AppConfig.ready() (gunicorn does it per worker via gunicorn.conf.py)
+CHATBOT_WARMUP_ON_READY = os.getenv('CHATBOT_WARMUP_ON_READY', 'false').lower() == 'true'
+
+# Per-user vector store handles kept open per process, and idle time before one is closed
+CHATBOT_VECTOR_STORE_POOL_SIZE = int(os.getenv('CHATBOT_VECTOR_STORE_POOL_SIZE', '256'))
+CHATBOT_VECTOR_STORE_IDLE_SECONDS = int(os.getenv('CHATBOT_VECTOR_STORE_IDLE_SECONDS', '1800'))
+
+# How long a process may serve corpus catalog lookups from memory before re-reading the DB
+CHATBOT_CATALOG_CACHE_SECONDS = float(os.getenv('CHATBOT_CATALOG_CACHE_SECONDS', '5'))
+
+# Retrieval backend: "chroma", or "numpy" for in-process exact search
+CHATBOT_VECTOR_BACKEND = os.getenv('CHATBOT_VECTOR_BACKEND', 'chroma')
+# NumPy row format: float32, or compact float16 / int8 scanned first and re-ranked exactly
+CHATBOT_NUMPY_DTYPE = os.getenv('CHATBOT_NUMPY_DTYPE', 'float32')
+# Candidates re-ranked per result with a compact dtype (k * factor)
+CHATBOT_NUMPY_RERANK_FACTOR = int(os.getenv('CHATBOT_NUMPY_RERANK_FACTOR', '4'))
+
+# Semantic answer cache: reuse an answer when a similar question (cosine >= threshold)
+# was answered over the same corpus version and retrieved chunks
+CHATBOT_ANSWER_CACHE = os.getenv('CHATBOT_ANSWER_CACHE', 'true').lower() == 'true'
+CHATBOT_ANSWER_CACHE_THRESHOLD = float(os.getenv('CHATBOT_ANSWER_CACHE_THRESHOLD', '0.95'))
+CHATBOT_ANSWER_CACHE_TTL_SECONDS = int(os.getenv('CHATBOT_ANSWER_CACHE_TTL_SECONDS', '86400'))
+CHATBOT_ANSWER_CACHE_MAX_ENTRIES = int(os.getenv('CHATBOT_ANSWER_CACHE_MAX_ENTRIES', '10000'))
+
+# Cache question embeddings and retrieval results (per corpus version) for repeated questions.
+# Set the alias of a shared Django cache (e.g. Redis) to share them across workers.
+CHATBOT_RETRIEVAL_CACHE = os.getenv('CHATBOT_RETRIEVAL_CACHE', 'true').lower() == 'true'
+CHATBOT_RETRIEVAL_CACHE_MAX_ENTRIES = int(os.getenv('CHATBOT_RETRIEVAL_CACHE_MAX_ENTRIES', '10000'))
+CHATBOT_RETRIEVAL_CACHE_ALIAS = os.getenv('CHATBOT_RETRIEVAL_CACHE_ALIAS', '')
+CHATBOT_RETRIEVAL_CACHE_TIMEOUT = int(os.getenv('CHATBOT_RETRIEVAL_CACHE_TIMEOUT', '3600'))
+
+# Max tokens of retrieved context per prompt, counted with this tiktoken encoding
+CHATBOT_CONTEXT_TOKEN_BUDGET = int(os.getenv('CHATBOT_CONTEXT_TOKEN_BUDGET', '3000'))
+CHATBOT_TOKEN_ENCODING = os.getenv('CHATBOT_TOKEN_ENCODING', 'o200k_base')
+
+# Conversation memory: recent turns of the current session sent verbatim (each capped in tokens),
+# older turns folded into a rolling summary in batches by a background thread
+CHATBOT_MEMORY = os.getenv('CHATBOT_MEMORY', 'true').lower() == 'true'
+CHATBOT_MEMORY_TURNS = int(os.getenv('CHATBOT_MEMORY_TURNS', '6'))
+CHATBOT_MEMORY_SESSION_MINUTES = int(os.getenv('CHATBOT_MEMORY_SESSION_MINUTES', '60'))
+CHATBOT_MEMORY_TURN_TOKENS = int(os.getenv('CHATBOT_MEMORY_TURN_TOKENS', '400'))
+CHATBOT_MEMORY_SUMMARY_TOKENS = int(os.getenv('CHATBOT_MEMORY_SUMMARY_TOKENS', '300'))
+CHATBOT_MEMORY_SUMMARY_BATCH = int(os.getenv('CHATBOT_MEMORY_SUMMARY_BATCH', '4'))
+
+# Chats rendered on page load and returned per /chat_history/ page
+CHATBOT_HISTORY_PAGE_SIZE = int(os.getenv('CHATBOT_HISTORY_PAGE_SIZE', '20'))
+
+# Write-behind persistence of Chat rows: queued per process and flushed with bulk_create
+# once the batch fills or after the flush interval, and on shutdown
+CHATBOT_CHAT_WRITE_BEHIND = os.getenv('CHATBOT_CHAT_WRITE_BEHIND', 'false').lower() == 'true'
+CHATBOT_CHAT_WRITE_BATCH_SIZE = int(os.getenv('CHATBOT_CHAT_WRITE_BATCH_SIZE', '100'))
+CHATBOT_CHAT_WRITE_FLUSH_MS = int(os.getenv('CHATBOT_CHAT_WRITE_FLUSH_MS', '500'))
+CHATBOT_CHAT_WRITE_MAX_FAILURES = int(os.getenv('CHATBOT_CHAT_WRITE_MAX_FAILURES', '3'))
+
+# Pre-retrieval router: skip embedding and vector search for small talk and follow-ups
+CHATBOT_ROUTER = os.getenv('CHATBOT_ROUTER', 'true').lower() == 'true'
+
+# LLM gateway: per-process request/token budget (0 = unlimited; the defaults are Groq's free-tier
+# limits for gpt-oss-120b), queue limits before answering 503, the answer cap (max_tokens), share
+# of both budgets that background summaries leave for chat turns, and retries on 429 and 5xx
+CHATBOT_LLM_REQUESTS_PER_MINUTE = float(os.getenv('CHATBOT_LLM_REQUESTS_PER_MINUTE', '30'))
+CHATBOT_LLM_TOKENS_PER_MINUTE = float(os.getenv('CHATBOT_LLM_TOKENS_PER_MINUTE', '8000'))
+CHATBOT_LLM_MAX_QUEUE = int(os.getenv('CHATBOT_LLM_MAX_QUEUE', '64'))
+CHATBOT_LLM_MAX_WAIT_SECONDS = float(os.getenv('CHATBOT_LLM_MAX_WAIT_SECONDS', '30'))
+CHATBOT_LLM_COMPLETION_TOKENS = int(os.getenv('CHATBOT_LLM_COMPLETION_TOKENS', '1024'))
+CHATBOT_LLM_BACKGROUND_HEADROOM = float(os.getenv('CHATBOT_LLM_BACKGROUND_HEADROOM', '0.5'))
+CHATBOT_LLM_MAX_RETRIES = int(os.getenv('CHATBOT_LLM_MAX_RETRIES', '4'))
+
+# Unix socket of the embedding sidecar (manage.py embedding_sidecar); when set, web
+# workers embed through it and leave model loading and ingestion to that one process
+CHATBOT_EMBEDDING_SOCKET = os.getenv('CHATBOT_EMBEDDING_SOCKET', '')
+
+# Prebuilt index snapshots (manage.py build_index): where they are written, and which
+# one workers open their stores from ('current', a version name, or '' for the live stores)
+CHATBOT_INDEX_DIR = os.getenv('CHATBOT_INDEX_DIR', os.path.join(BASE_DIR, 'index_snapshots'))
+CHATBOT_INDEX_SNAPSHOT = os.getenv('CHATBOT_INDEX_SNAPSHOT', '')
+
+# Chunking: 'fast' (single-pass offset splitter) or 'recursive' (LangChain), which give identical
+# chunks; CHATBOT_CHUNK_UNIT 'tokens' sizes chunks in CHATBOT_TOKEN_ENCODING tokens instead of characters
+CHATBOT_SPLITTER = os.getenv('CHATBOT_SPLITTER', 'fast')
+CHATBOT_CHUNK_UNIT = os.getenv('CHATBOT_CHUNK_UNIT', 'chars')
+CHATBOT_CHUNK_TOKENS = int(os.getenv('CHATBOT_CHUNK_TOKENS', '256'))
+CHATBOT_CHUNK_OVERLAP_TOKENS = int(os.getenv('CHATBOT_CHUNK_OVERLAP_TOKENS', '50'))
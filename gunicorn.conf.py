@@ -0,0 +1,13 @@
+# Gunicorn picks this file up automatically from the working directory.
+
+
+def post_worker_init(worker):
+    """Load the LLM client, embedding model and agent once per worker, before it takes traffic"""
+    from chatbot.langgraph import chatbot
+    chatbot.warm_up()
+
+
+def worker_exit(server, worker):
+    """Write out chats still queued by the write-behind writer before the worker goes away"""
+    from chatbot.chat_writer import chat_writer
+    chat_writer.flush()